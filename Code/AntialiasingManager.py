@@ -61,23 +61,27 @@ class AntialiasingManager(DebugObject):
 
         # When jittering is enabled, precompute the jitter offsets
         if self.jitter:
+            self.computeJitterOffsets(self.pipeline.settings.jitterAmount)
 
-            # Compute how big a pixel is on screen
-            aspect = float(Globals.resolution.x) / float(Globals.resolution.y)
-            onePixelShift = Vec2(0.5 / float(Globals.resolution.x), 
-                0.5 / float(Globals.resolution.y) / aspect) * self.pipeline.settings.jitterAmount
+        # Finally register the antialiasing pass
+        self.pipeline.getRenderPassManager().registerPass(self.antialiasingPass)
 
-            # Annoying that Vec2 has no multliply-operator for non-floats
-            multiplyVec2 = lambda a, b: Vec2(a.x*b.x, a.y*b.y)
+    def computeJitterOffsets(self, jitterAmount):
+        """ Computes the jitter offsets for the given jitter amount """
 
-            # Multiply the pixel size with the offsets to compute the final jitter
-            self.jitterOffsets = [
-                multiplyVec2(onePixelShift, Vec2(-0.25,  0.25)),
-                multiplyVec2(onePixelShift, Vec2(0.25, -0.25))
-            ]
+        # Compute how big a pixel is on screen
+        aspect = float(Globals.resolution.x) / float(Globals.resolution.y)
+        onePixelShift = Vec2(0.5 / float(Globals.resolution.x), 
+            0.5 / float(Globals.resolution.y) / aspect) * jitterAmount
 
-        # Finally register the antialiasing pass
-        self.pipeline.getRenderPassManager().registerPass(self.antialiasingPass)
+        # Annoying that Vec2 has no multliply-operator for non-floats
+        multiplyVec2 = lambda a, b: Vec2(a.x*b.x, a.y*b.y)
+
+        # Multiply the pixel size with the offsets to compute the final jitter
+        self.jitterOffsets = [
+            multiplyVec2(onePixelShift, Vec2(-0.25,  0.25)),
+            multiplyVec2(onePixelShift, Vec2(0.25, -0.25))
+        ]
 
     def update(self):
         """ Updates the manager, setting the jitter offsets if enabled """
@@ -1,5 +1,8 @@
 
+from __future__ import print_function
+
 import math
+from array import array
 from panda3d.core import NurbsCurve, Vec3, PTAFloat
 
 
@@ -9,14 +12,29 @@ class PropertyType:
     of this. This class is used to store the min/max values of time of day
     properties, and also convert them from/to 0 .. 1 range. """
 
+    # Amount of floats a value of this type consists of
+    numComponents = 1
+
     def __init__(self, minVal, maxVal):
         """ Constructs a new poperty, setting min and max value """
         self.minVal = minVal
         self.maxVal = maxVal
 
+    def getComponents(self, val):
+        """ Returns the floats of a value as tuple """
+        return (val,)
+
+    def fromComponents(self, components):
+        """ Builds a value from its floats """
+        return components[0]
+
+    def roundValue(self, val):
+        """ Rounds a value for storing it """
+        return round(val, 5)
+
     def asUniform(self, val):
         """ Converts a value from minVal .. maxVal to 0 .. 1 """
-        return (val - self.minVal) // (self.maxVal - self.minVal)
+        return (val - self.minVal) / (self.maxVal - self.minVal)
 
     def fromUniform(self, val):
         """ Converts a value from 0 .. 1 to minVal .. maxVal """
@@ -26,6 +44,10 @@ class PropertyType:
         """ Converts a string to a typed value """
         return val
 
+    def convertToString(self, val):
+        """ Converts a typed value to a string """
+        return str(val)
+
     def getGlslType(self):
         """ Returns the glsl type representation """
         return "float"
@@ -49,48 +71,150 @@ class PropertyTypeFloat(PropertyType):
         return PTAFloat
 
 
+class PropertyTypeVec3(PropertyType):
+
+    """ Vector property, stored as a tuple of 3 floats. The min and max value
+    apply to each component. In text form the components are separated by
+    commas """
+
+    numComponents = 3
+
+    def getComponents(self, val):
+        return tuple(val)
+
+    def fromComponents(self, components):
+        return tuple(components)
+
+    def roundValue(self, val):
+        return tuple(round(i, 5) for i in val)
+
+    def convertString(self, val):
+        parts = [max(self.minVal, min(self.maxVal, float(i))) for i in val.split(",")]
+        if len(parts) == 1:
+            parts = parts * 3
+        if len(parts) != 3:
+            raise ValueError("Expected 3 components: " + val)
+        return tuple(parts)
+
+    def convertToString(self, val):
+        return ",".join(str(i) for i in val)
+
+    def getGlslType(self):
+        return "vec3"
+
+    def getPTAType(self):
+        return PTAFloat
+
+
+class PropertyTypeColor(PropertyTypeVec3):
+
+    """ Color property, a vec3 which can also be given as hex color in the
+    form #rrggbb. See PropertyTypeVec3 """
+
+    def convertString(self, val):
+        if val.startswith("#") and len(val) == 7:
+            return tuple(int(val[i:i + 2], 16) / 255.0 for i in range(1, 7, 2))
+        return PropertyTypeVec3.convertString(self, val)
+
+
 class DayProperty:
 
     """ Stores a time of day property, including name, description, type,
-    min/max and default value """
-
-    def __init__(self, name, typeName, minVal, maxVal, defaultVal, description):
+    min/max and default value. The values are control points, evenly spread
+    over the day. Each component gets its own curve, and the curves are baked
+    into a lookup table when recomputing, so evaluating the property does not
+    have to evaluate the curves """
+
+    # Amount of samples of the lookup table. The day is periodic, so sample i
+    # is at i / TableSize of the day, and the last sample interpolates to the
+    # first one
+    TableSize = 512
+
+    # Amount of control points wrapped around on each side of the curves
+    CurvePadding = 3
+
+    Types = {
+        "float": PropertyTypeFloat,
+        "vec3": PropertyTypeVec3,
+        "color": PropertyTypeColor,
+    }
+
+    def __init__(self, name, typeName, minVal, maxVal, defaultVal, description, numValues=8):
         self.name = name
-        if typeName == "float":
-            self.propType = PropertyTypeFloat(minVal, maxVal)
+        if typeName in self.Types:
+            self.propType = self.Types[typeName](minVal, maxVal)
         else:
             print("Unrecognized Type:", typeName)
 
         self.description = description.strip()
         self.defaultValue = defaultVal
-        self.values = [self.defaultValue for i in range(8)]
-        self.curve = NurbsCurve()
-        self.curve.setOrder(3)
-        self.pta = self.propType.getPTAType().emptyArray(1)
-
-    def getPTA(self):
-        return self.pta       
+        self.values = [self.defaultValue for i in range(numValues)]
+        self.numComponents = self.propType.numComponents
+        self.curves = []
+        for i in range(self.numComponents):
+            curve = NurbsCurve()
+            curve.setOrder(3)
+            self.curves.append(curve)
+        self.table = array("f", self.propType.getComponents(self.defaultValue) * self.TableSize)
 
     def setValue(self, index, val):
-        self.values[index] = round(val, 5)
+        self.values[index] = self.propType.roundValue(val)
 
     def recompute(self):
-        """ Recomputes the NURBS Curve for this property """
-        self.curve.removeAllCvs()
+        """ Recomputes the NURBS Curves for this property, and bakes them into
+        the lookup table """
+        self.recomputeCurves()
+        self._bakeTable()
+
+    def recomputeCurves(self):
+        """ Recomputes the NURBS Curves, without baking the lookup table """
+        numValues = len(self.values)
+        components = [self.propType.getComponents(i) for i in self.values]
 
         # Pad, to make 00:00 match with 24:00
         # Thanks to rdb for finding a bug here
-        padIndices = [5, 6, 7, 0, 1, 2, 3, 4, 5, 6, 7, 0, 1, 2]
-
-        paddedValues = [self.values[i] for i in padIndices]
-
-        for index, val in enumerate(paddedValues):
-            self.curve.appendCv(Vec3(index, val, 0.0))
-
-        self.curve.recompute()
-
-    def getInterpolatedValue(self, pos):
+        padIndices = [(i - self.CurvePadding) % numValues
+                      for i in range(numValues + 2 * self.CurvePadding)]
+
+        for component, curve in enumerate(self.curves):
+            curve.removeAllCvs()
+            for index, valueIndex in enumerate(padIndices):
+                curve.appendCv(Vec3(index, components[valueIndex][component], 0.0))
+            curve.recompute()
+
+    def _bakeTable(self):
+        """ Internal method to sample the curves into the lookup table. The
+        table is modified in place, so references to it stay valid """
+        numComponents = self.numComponents
+        for index in range(self.TableSize):
+            pos = float(index) / self.TableSize
+            for component in range(numComponents):
+                self.table[index * numComponents + component] = self.evaluateCurve(pos, component)
+
+    def getTable(self):
+        """ Returns the baked lookup table of this property. The components of
+        each sample are stored next to each other """
+        return self.table
+
+    def evaluateCurve(self, pos, component=0):
+        """ Evaluates the curve of a component at the given time of day, this
+        is slow. Use getInterpolatedValue instead """
         tmp = Vec3(0)
-        self.curve.getPoint(pos * 8.0 + 2.5, tmp)
+        self.curves[component].getPoint(pos * len(self.values) + self.CurvePadding - 0.5, tmp)
         return tmp.y
 
+    def getInterpolatedValue(self, pos):
+        """ Returns the value at the given time of day, interpolated from the
+        lookup table """
+        position = (pos % 1.0) * self.TableSize
+        index = int(position)
+        factor = position - index
+        numComponents = self.numComponents
+        start = index * numComponents
+        end = ((index + 1) % self.TableSize) * numComponents
+
+        result = []
+        for component in range(numComponents):
+            value = self.table[start + component]
+            result.append(value + (self.table[end + component] - value) * factor)
+        return self.propType.fromComponents(result)
@@ -87,6 +87,9 @@ class BugReporter(DebugObject):
         ConfigVariableManager.getGlobalPtr().writePrcVariables(handle)
         handle.close()
 
+        # Write the memory usage
+        MemoryMonitor.exportJSON(join(reportDir, "memory.json"))
+
         # Write lights and shadow sources
         with open(join(reportDir, "lights.log"), "w") as handle:
             pp = pprint.PrettyPrinter(indent=4, stream=handle)
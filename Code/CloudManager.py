@@ -20,14 +20,11 @@ class CloudManager(DebugObject):
         """ Creates the passes """
         self.cloudStartHeight = 900.0
         self.cloudEndHeight = 3300.0
-        self.cloudResolution = 768
+        self.cloudResolution = self.pipeline.settings.cloudResolution
         self.cloudResolutionH = 128
 
         self.voxelGrid = Texture("CloudVoxelGrid")
-        self.voxelGrid.setup3dTexture(self.cloudResolution,
-                                      self.cloudResolution,
-                                      self.cloudResolutionH,
-                                      Texture.TFloat, Texture.FR16)
+        self._setupVoxelGrid()
 
         self.voxelGrid.setWrapU(Texture.WMRepeat)
         self.voxelGrid.setWrapV(Texture.WMRepeat)
@@ -39,7 +36,6 @@ class CloudManager(DebugObject):
         self.cloudNoise.setWrapV(Texture.WMRepeat)
         self.cloudNoise.setWrapW(Texture.WMRepeat)
 
-        MemoryMonitor.addTexture("CloudVoxelGrid", self.voxelGrid)
         MemoryMonitor.addTexture("CloudNoise", self.cloudNoise)
 
         self._createInitialGrid()
@@ -52,6 +48,27 @@ class CloudManager(DebugObject):
         self.pipeline.getRenderPassManager().registerStaticVariable("cloudNoise", self.cloudNoise)
         self.pipeline.getRenderPassManager().registerDefine("CLOUDS_ENABLED", 1)
 
+    def _setupVoxelGrid(self):
+        """ Internal method to (re)create the voxel grid with the current
+        resolution """
+        self.voxelGrid.setup3dTexture(self.cloudResolution,
+                                      self.cloudResolution,
+                                      self.cloudResolutionH,
+                                      Texture.TFloat, Texture.FR16)
+        MemoryMonitor.addTexture("CloudVoxelGrid", self.voxelGrid)
+
+    def setResolution(self, resolution):
+        """ Changes the horizontal resolution of the voxel grid, which has to
+        be a multiple of 8. The grid gets generated again """
+        if resolution % 8 != 0:
+            self.error("Cloud resolution has to be a multiple of 8:", resolution)
+            return False
+
+        self.cloudResolution = resolution
+        self._setupVoxelGrid()
+        self._createInitialGrid()
+        return True
+
     def update(self):
         """ Updates the clouds """
 
@@ -1,9 +1,10 @@
-import time
 from os.path import join
-from panda3d.core import Shader
+from panda3d.core import Shader, NodePath, WeakNodePath
 from direct.stdpy.file import open
 
 from Code.DebugObject import DebugObject
+from Code.ShaderIncludeResolver import ShaderIncludeResolver
+from Code.ShaderFileCache import ShaderFileCache
 
 
 class Effect(DebugObject):
@@ -26,40 +27,163 @@ class Effect(DebugObject):
             "castGI": True,
             "mainPass": True
         }
-        self.assignments = {"Default": [], "Shadows": [], "Voxelize": [], "EarlyZ": []}
-
-    def load(self, filename):
-        """ Loads the effect from a given filename """
+        self.assignments = {"Default": {}, "Shadows": {}, "Voxelize": {}, "EarlyZ": {}}
+        self.tagStates = {"Default": {}, "Shadows": {}, "Voxelize": {}, "EarlyZ": {}}
+        self.refCount = 0
+        self.shaderObjs = {"Default": None, "Shadows": None, "Voxelize": None, "EarlyZ": None}
+        self.sourceCache = None
+        self.includeResolver = None
+        self.writeDebugFiles = False
+
+    def setWriteDebugFiles(self, enabled):
+        """ Sets whether the generated shader code should be written to the
+        write path, after resolving all includes. The shaders are always
+        compiled from memory, this is only useful to inspect the code """
+        self.writeDebugFiles = enabled
+
+    def load(self, filename, sourceCache=None, includeResolver=None):
+        """ Loads the effect from a given filename. When a EffectSourceCache is
+        passed, the generated shader sources are taken from the cache if
+        possible, and stored in it otherwise. The includeResolver is used to
+        resolve the includes of the generated code, passing a shared resolver
+        avoids reading the same includes for every effect """
         self.debug("Load effect from", filename)
 
+        if includeResolver is None:
+            includeResolver = ShaderIncludeResolver()
+
+        self.sourceCache = sourceCache
+        self.includeResolver = includeResolver
+        content = self._prepare(filename)
+
+        if sourceCache is None:
+            self._parse(content)
+            self._createShaderObjects()
+            return
+
+        cacheKey = sourceCache.computeKey("".join(content), self.getSerializedSettings())
+        cachedParts = sourceCache.lookup(cacheKey)
+
+        if cachedParts is None:
+            self._parse(content)
+            sourceCache.store(cacheKey, self.name, self.shaderParts, self.templates)
+        else:
+            self.debug("Using cached shader sources")
+            self.shaderParts.update(cachedParts)
+            self.templates = set(sourceCache.getTemplates(cacheKey))
+
+        self._createShaderObjects()
+
+    def generateSources(self, filename):
+        """ Parses the effect and generates the shader sources, without creating
+        the shaders. This is used to fill the EffectSourceCache offline. The
+        sources are stored in shaderParts, and the templates in templates.
+        Returns the content of the effect file """
+        content = self._prepare(filename)
+        self._parse(content)
+        return "".join(content)
+
+    def _prepare(self, filename):
+        """ Internal method to reset the effect before loading it, returns the
+        lines of the effect file """
         self.defines = {}
         self.source = filename
+        self.templates = set()
         self.shaderParts = {"Default": {}, "Shadows": {}, "Voxelize": {}, "EarlyZ": {}}
-        self.shaderObjs = {"Default": None, "Shadows": None, "Voxelize": None, "EarlyZ": None}
+        self.stageDependencies = {"Default": set(), "Shadows": set(), "Voxelize": set(), "EarlyZ": set()}
         self._handleProperties()
         self.name = filename.replace("\\", "/").split("/")[-1].split(".")[0]
         self._rename("Effect-" + self.name)
 
         with open(filename, "r") as handle:
-            content = handle.readlines()
-
-        self._parse(content)
-        self._createShaderObjects()
+            return handle.readlines()
 
     def assignNode(self, node, mode, sort=0):
         """ Adds the node to the assigned nodes of the mode. This is used when
-        reloading shaders """
-        if node not in self.assignments[mode]:
-            self.assignments[mode].append((node, sort))
+        reloading shaders. Only a weak reference to the node is kept, so the
+        effect does not keep removed nodes alive """
+        if node.getKey() not in self.assignments[mode]:
+            self.refCount += 1
+        self.assignments[mode][node.getKey()] = (WeakNodePath(node), sort)
         node.setShader(self.getShader(mode), sort)
 
-    def reload(self):
-        """ Reloads the effect from disk """
-
-        self.load(self.source)
+    def unassignNode(self, node, mode="Default"):
+        """ Removes the node from the assigned nodes of the mode. The shader
+        stays set on the node. This should be called before removing a node,
+        so the EffectLoader can remove the effect once it is unused """
+        if self.assignments[mode].pop(node.getKey(), None) is not None:
+            self.refCount -= 1
+
+    def _getAssignedNodes(self, mode):
+        """ Internal method to return a list of (node, sort) tuples of all
+        assigned nodes of a mode which still exist. Deleted nodes get removed
+        from the assignments """
+        nodes = []
+        for key, (weakNode, sort) in list(self.assignments[mode].items()):
+            if weakNode.wasDeleted():
+                del self.assignments[mode][key]
+                self.refCount -= 1
+            else:
+                nodes.append((weakNode.getNodePath(), sort))
+        return nodes
+
+    def getRefCount(self):
+        """ Returns how many nodes the effect is assigned to. Nodes which got
+        removed without being unassigned are counted until the shaders of
+        the effect are reloaded """
+        return self.refCount
+
+    def assignTagState(self, mode, stateName, registerFunc, sort=0):
+        """ Creates a state with the shader of the given mode, and registers it
+        as tag state by calling registerFunc(stateName, state). The state gets
+        registered again when the shader of the mode is reloaded. As the
+        state only depends on the effect, it is only registered once """
+        if self.tagStates[mode].get((stateName, registerFunc), None) == sort:
+            return
+        self.tagStates[mode][(stateName, registerFunc)] = sort
+        self._registerTagState(mode, stateName, registerFunc, sort)
+
+    def _registerTagState(self, mode, stateName, registerFunc, sort):
+        """ Internal method to create and register a tag state """
+        initialState = NodePath("EffectInitial" + mode + "State" + str(self.getEffectID()))
+        initialState.setShader(self.getShader(mode), sort)
+        registerFunc(stateName, initialState)
+
+    def _applyShaders(self, stages):
+        """ Internal method to set the shaders of the given stages on all
+        assigned nodes and tag states """
+        for stage in stages:
+            if not self.hasShader(stage):
+                continue
+            for node, sort in self._getAssignedNodes(stage):
+                node.setShader(self.getShader(stage), sort)
+            for (stateName, registerFunc), sort in self.tagStates[stage].items():
+                self._registerTagState(stage, stateName, registerFunc, sort)
+
+    def getDependencies(self):
+        """ Returns the set of all files the effect depends on: The effect file,
+        the templates, and all includes """
+        dependencies = set([self.source]) | self.templates
+        for stageDependencies in self.stageDependencies.values():
+            dependencies |= stageDependencies
+        return dependencies
+
+    def reload(self, changedFiles=None):
+        """ Reloads the effect from disk. When changedFiles is given, only the
+        stages depending on these files are rebuilt. When the effect file or a
+        template changed, the whole effect gets reloaded. Returns the list of
+        stages which were rebuilt """
+
+        if changedFiles is None or (set(changedFiles) & (set([self.source]) | self.templates)):
+            self.load(self.source, self.sourceCache, self.includeResolver)
+            stages = list(self.shaderObjs.keys())
+        else:
+            stages = [stage for stage, dependencies in self.stageDependencies.items()
+                      if dependencies & set(changedFiles)]
+            self._createShaderObjects(stages)
 
-        for node, sort in self.assignments["Default"]:
-            node.setShader(self.getShader("Default"), sort)
+        self._applyShaders(stages)
+        return stages
 
     def getSerializedSettings(self, properties=None):
         """ Serializes the effects properties to a string """
@@ -96,18 +220,46 @@ class Effect(DebugObject):
         for that stage exists """
         return self.shaderObjs[stage]
 
-    def _createShaderObjects(self):
-        """ Creates the shaders from the parsed shader code """
+    def _createShaderObjects(self, stages=None):
+        """ Resolves the includes of the generated shader code, and creates
+        the shaders from it. When stages is given, only the shaders of these
+        stages are created. When the includes of a program can not be
+        resolved, the stage keeps its previous shader """
         for stage, parts in self.shaderParts.items():
+            if stages is not None and stage not in stages:
+                continue
+
             if len(parts) < 1:
                 # No program defined
+                self.shaderObjs[stage] = None
                 continue
 
+            dependencies = set()
+            failed = False
+
             programs = {"vertex": "", "fragment": "", "geometry": "", 
                 "tesscontrol": "", "tesseval": ""}
             for progName, progCode in parts.items():
-                fname = self._createShaderFile(stage, progName, progCode)
-                programs[progName] = fname
+                resolved = self.includeResolver.resolve(progCode, self.source)
+                if resolved is None:
+                    self.error("Failed to resolve includes of", stage + "." + progName)
+                    failed = True
+                    continue
+
+                programs[progName] = resolved[0]
+                dependencies.update(resolved[1][1:])
+
+                if self.writeDebugFiles:
+                    self._writeDebugFile(stage, progName, resolved)
+
+            if failed:
+                # Keep watching the previous includes too, so the stage gets
+                # rebuilt once the includes are fixed
+                self.stageDependencies[stage] |= dependencies
+                self.error("Could not create stage", stage + ", keeping the previous shader")
+                continue
+
+            self.stageDependencies[stage] = dependencies
 
             if programs["vertex"] == "":
 
@@ -122,23 +274,26 @@ class Effect(DebugObject):
                 #     else:
                 #         self.error("Stage " + stage + " has no vertex program, and no default stage is available!")
 
+                self.shaderObjs[stage] = None
                 continue
 
             params = [programs["vertex"], programs["fragment"], programs["geometry"], 
                 programs["tesscontrol"], programs["tesseval"]]
-            shaderObj = Shader.load(Shader.SLGLSL, *params)
+            shaderObj = Shader.make(Shader.SLGLSL, *params)
             self.shaderObjs[stage] = shaderObj
 
-    def _createShaderFile(self, stage, part, code):
-        """ Writes the shader code to a temporary file and returns the path to that
-        file """
+    def _writeDebugFile(self, stage, part, resolved):
+        """ Writes the resolved shader code to the write path, together with
+        the file table to map the #line directives back to the files """
 
         filename = "PipelineTemp/$$-Effect" + str(self.getEffectID()) + "_" + self.name + "_" + stage + "_" + part + "_" + self.getSerializedSettings() + ".tmp.glsl"
+        code, fileTable = resolved
 
         with open(filename, "w") as handle:
             handle.write(code)
-
-        return filename
+            handle.write("\n\n// Source files:\n")
+            for index, sourceFile in enumerate(fileTable):
+                handle.write("// " + str(index) + ": " + sourceFile + "\n")
 
     def _getIdentationLevel(self, line):
         """ Counts the amount of spaces at the beginning of a line and returns
@@ -194,18 +349,10 @@ class Effect(DebugObject):
         return blocks
 
     def _parseTemplate(self, filename):
-        """ Parses a shader template file and returns its content """
-
-        with open(filename, "r") as handle:
-            content = handle.readlines()
-
-        parsedLines = []
-
-        for line in content:
-            line = line.rstrip()
-            parsedLines.append(line)
-
-        return parsedLines
+        """ Parses a shader template file and returns its content. The
+        templates are shared by most effects, so they are taken from the
+        ShaderFileCache """
+        return ShaderFileCache.getLines(filename)
 
     def _createShaderCode(self, parameters, inserts, stage, program):
         """ Creates the shader code from a given set of parameters and inserts """
@@ -259,6 +406,7 @@ class Effect(DebugObject):
             templateFile = join("ShaderMount/", templateFile.strip('"'))
 
         templateContent = self._parseTemplate(templateFile)
+        self.templates.add(templateFile)
 
         builtShader = ["// Autogenerated, do not edit"]
 
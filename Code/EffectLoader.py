@@ -1,15 +1,38 @@
 
+import atexit
+import json
+
+from collections import OrderedDict
+
+from direct.stdpy.file import open, isfile
+
 from Code.Effect import Effect
+from Code.EffectSourceCache import EffectSourceCache
+from Code.ShaderIncludeResolver import ShaderIncludeResolver
 
 from Code.DebugObject import DebugObject
 
 
 class EffectLoader(DebugObject):
 
+    # All effect permutations which were loaded get stored in this file, so
+    # the effect precompiler (Toolkit/EffectPrecompiler) can generate them
+    # offline
+    PermutationFile = "PipelineTemp/EffectPermutations.json"
+
     def __init__(self, pipeline):
         DebugObject.__init__(self, "EffectLoader")
-        self.effectCache = {}
+        self.effectCache = OrderedDict()
+        self.maxCachedEffects = pipeline.settings.maxCachedEffects
+        self.permutations = {}
+        self._permutationsChanged = False
+        self._loadPermutations()
+        atexit.register(self.savePermutations)
         self.pipeline = pipeline
+        self.sourceCache = EffectSourceCache(
+            pipeline.settings.effectCacheSize * 1024 * 1024)
+        self.includeResolver = ShaderIncludeResolver()
+        self.shaderWatcher = pipeline.shaderWatcher
 
     def loadEffect(self, filename, effectSettings=None):
         """ Loads an effect from a given file with the given effect settings """
@@ -19,17 +42,103 @@ class EffectLoader(DebugObject):
         cache_name = filename + "#" + effect.getSerializedSettings(effectSettings)
         if cache_name in self.effectCache:
             del effect
+            # Move the effect to the end, to mark it as recently used
+            self.effectCache[cache_name] = self.effectCache.pop(cache_name)
             return self.effectCache[cache_name]
 
         if effectSettings is not None:
             effect.setSettings(effectSettings)
 
-        effect.load(filename)
+        effect.setWriteDebugFiles(self.pipeline.settings.writeEffectShaders)
+        effect.load(filename, self.sourceCache, self.includeResolver)
         self.effectCache[cache_name] = effect
+        self._watchEffect(effect)
+        self._evictUnusedEffects()
+
+        if cache_name not in self.permutations:
+            self.permutations[cache_name] = {"effect": filename, "settings": dict(effect.properties)}
+            self._permutationsChanged = True
 
         return effect
 
+    def _loadPermutations(self):
+        """ Internal method to read the permutations recorded by previous runs """
+        if not isfile(self.PermutationFile):
+            return
+
+        try:
+            with open(self.PermutationFile, "r") as handle:
+                permutations = json.loads(handle.read())
+        except Exception:
+            self.warn("Could not read recorded effect permutations")
+            return
+
+        for permutation in permutations:
+            effect = Effect()
+            key = permutation["effect"] + "#" + effect.getSerializedSettings(permutation["settings"])
+            self.permutations[key] = permutation
+
+    def savePermutations(self):
+        """ Writes all effect permutations loaded so far (including the ones
+        of previous runs) to the permutation file. This gets called
+        automatically when the application exits """
+        if not self._permutationsChanged:
+            return
+
+        try:
+            with open(self.PermutationFile, "w") as handle:
+                handle.write(json.dumps(list(self.permutations.values()), indent=4))
+        except Exception:
+            self.warn("Could not write recorded effect permutations")
+            return
+
+        self._permutationsChanged = False
+
+    def _evictUnusedEffects(self):
+        """ Internal method to remove the least recently used effects which are
+        not assigned to any node anymore, until no more than maxCachedEffects
+        are cached. Effects which are still in use are never removed, and
+        neither is the most recently loaded effect, as it is about to be
+        assigned """
+        if len(self.effectCache) <= self.maxCachedEffects:
+            return
+
+        for cache_name in list(self.effectCache.keys())[:-1]:
+            if len(self.effectCache) <= self.maxCachedEffects:
+                break
+
+            effect = self.effectCache[cache_name]
+            if effect.getRefCount() > 0:
+                continue
+
+            self.debug("Removing unused effect", cache_name)
+            del self.effectCache[cache_name]
+
+            if self.shaderWatcher is not None:
+                self.shaderWatcher.unwatch(effect)
+
+    def getNumCachedEffects(self):
+        """ Returns how many effect permutations are cached """
+        return len(self.effectCache)
+
+    def _watchEffect(self, effect):
+        """ Internal method to watch the files of an effect, when hot reloading
+        is enabled """
+        if self.shaderWatcher is None:
+            return
+
+        self.shaderWatcher.watch(effect, effect.getDependencies(),
+            lambda changedFiles: self._onEffectFilesChanged(effect, changedFiles))
+
+    def _onEffectFilesChanged(self, effect, changedFiles):
+        """ Internal method which gets called by the shader watcher when a file
+        used by an effect changed. Only the affected stages get rebuilt """
+        stages = effect.reload(changedFiles)
+        self.debug("Reloaded", effect.name, "stages:", ", ".join(stages))
+        self._watchEffect(effect)
+
     def reloadEffects(self):
         """ Reloads all effects """
         for effect in self.effectCache.values():
             effect.reload()
+            self._watchEffect(effect)
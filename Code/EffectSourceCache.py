@@ -0,0 +1,211 @@
+import atexit
+import hashlib
+import json
+import time
+
+from panda3d.core import VirtualFileSystem, Filename
+from direct.stdpy.file import open, isfile
+
+from Code.DebugObject import DebugObject
+
+
+class EffectSourceCache(DebugObject):
+
+    """ This class stores the shader sources generated from effects on disk, so
+    they don't have to be generated again on the next start. The entries are
+    content addressed: the key is a hash of the effect file content and the
+    effect settings (which determine the defines). The templates used to
+    generate the sources are stored with their timestamps, and an entry gets
+    regenerated as soon as one of them changed. Includes are resolved by panda
+    when loading the shader, so they are not part of the key.
+
+    The cache is stored in the write path (PipelineTemp/), and an index file
+    keeps track of the size and the last usage of each entry. When the cache
+    grows bigger than maxSize, the least recently used entries get removed.
+    The index is written when the application exits, or when calling save(). """
+
+    # Increase this whenever the code generation changes, to invalidate all
+    # existing entries
+    Version = 1
+
+    IndexFile = "PipelineTemp/EffectCache.index"
+
+    def __init__(self, maxSize=64 * 1024 * 1024):
+        """ Creates the cache, maxSize is the maximum size of all cached files
+        in bytes """
+        DebugObject.__init__(self, "EffectSourceCache")
+        self.maxSize = maxSize
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._vfs = VirtualFileSystem.getGlobalPtr()
+        self._loadIndex()
+        atexit.register(self.save)
+
+    def _loadIndex(self):
+        """ Internal method to read the index file """
+        if not isfile(self.IndexFile):
+            return
+
+        try:
+            with open(self.IndexFile, "r") as handle:
+                index = json.loads(handle.read())
+        except Exception:
+            self.warn("Could not read effect cache index, starting with an empty cache")
+            return
+
+        if index.get("version", None) != self.Version:
+            self.debug("Effect cache version changed, discarding old entries")
+            self.entries = index.get("entries", {})
+            self._evict(0)
+            return
+
+        self.entries = index.get("entries", {})
+
+        # The maximum size might have been lowered since the last start
+        self._evict(self.maxSize)
+
+    def save(self):
+        """ Writes the index file, if it changed. This gets called automatically
+        when the application exits """
+        if not self._dirty:
+            return
+
+        try:
+            with open(self.IndexFile, "w") as handle:
+                handle.write(json.dumps({"version": self.Version, "entries": self.entries}))
+        except Exception:
+            self.warn("Could not write effect cache index")
+            return
+
+        self._dirty = False
+
+    def computeKey(self, effectContent, serializedSettings):
+        """ Computes the cache key for an effect, given the content of the
+        effect file and the serialized effect settings """
+        hasher = hashlib.sha1()
+        hasher.update(str(self.Version).encode("utf-8"))
+        hasher.update(serializedSettings.encode("utf-8"))
+        hasher.update(effectContent.encode("utf-8"))
+        return hasher.hexdigest()
+
+    def _getTimestamp(self, filename):
+        """ Internal method to get the modification time of a file, or -1 if
+        the file does not exist """
+        vfile = self._vfs.getFile(Filename(filename), True)
+        if vfile is None:
+            return -1
+        return vfile.getTimestamp()
+
+    def lookup(self, key):
+        """ Returns a dictionary of stage -> program -> code of the cached
+        sources, or None if there is no valid entry for the key """
+        entry = self.entries.get(key, None)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        # Check if any template changed, or a generated file got deleted
+        for filename, timestamp in entry["templates"].items():
+            if self._getTimestamp(filename) != timestamp:
+                self.misses += 1
+                return None
+
+        shaderParts = {}
+        for stage, programs in entry["files"].items():
+            shaderParts[stage] = {}
+            for program, filename in programs.items():
+                if not isfile(filename):
+                    self.misses += 1
+                    return None
+
+                with open(filename, "r") as handle:
+                    shaderParts[stage][program] = handle.read()
+
+        entry["lastUsed"] = time.time()
+        self._dirty = True
+        self.hits += 1
+        return shaderParts
+
+    def getTemplates(self, key):
+        """ Returns the list of templates the entry with the given key was
+        generated from """
+        if key not in self.entries:
+            return []
+        return list(self.entries[key]["templates"].keys())
+
+    def store(self, key, name, shaderParts, templates):
+        """ Writes the generated sources to the cache. shaderParts should be a
+        dictionary of stage -> program -> code, and templates a list of all
+        template files used to generate the code. Returns whether the sources
+        could be written """
+        files = {}
+        size = 0
+
+        for stage, programs in shaderParts.items():
+            files[stage] = {}
+            for program, code in programs.items():
+                filename = "PipelineTemp/EffectCache-" + key[:16] + "-" + name + \
+                    "_" + stage + "_" + program + ".glsl"
+
+                try:
+                    with open(filename, "w") as handle:
+                        handle.write(code)
+                except IOError:
+                    self.warn("Could not write effect cache file", filename)
+                    return False
+
+                files[stage][program] = filename
+                size += len(code)
+
+        templateTimestamps = {}
+        for filename in templates:
+            templateTimestamps[filename] = self._getTimestamp(filename)
+
+        self.entries[key] = {
+            "files": files,
+            "templates": templateTimestamps,
+            "size": size,
+            "lastUsed": time.time(),
+        }
+
+        self._evict(self.maxSize, keep=key)
+        self._dirty = True
+        return True
+
+    def _evict(self, maxSize, keep=None):
+        """ Internal method to remove the least recently used entries until the
+        cache is not bigger than maxSize. The entry with the key keep is never
+        removed """
+        totalSize = sum(entry["size"] for entry in self.entries.values())
+
+        if totalSize <= maxSize:
+            return
+
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["lastUsed"]):
+            if totalSize <= maxSize:
+                break
+
+            if key == keep:
+                continue
+
+            entry = self.entries.pop(key)
+            totalSize -= entry["size"]
+
+            for programs in entry["files"].values():
+                for filename in programs.values():
+                    self._vfs.deleteFile(Filename(filename))
+
+        self._dirty = True
+
+    def getStats(self):
+        """ Returns a dictionary containing the amount of entries, their total
+        size in bytes, and the hits and misses since the start """
+        return {
+            "entries": len(self.entries),
+            "size": sum(entry["size"] for entry in self.entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
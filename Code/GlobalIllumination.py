@@ -55,6 +55,9 @@ class GlobalIllumination(DebugObject):
 
     QualityLevels = ["Low", "Medium", "High", "Ultra"]
 
+    # Voxel grid resolution of each quality level
+    GridResolutions = [32, 64, 128, 192]
+
     def __init__(self, pipeline):
         DebugObject.__init__(self, "GlobalIllumnination")
         self.pipeline = pipeline
@@ -70,7 +73,7 @@ class GlobalIllumination(DebugObject):
         self.voxelGridSize = self.pipeline.settings.giVoxelGridSize
 
         # Grid resolution in pixels
-        self.voxelGridResolution = [32, 64, 128, 192][self.qualityLevelIndex]
+        self.voxelGridResolution = self.GridResolutions[self.qualityLevelIndex]
 
         # Has to be a multiple of 2
         self.distributionSteps = [16, 30, 60, 90][self.qualityLevelIndex]
@@ -82,6 +85,8 @@ class GlobalIllumination(DebugObject):
 
         # Create the task manager
         self.taskManager = DistributedTaskManager()
+        self.updateInterval = 1
+        self.updateCounter = 0
 
         self.gridPosLive = PTALVecBase3f.emptyArray(1)
         self.gridPosTemp = PTALVecBase3f.emptyArray(1)
@@ -176,7 +181,17 @@ class GlobalIllumination(DebugObject):
         # for target in self.mipmapTargets:
         # target.setActive(False)
 
-        self.taskManager.process()
+        # When the update interval is raised, the gi steps only run every
+        # n-th frame, the last grid stays in use meanwhile
+        self.updateCounter = (self.updateCounter + 1) % self.updateInterval
+        if self.updateCounter == 0:
+            self.taskManager.process()
+
+    def setUpdateInterval(self, interval):
+        """ Sets every how many frames the gi steps are processed. Higher
+        values make the gi react slower to changes, but are faster """
+        self.updateInterval = max(1, interval)
+        self.updateCounter = 0
 
     def disableTargets(self):
         """ Disables all active targets """
@@ -1,14 +1,28 @@
 import os
 
-from panda3d.core import Texture, PNMImage, SamplerState
+from array import array
+from bisect import bisect_right
+
+from panda3d.core import Texture, SamplerState
 from direct.stdpy.file import open, listdir
 
 from Code.DebugObject import DebugObject
+from Code.IESProfileCache import IESProfileCache
 
 
 class IESLoader(DebugObject):
     """ This class manages the loading of IES Profiles and combining them into
-    a texture so they can be used in a shader """
+    a texture so they can be used in a shader.
+
+    The profiles are loaded lazily: loadIESProfiles only registers the files,
+    and each profile gets loaded when it is first requested with
+    getIESProfileIndexByName, e.g. when a light using it gets rendered. The
+    baked tables are stored in an IESProfileCache, so each file only has to
+    be parsed once.
+
+    Each profile is stored as one layer of a texture array, with the vertical
+    angle on the x axis and the horizontal angle on the y axis, so asymmetric
+    profiles are preserved. """
 
     # All supported IES Profile versions
     IESVersionTable = {
@@ -23,95 +37,213 @@ class IESLoader(DebugObject):
         "ERCO Leuchten GmbH": 2003,
     }
 
-    # Controls the size of the precomputed ies tables. Bigger values mean more
-    # precision but also more storage required
-    IESTableResolution = 256
+    # Amount of layers the texture array has initially, it grows when more
+    # profiles get loaded, up to MaxProfiles
+    InitialProfiles = 8
+    MaxProfiles = 2048
 
-    def __init__(self):
-        """ Creates a new IES Loader """
+    def __init__(self, resolution=256, horizontalResolution=32):
+        """ Creates a new IES Loader. Each profile gets baked into a table of
+        resolution vertical by horizontalResolution horizontal samples. Bigger
+        values mean more precision but also more storage required """
         DebugObject.__init__(self, "IESLoader")
+        self.resolution = resolution
+        self.horizontalResolution = horizontalResolution
+        self.layerSize = resolution * horizontalResolution * 4
+
         self.storage = Texture("IESProfiles")
-        self.storage.setup2dTextureArray(self.IESTableResolution, 1, 64, Texture.TFloat, Texture.FRgba16)
+        self.numLayers = 0
+        self._setupStorage(self.InitialProfiles)
+
+        # Copy of all loaded tables, which gets uploaded in one piece
+        self.data = array("f")
+        self._dirty = True
+
+        self.profileNames = []
+        self.profileFiles = {}
+        self.cache = IESProfileCache(resolution, horizontalResolution)
+
+        # Interpolation weights, they only depend on the size of the data, so
+        # they are shared between all profiles
+        self.weightCache = {}
+
+    def _setupStorage(self, numLayers):
+        """ Internal method to (re)create the texture array with the given
+        amount of layers """
+        self.numLayers = numLayers
+        self.storage.setup2dTextureArray(self.resolution, self.horizontalResolution,
+                                         numLayers, Texture.TFloat, Texture.FRgba16)
         self.storage.setMinfilter(SamplerState.FTLinear)
         self.storage.setMagfilter(SamplerState.FTLinear)
         self.storage.setWrapU(SamplerState.WMClamp)
-        self.storage.setWrapV(SamplerState.WMClamp)
+        self.storage.setWrapV(SamplerState.WMRepeat)
         self.storage.setWrapW(SamplerState.WMClamp)
 
-        self.profileNames = []
-
     def getIESProfileStorageTex(self):
         """ Returns the texture array where all ies profiles are stored in """
         return self.storage
 
     def getIESProfileIndexByName(self, name):
-        """ Returns the ies profile index if loaded so far, or -1 if no ies
-        profile with that name exists so far """
+        """ Returns the ies profile index, loading the profile if it was not
+        used so far. Returns -1 if no ies profile with that name exists """
         if name in self.profileNames:
             return self.profileNames.index(name)
+
+        if name in self.profileFiles and self._loadIESProfile(name, self.profileFiles[name]):
+            return self.profileNames.index(name)
+
         return -1
 
     def loadIESProfiles(self, directory):
-        """ Loads all ies profiles from a given directory """
-        self.debug("Loading IES Profiles from", directory)
+        """ Registers all ies profiles from a given directory. The profiles get
+        loaded when they are used first """
+        self.debug("Registering IES Profiles from", directory)
 
         files = listdir(directory)
 
         for entry in files:
             if entry.lower().endswith(".ies"):
-                combinedPath = os.path.join(directory, entry)
-                self._loadIESProfile(entry.split(".")[0], combinedPath)
-
-    def _storeIESProfile(self, name, lampRadialGradientData, lampGradientData):
-        """ Internal method to convert the array of data into a texture to load
-        into the texture array """
-
-        def interpolateValue(dataset, percentageVal):
-            """ Interpolates over an array, accepting float values from 0.0 to 1.0 """
-            percentageValClamped = max(0.0, min(0.99999, percentageVal))
-            scaledVal = percentageValClamped * len(dataset)
-            index = int(scaledVal)
-            indexBy1 = min(index + 1, len(dataset) - 1)
-            lerpFactor = scaledVal % 1.0
-            return dataset[indexBy1] * lerpFactor + dataset[index] * (1.0 - lerpFactor)
+                self.profileFiles[entry.split(".")[0]] = os.path.join(directory, entry)
+
+    def update(self):
+        """ Uploads the profiles loaded since the last call. This should be
+        called once per frame, after the lights requested their profiles, so
+        all profiles loaded in a frame get uploaded at once """
+        if not self._dirty:
+            return
+
+        # Grow the texture array if required, by doubling the layer count
+        numLayers = self.numLayers
+        while numLayers < len(self.profileNames):
+            numLayers *= 2
+        if numLayers != self.numLayers:
+            self.debug("Growing ies profile storage to", numLayers, "layers")
+            self._setupStorage(min(numLayers, self.MaxProfiles))
+
+        # Unused layers are left black
+        padding = (self.numLayers - len(self.profileNames)) * self.layerSize * self.data.itemsize
+        self.storage.setRamImage(self.data.tostring() + b"\0" * padding)
+        self._dirty = False
+
+    def _loadIESProfile(self, name, filename):
+        """ Internal method to load an ies profile, either from the cache or by
+        parsing the file """
+        with open(filename, "rb") as handle:
+            content = handle.read()
+
+        key = self.cache.computeKey(content)
+        table = self.cache.lookup(key)
+
+        if table is None:
+            profile = self._parseIESProfile(name, content.decode("utf-8", "ignore"))
+            if profile is None:
+                return False
+            table = self._bakeIESProfile(*profile)
+            self.cache.store(key, table)
+
+        return self._storeIESProfile(name, table)
+
+    def _storeIESProfile(self, name, table):
+        """ Internal method to append a baked table to the profile data. The
+        texture gets updated on the next call to update() """
 
         # Add profile name to the list of loaded profiles
         if name in self.profileNames:
             # self.error("Cannot register profile",name,"twice")
             return False
-        profileIndex = len(self.profileNames)
-        self.profileNames.append(name)
-
-        # Generate gradient texture
-        img = PNMImage(self.IESTableResolution, 1, 4, 2 ** 16 - 1)
-
-        for offset in range(self.IESTableResolution):
-            radialGradientValR = interpolateValue(lampRadialGradientData,
-                                                  (offset + 5.0) / float(self.IESTableResolution))
-            radialGradientValG = interpolateValue(lampRadialGradientData,
-                                                  offset / float(self.IESTableResolution))
-            radialGradientValB = interpolateValue(lampRadialGradientData,
-                                                  (offset - 5.0) / float(self.IESTableResolution))
-
-            gradientVal = interpolateValue(lampGradientData, offset / float(self.IESTableResolution))
 
-            img.setXelA(offset, 0, radialGradientValR, radialGradientValG, radialGradientValB, gradientVal)
+        if len(self.profileNames) >= self.MaxProfiles:
+            self.error("Cannot load more than", self.MaxProfiles, "ies profiles")
+            return False
 
-        # Store gradient texture
-        self.storage.load(img, profileIndex, 0)
+        self.profileNames.append(name)
+        self.data.extend(table)
+        self._dirty = True
+        return True
 
-    def _loadIESProfile(self, name, filename):
-        """ Internal method to load an ies profile. Adapted from
+    def _getWeights(self, count, shift=0.0):
+        """ Internal method to compute for each texel of a table row the two
+        data indices and the factor to interpolate them, when resampling count
+        values. shift offsets the texels, in texels """
+        key = (count, shift)
+        if key not in self.weightCache:
+            weights = []
+            for offset in range(self.resolution):
+                percentage = max(0.0, min(0.99999, (offset + shift) / float(self.resolution)))
+                scaled = percentage * count
+                index = int(scaled)
+                weights.append((index, min(index + 1, count - 1), scaled % 1.0))
+            self.weightCache[key] = weights
+        return self.weightCache[key]
+
+    def _getHorizontalWeights(self, horizontalAngles, coneType):
+        """ Internal method to compute for each row of the table the two
+        horizontal angles and the factor to interpolate them. Rows are spaced
+        evenly over 360 degrees, and profiles which only store a quadrant or
+        one half get mirrored """
+        weights = []
+        firstAngle = horizontalAngles[0]
+        lastIndex = len(horizontalAngles) - 1
+
+        for row in range(self.horizontalResolution):
+            if lastIndex == 0:
+                weights.append((0, 0, 0.0))
+                continue
+
+            # Sample at the texel center
+            angle = (row + 0.5) / self.horizontalResolution * 360.0
+
+            if coneType == 'TYPE90':
+                angle %= 180.0
+                if angle > 90.0:
+                    angle = 180.0 - angle
+            elif coneType == 'TYPE180':
+                if angle > 180.0:
+                    angle = 360.0 - angle
+
+            angle = max(firstAngle, min(horizontalAngles[-1], firstAngle + angle))
+            index = min(max(0, bisect_right(horizontalAngles, angle) - 1), lastIndex - 1)
+            span = horizontalAngles[index + 1] - horizontalAngles[index]
+            factor = (angle - horizontalAngles[index]) / span if span > 0 else 0.0
+            weights.append((index, index + 1, factor))
+
+        return weights
+
+    def _bakeIESProfile(self, candela2D, horizontalAngles, horizontalConeType, lampGradientData):
+        """ Internal method to resample the candela values into a table of
+        resolution x horizontalResolution texels, which gets stored in the
+        texture array. RGB stores the radial falloff at the horizontal angle of
+        the row, and A the distance gradient. The texels are stored in BGRA
+        order, which is what panda expects """
+
+        def resample(dataset, weights):
+            return [dataset[i0] + (dataset[i1] - dataset[i0]) * f for i0, i1, f in weights]
+
+        numVertical = len(candela2D[0])
+        weightsR = self._getWeights(numVertical, 5.0)
+        weightsG = self._getWeights(numVertical)
+        weightsB = self._getWeights(numVertical, -5.0)
+        gradient = resample(lampGradientData, self._getWeights(len(lampGradientData)))
+
+        table = array("f")
+
+        for i0, i1, f in self._getHorizontalWeights(horizontalAngles, horizontalConeType):
+            row = [a + (b - a) * f for a, b in zip(candela2D[i0], candela2D[i1])]
+            texels = zip(resample(row, weightsB), resample(row, weightsG),
+                         resample(row, weightsR), gradient)
+            table.extend(value for texel in texels for value in texel)
+
+        return table
+
+    def _parseIESProfile(self, name, content):
+        """ Internal method to parse an ies profile, returns the normalized
+        candela values per horizontal angle, the horizontal angles and their
+        cone type, and the fallof gradient, or None if the profile is invalid. Adapted from
         https://gist.githubusercontent.com/AngryLoki/4364512/raw/ies2cycles.py """
-        # self.debug("Loading ies profile", filename, "as",len(self.profileNames))
+        # self.debug("Parsing ies profile", name)
 
         profileMultiplier = 1.0
 
-        # Open the IES file
-        with open(filename, 'r', encoding="utf-8", errors="ignore") as handle:
-            content = handle.read()
-            content.encode('utf-8')
-
         # Extract and check version string
         versionString, content = content.split('\n', 1)
         versionString = versionString.strip()
@@ -136,7 +268,7 @@ class IESLoader(DebugObject):
 
         if not keyword.startswith('TILT'):
             self.warn("TILT keyword not found")
-            return False
+            return None
 
         # Strip data
         fileData = content.replace(',', ' ').split()
@@ -155,7 +287,7 @@ class IESLoader(DebugObject):
         # Check if everything went right so far
         if not numVerticalAngles or not numHorizontalAngles:
             self.error("Error during property extract")
-            return False
+            return None
 
         # Extract further properties
         photometricType = int(fileData[5])
@@ -205,20 +337,21 @@ class IESLoader(DebugObject):
         candelaIndex = len(verticalAngles) * len(horizontalAngles)
         candelaValues = [float(s) for s in fileData[offset:offset + candelaIndex]]
 
-        # Convert the 1d candela array to 2d array
+        # Convert the 1d candela array to 2d array, one row per horizontal angle
         candela2D = list(zip(*[iter(candelaValues)] * len(verticalAngles)))
 
+        if len(candela2D) != len(horizontalAngles):
+            self.error("Invalid amount of candela values in", name)
+            return None
+
         # Compute the fallof gradient
         lampGradientData = [x / verticalAngles[-1] for x in verticalAngles]
 
-        # Compute the radial gradient
-        radialGradientData = [sum(x) / len(x) for x in zip(*candela2D)]
-
-        radialGradientDataMax = max(radialGradientData)
+        # Normalize the candela values by dividing by the maximum value
+        candelaMax = max(candelaValues)
+        if candelaMax <= 0.0:
+            self.warn("Profile has no candela values above zero:", name)
+            candelaMax = 1.0
+        candela2D = [[val / candelaMax for val in row] for row in candela2D]
 
-        # Normalize the radial gradient by dividing by the maximum value
-        radialGradientData = [val / radialGradientDataMax for val in radialGradientData]
-
-        # Finally register the profile
-        self._storeIESProfile(name, radialGradientData, lampGradientData)
-        return True
+        return candela2D, horizontalAngles, lampHorizontalConeType, lampGradientData
@@ -0,0 +1,135 @@
+import atexit
+import hashlib
+import struct
+
+from array import array
+
+from direct.stdpy.file import open, isfile
+
+from Code.DebugObject import DebugObject
+
+
+class IESProfileCache(DebugObject):
+
+    """ This class stores the baked tables of ies profiles on disk, so the
+    profiles don't have to be parsed again on the next start. The entries are
+    keyed by a hash of the ies file content, so modified profiles get parsed
+    again automatically.
+
+    All entries are stored in a single binary file in the write path, which is
+    read with one call on startup. Each table is copied out of it in one piece
+    when the profile is first used. """
+
+    # Increase this whenever the table generation changes, to invalidate all
+    # existing entries
+    Version = 3
+
+    CacheFile = "PipelineTemp/IESProfiles.cache"
+    Magic = b"IESC"
+
+    Header = "<4sIIII"
+
+    def __init__(self, width, height):
+        """ Creates the cache for tables of width x height RGBA texels """
+        DebugObject.__init__(self, "IESProfileCache")
+        self.width = width
+        self.height = height
+        self.tableSize = width * height * 4
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+        atexit.register(self.save)
+
+    def _load(self):
+        """ Internal method to read the cache file """
+        if not isfile(self.CacheFile):
+            return
+
+        try:
+            with open(self.CacheFile, "rb") as handle:
+                content = handle.read()
+
+            magic, version, width, height, numEntries = struct.unpack_from(self.Header, content, 0)
+        except Exception:
+            self.warn("Could not read ies profile cache, starting with an empty cache")
+            return
+
+        # Tables of another resolution have a different layout, even if they
+        # have the same size
+        if magic != self.Magic or version != self.Version or (width, height) != (self.width, self.height):
+            self.debug("IES profile cache is outdated, discarding it")
+            self._dirty = True
+            return
+
+        # Each entry is a 20 byte sha1 digest followed by the table
+        offset = struct.calcsize(self.Header)
+        entrySize = 20 + self.tableSize * 4
+
+        if len(content) < offset + numEntries * entrySize:
+            self.warn("IES profile cache is truncated, discarding it")
+            self._dirty = True
+            return
+
+        for i in range(numEntries):
+            key = content[offset:offset + 20]
+            self.entries[key] = content[offset + 20:offset + entrySize]
+            offset += entrySize
+
+    def save(self):
+        """ Writes the cache file, if it changed. This gets called automatically
+        when the application exits """
+        if not self._dirty:
+            return
+
+        output = [struct.pack(self.Header, self.Magic, self.Version, self.width, self.height,
+                              len(self.entries))]
+        for key, data in self.entries.items():
+            output.append(key)
+            output.append(data)
+
+        try:
+            with open(self.CacheFile, "wb") as handle:
+                handle.write(b"".join(output))
+        except Exception:
+            self.warn("Could not write ies profile cache")
+            return
+
+        self._dirty = False
+
+    def computeKey(self, content):
+        """ Computes the cache key of an ies file, given its content as bytes """
+        return hashlib.sha1(content).digest()
+
+    def lookup(self, key):
+        """ Returns the cached table as float array, or None if there is no
+        entry for the key """
+        data = self.entries.get(key, None)
+        if data is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        table = array("f")
+        table.fromstring(data)
+        return table
+
+    def store(self, key, table):
+        """ Stores a table, which should be a float array of tableSize floats """
+        if len(table) != self.tableSize:
+            self.error("Invalid table size:", len(table))
+            return False
+
+        self.entries[key] = table.tostring()
+        self._dirty = True
+        return True
+
+    def getStats(self):
+        """ Returns a dictionary containing the amount of cached profiles, and
+        the hits and misses """
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,395 @@
+import math
+
+from array import array
+from bisect import bisect_right
+
+from panda3d.core import Vec3, PStatCollector
+
+from Code.DebugObject import DebugObject
+from Code.Globals import Globals
+from Code.LightType import LightType
+
+pstats_AnimateLights = PStatCollector("App:LightManager:AnimateLights")
+
+
+class LightAnimator(DebugObject):
+
+    """ This class animates the position, color and radius of many lights at
+    once. Instead of calling setPos / setColor on each light from a python task,
+    which queues a full light update (recomputing all data and rebinding all
+    shader inputs), the animator stores all curves in flat arrays, evaluates
+    them in one step per frame and writes the results straight into the light
+    storage of the LightManager, only rebinding the attributes which actually
+    changed.
+
+    There are three kinds of tracks:
+
+        Keyframe tracks interpolate linearly between a list of keyframes,
+        optionally looping.
+
+        Sine tracks oscillate around a base value, useful for pulsing or
+        moving lights.
+
+        Flicker tracks use smooth value noise around a base value, useful
+        for fire and candles.
+
+    Each track animates a single channel of a light, the supported channels
+    are "position", "color" and "radius". A light can have one track per
+    channel, adding another track for the same channel replaces the old one.
+    """
+
+    # Channel name -> (channel id, number of components)
+    Channels = {
+        "position": (0, 3),
+        "color": (1, 3),
+        "radius": (2, 1),
+    }
+
+    # Attributes which can change when a light gets animated
+    RebindAttributes = ["color", "position", "radius", "mvp"]
+
+    # Track kinds
+    KindKeyframes = 0
+    KindSine = 1
+    KindFlicker = 2
+
+    def __init__(self, lightManager):
+        """ Creates a new animator. It expects the LightManager as parameter,
+        as the animated values are written into its light storage """
+        DebugObject.__init__(self, "LightAnimator")
+        self.lightManager = lightManager
+        self.time = 0.0
+        self.timeScale = 1.0
+        self.paused = False
+        self._clearTracks()
+
+        # Temporaries reused every frame, to avoid allocations in update()
+        self._radiusResult = array("f", [0.0])
+        self._changedLights = {}
+        self._rebindIndices = dict((name, []) for name in self.RebindAttributes)
+        self._rebindLights = dict((name, []) for name in self.RebindAttributes)
+
+    def _clearTracks(self):
+        """ Internal method to reset the track storage """
+
+        # Per track data
+        self._trackLights = []
+        self._trackKind = array("i")
+        self._trackChannel = array("i")
+        self._trackOffset = array("i")
+        self._trackCount = array("i")
+        self._trackLoop = array("b")
+
+        # Per track vector the animated value gets written to, None for
+        # radius tracks. The vector gets assigned to the light, so it is
+        # written in place instead of allocating a new vector each frame.
+        self._trackVectors = []
+
+        # Keyframe data, all tracks are stored in the same arrays. The values
+        # are stored with as many components as the channel has.
+        self._keyTimes = array("f")
+        self._keyValues = array("f")
+
+        # Procedural data, stored as [base, amplitude, frequency, phase]
+        # where base and amplitude have as many components as the channel has
+        self._procParams = array("f")
+
+    def getNumTracks(self):
+        """ Returns the amount of tracks currently stored """
+        return len(self._trackLights)
+
+    def setTimeScale(self, scale):
+        """ Sets the factor applied to the frame delta when advancing the
+        animation time """
+        self.timeScale = scale
+
+    def setPaused(self, paused=True):
+        """ Pauses or resumes all animations """
+        self.paused = paused
+
+    def _getChannel(self, channel):
+        """ Internal method to get the channel id and the component count of
+        a channel name """
+        if channel not in self.Channels:
+            raise Exception("Unknown light channel: " + str(channel))
+        return self.Channels[channel]
+
+    def _flatten(self, value, numComponents):
+        """ Internal method to convert a value (float, tuple or vector) to a
+        list with the given amount of components """
+        if numComponents == 1:
+            return [float(value)]
+        return [float(value[i]) for i in range(numComponents)]
+
+    def _addTrack(self, light, channel, kind, offset, count, loop):
+        """ Internal method to store the per track data. Replaces existing
+        tracks of the light for the same channel """
+        channelID, numComponents = self._getChannel(channel)
+        self._removeTracks(lambda trackLight, trackChannel:
+            trackLight is light and trackChannel == channelID)
+
+        self._trackLights.append(light)
+        self._trackKind.append(kind)
+        self._trackChannel.append(channelID)
+        self._trackOffset.append(offset)
+        self._trackCount.append(count)
+        self._trackLoop.append(1 if loop else 0)
+        self._trackVectors.append(Vec3(0) if numComponents == 3 else None)
+
+    def addKeyframeTrack(self, light, channel, times, values, loop=True):
+        """ Animates the given channel of the light by linearly interpolating
+        between the keyframes. times should be a sorted list of timestamps in
+        seconds, values a list of the same length. When loop is True, the
+        animation restarts after the last keyframe, otherwise the last value
+        is kept. """
+        channelID, numComponents = self._getChannel(channel)
+
+        if len(times) < 1 or len(times) != len(values):
+            self.error("Keyframe times and values do not match")
+            return False
+
+        for i in range(1, len(times)):
+            if times[i] < times[i - 1]:
+                self.error("Keyframe times have to be sorted")
+                return False
+
+        offset = len(self._keyTimes)
+        self._keyTimes.extend([float(t) for t in times])
+        for val in values:
+            self._keyValues.extend(self._flatten(val, numComponents))
+
+        self._addTrack(light, channel, self.KindKeyframes, offset,
+            len(times), loop)
+        return True
+
+    def addSineTrack(self, light, channel, base, amplitude, frequency, phase=0.0):
+        """ Animates the given channel of the light with a sine wave. The
+        result is base + amplitude * sin(2 * pi * (frequency * t + phase)) """
+        self._addProceduralTrack(light, channel, self.KindSine, base,
+            amplitude, frequency, phase)
+
+    def addFlickerTrack(self, light, channel, base, amplitude, frequency, phase=0.0):
+        """ Animates the given channel of the light with smooth noise. The
+        result is base + amplitude * noise(frequency * t + phase), where
+        noise returns values from -1 to 1. Using a different phase per light
+        makes them flicker independently. """
+        self._addProceduralTrack(light, channel, self.KindFlicker, base,
+            amplitude, frequency, phase)
+
+    def _addProceduralTrack(self, light, channel, kind, base, amplitude, frequency, phase):
+        """ Internal method to store the parameters of a procedural track """
+        channelID, numComponents = self._getChannel(channel)
+
+        offset = len(self._procParams)
+        self._procParams.extend(self._flatten(base, numComponents))
+        self._procParams.extend(self._flatten(amplitude, numComponents))
+        self._procParams.extend([float(frequency), float(phase)])
+
+        self._addTrack(light, channel, kind, offset, 1, True)
+
+    def removeLight(self, light):
+        """ Removes all tracks of the given light """
+        self._removeTracks(lambda trackLight, trackChannel: trackLight is light)
+
+    def _removeTracks(self, predicate):
+        """ Internal method to remove all tracks matching the predicate. This
+        rebuilds the track storage, so removing tracks is slower than
+        evaluating them """
+        keep = [i for i in range(len(self._trackLights)) if not predicate(
+            self._trackLights[i], self._trackChannel[i])]
+
+        if len(keep) == len(self._trackLights):
+            return
+
+        oldLights = self._trackLights
+        oldKind, oldChannel = self._trackKind, self._trackChannel
+        oldOffset, oldCount = self._trackOffset, self._trackCount
+        oldLoop, oldVectors = self._trackLoop, self._trackVectors
+        oldKeyTimes, oldKeyValues = self._keyTimes, self._keyValues
+        oldProcParams = self._procParams
+
+        self._clearTracks()
+
+        for i in keep:
+            numComponents = self._getNumComponents(oldChannel[i])
+            offset, count = oldOffset[i], oldCount[i]
+
+            if oldKind[i] == self.KindKeyframes:
+                newOffset = len(self._keyTimes)
+                self._keyTimes.extend(oldKeyTimes[offset:offset + count])
+                self._keyValues.extend(oldKeyValues[
+                    offset * numComponents:(offset + count) * numComponents])
+            else:
+                newOffset = len(self._procParams)
+                self._procParams.extend(
+                    oldProcParams[offset:offset + 2 * numComponents + 2])
+
+            self._trackLights.append(oldLights[i])
+            self._trackKind.append(oldKind[i])
+            self._trackChannel.append(oldChannel[i])
+            self._trackOffset.append(newOffset)
+            self._trackCount.append(count)
+            self._trackLoop.append(oldLoop[i])
+            self._trackVectors.append(oldVectors[i])
+
+    def _getNumComponents(self, channelID):
+        """ Internal method to get the component count of a channel id """
+        for cid, numComponents in self.Channels.values():
+            if cid == channelID:
+                return numComponents
+        return 1
+
+    def _noise(self, x):
+        """ Internal method to compute smooth 1D value noise from -1 .. 1 """
+        cell = math.floor(x)
+        frac = x - cell
+        frac = frac * frac * (3.0 - 2.0 * frac)
+        h0 = math.sin(cell * 12.9898) * 43758.5453
+        h1 = math.sin((cell + 1.0) * 12.9898) * 43758.5453
+        h0 -= math.floor(h0)
+        h1 -= math.floor(h1)
+        return (h0 + (h1 - h0) * frac) * 2.0 - 1.0
+
+    def _evaluateKeyframes(self, trackIndex, numComponents, t, result):
+        """ Internal method to evaluate a keyframe track at the given time,
+        the value gets written to result """
+        offset = self._trackOffset[trackIndex]
+        count = self._trackCount[trackIndex]
+        times, values = self._keyTimes, self._keyValues
+        firstTime, lastTime = times[offset], times[offset + count - 1]
+
+        if self._trackLoop[trackIndex] and lastTime > firstTime:
+            t = (t - firstTime) % (lastTime - firstTime) + firstTime
+
+        # Find the keyframe after t, clamp to the first / last keyframe
+        keyIndex = bisect_right(times, t, offset, offset + count)
+
+        if keyIndex <= offset or keyIndex >= offset + count:
+            if keyIndex <= offset:
+                start = offset * numComponents
+            else:
+                start = (offset + count - 1) * numComponents
+            for i in range(numComponents):
+                result[i] = values[start + i]
+            return
+
+        t0, t1 = times[keyIndex - 1], times[keyIndex]
+        factor = (t - t0) / (t1 - t0) if t1 > t0 else 0.0
+        start0 = (keyIndex - 1) * numComponents
+        start1 = keyIndex * numComponents
+        for i in range(numComponents):
+            result[i] = values[start0 + i] + (values[start1 + i] - values[start0 + i]) * factor
+
+    def update(self):
+        """ Evaluates all tracks and writes the results into the light storage.
+        Gets called by the LightManager once per frame, before the lights are
+        processed """
+
+        if self.paused or len(self._trackLights) < 1:
+            return
+
+        pstats_AnimateLights.start()
+
+        self.time += Globals.clock.getDt() * self.timeScale
+        t = self.time
+        params = self._procParams
+        vectors = self._trackVectors
+        radiusResult = self._radiusResult
+        twoPi = 2.0 * math.pi
+
+        # Light -> bitmask of changed channels
+        changedLights = self._changedLights
+        changedLights.clear()
+
+        for trackIndex in range(len(self._trackLights)):
+            light = self._trackLights[trackIndex]
+            kind = self._trackKind[trackIndex]
+            channelID = self._trackChannel[trackIndex]
+            numComponents = 1 if channelID == 2 else 3
+            result = radiusResult if channelID == 2 else vectors[trackIndex]
+
+            if kind == self.KindKeyframes:
+                self._evaluateKeyframes(trackIndex, numComponents, t, result)
+            else:
+                offset = self._trackOffset[trackIndex]
+                frequency = params[offset + 2 * numComponents]
+                phase = params[offset + 2 * numComponents + 1]
+
+                if kind == self.KindSine:
+                    factor = math.sin(twoPi * (frequency * t + phase))
+                else:
+                    factor = self._noise(frequency * t + phase)
+
+                for i in range(numComponents):
+                    result[i] = params[offset + i] + params[offset + numComponents + i] * factor
+
+            if channelID == 0:
+                light.position = result
+            elif channelID == 1:
+                light.color = result
+            else:
+                light.radius = max(0.01, result[0])
+
+            changedLights[light] = changedLights.get(light, 0) | (1 << channelID)
+
+        for light, changedMask in changedLights.items():
+            self._applyChanges(light, changedMask)
+
+        # Rebind each changed attribute for all lights at once
+        lightsArray = self.lightManager.allLightsArray
+        for attrName in self.RebindAttributes:
+            lights = self._rebindLights[attrName]
+            if len(lights) > 0:
+                indices = self._rebindIndices[attrName]
+                lightsArray.rebindAttributeForAll(attrName, indices, lights)
+                del indices[:]
+                del lights[:]
+
+        pstats_AnimateLights.stop()
+
+    def _applyChanges(self, light, changedMask):
+        """ Internal method to update the derived data of a light and queue
+        the changed attributes for rebinding after its channels got
+        animated """
+        positionChanged = changedMask & 1
+        radiusChanged = changedMask & 4
+        mvpChanged = False
+
+        if positionChanged or radiusChanged:
+            # Spot lights store their transform in the mvp
+            if light.getLightType() == LightType.Spot:
+                light._computeAdditionalData()
+                mvpChanged = True
+
+            light._computeLightBounds()
+
+            if light.debugEnabled:
+                light._updateDebugNode()
+
+            # The radius changes the shadow frustum too, so both channels
+            # require new shadow maps
+            if light.hasShadows():
+                light.queueShadowUpdate()
+
+        # When the light queued a full update anyways, or is not attached yet,
+        # there is no need to write the attributes now
+        if light.needsUpdate() or light.getIndex() < 0 or not light.attached:
+            return
+
+        index = light.getIndex()
+
+        if changedMask & 2:
+            self._queueRebind("color", index, light)
+
+        if positionChanged or radiusChanged:
+            self._queueRebind("position", index, light)
+            self._queueRebind("radius", index, light)
+
+        if mvpChanged:
+            self._queueRebind("mvp", index, light)
+
+    def _queueRebind(self, attrName, index, light):
+        """ Internal method to queue an attribute of a light for rebinding,
+        the queued attributes get rebound at the end of update() """
+        self._rebindIndices[attrName].append(index)
+        self._rebindLights[attrName].append(light)
@@ -22,6 +22,8 @@ from Code.Globals import Globals
 from Code.MemoryMonitor import MemoryMonitor
 from Code.LightLimits import LightLimits
 from Code.IESLoader import IESLoader
+from Code.LightAnimator import LightAnimator
+from Code.LightSetFile import LightSetFile
 
 from Code.RenderPasses.ShadowScenePass import ShadowScenePass
 from Code.RenderPasses.LightCullingPass import LightCullingPass
@@ -104,6 +106,8 @@ class LightManager(DebugObject):
 
         self._initLightCulling()
 
+        # Create the animator for batch animated lights
+        self.animator = LightAnimator(self)
 
         # Create shadow compute buffer
         self._createShadowPass()
@@ -183,10 +187,15 @@ class LightManager(DebugObject):
         self.pipeline.getRenderPassManager().registerPass(self.scatteringCubemapPass)
 
     def _loadIESProfiles(self):
-        """ Loads the ies profiles from Data/IESProfiles. """
-        self.iesLoader = IESLoader()
+        """ Registers the ies profiles from Data/IESProfiles, they get loaded
+        when a light uses them first """
+        self.iesLoader = IESLoader(self.pipeline.settings.iesTableResolution,
+                                   self.pipeline.settings.iesHorizontalResolution)
         self.iesLoader.loadIESProfiles("Data/IESProfiles/")
 
+        # Profiles which could not be found, so they are not searched again
+        self.unknownIESProfiles = set()
+
         self.pipeline.getRenderPassManager().registerStaticVariable("IESProfilesTex",
             self.iesLoader.getIESProfileStorageTex())
 
@@ -322,20 +331,22 @@ class LightManager(DebugObject):
             return len(self.queuedShadowUpdates) - 1
         return self.queuedShadowUpdates.index(sourceIndex)
 
-    def _allocateLightSlot(self, light):
+    def _allocateLightSlot(self, light, start=0):
         """ Tries to find a free light slot. Returns False if no slot is free, if 
-        a slot is free it gets allocated and linked to the light """
-        for index, val in enumerate(self.lightSlots):
-            if val == None:
+        a slot is free it gets allocated and linked to the light. The search
+        begins at start, all slots before start have to be occupied """
+        for index in range(start, len(self.lightSlots)):
+            if self.lightSlots[index] is None:
                 light.setIndex(index)
                 self.lightSlots[index] = light
                 return True
         return False
 
-    def _findShadowSourceSlot(self):
-        """ Tries to find a free shadow source. Returns False if no slot is free """
-        for index, val in enumerate(self.shadowSourceSlots):
-            if val == None:
+    def _findShadowSourceSlot(self, start=0):
+        """ Tries to find a free shadow source. Returns False if no slot is free.
+        The search begins at start, all slots before start have to be occupied """
+        for index in range(start, len(self.shadowSourceSlots)):
+            if self.shadowSourceSlots[index] is None:
                 return index
         return -1
 
@@ -345,18 +356,53 @@ class LightManager(DebugObject):
         NOTICE: You have to set relevant properties like Whether the light
         casts shadows or the shadowmap resolution before calling this! 
         Otherwise it won't work (and maybe crash? I didn't test, 
-        just DON'T DO IT!) """
-        
+        just DON'T DO IT!) Returns True if the light got attached. """
+        return self._attachLight(light, [0, 0])
+
+    def addLights(self, lights):
+        """ Adds a list of lights at once. This is faster than calling addLight
+        for each light, because the search for free light and shadow source
+        slots continues where the previous light left off, instead of scanning
+        all slots again for every light. Returns the amount of attached lights. """
+        slotStarts = [0, 0]
+        numAttached = 0
+        for light in lights:
+            if self._attachLight(light, slotStarts):
+                numAttached += 1
+        return numAttached
+
+    def exportLightSet(self, filename):
+        """ Writes all attached lights to a compact binary file, which can be
+        loaded with importLightSet. See LightSetFile """
+        lights = [light for light in self.lightSlots if light is not None]
+        return LightSetFile().save(filename, lights)
+
+    def importLightSet(self, filename):
+        """ Loads a light set written by exportLightSet and attaches all lights
+        of it. Returns the list of loaded lights, or None on failure """
+        lights = LightSetFile().load(filename)
+        if lights is None:
+            return None
+        self.addLights(lights)
+        return lights
+
+    def _attachLight(self, light, slotStarts):
+        """ Internal method to attach a light. slotStarts stores the index to
+        start the search for free light and shadow source slots, and gets
+        updated with the allocated slots. Returns True if the light got
+        attached, and False otherwise """
+
         if light.attached:
             self.warn("Light is already attached!")
-            return
+            return False
 
-        light.attached = True
         # self.lights.append(light)
 
-        if not self._allocateLightSlot(light):
+        if not self._allocateLightSlot(light, slotStarts[0]):
             self.error("Cannot allocate light slot, out of slots.")
             return False
+        light.attached = True
+        slotStarts[0] = light.getIndex() + 1
 
         if light.hasShadows() and not self.pipeline.settings.renderShadows:
             self.warn("Attached shadow light but shadowing is disabled in pipeline.ini")
@@ -382,10 +428,11 @@ class LightManager(DebugObject):
                 source.resolution = tileSize
 
             # Frind slot for source
-            sourceSlotIndex = self._findShadowSourceSlot()
+            sourceSlotIndex = self._findShadowSourceSlot(slotStarts[1])
             if sourceSlotIndex < 0:
                 self.error("Cannot store more shadow sources!")
                 return False
+            slotStarts[1] = sourceSlotIndex + 1
 
             self.shadowSourceSlots[sourceSlotIndex] = source
             source.setSourceIndex(sourceSlotIndex)
@@ -396,10 +443,19 @@ class LightManager(DebugObject):
 
         light.queueUpdate()
         light.queueShadowUpdate()
+        return True
+
+    def getAnimator(self):
+        """ Returns the light animator, which can be used to animate the
+        position, color and radius of many lights at once, without calling
+        the setters of each light every frame """
+        return self.animator
 
     def removeLight(self, light):
         """ Removes a light from the rendered lights """
 
+        self.animator.removeLight(light)
+
         index = light.getIndex()
         if light.hasShadows():
             sources = light.getShadowSources()
@@ -422,6 +478,17 @@ class LightManager(DebugObject):
         """ Sets the current camera bounds used for light culling """
         self.cullBounds = bounds
 
+    def setMaxShadowUpdates(self, maxUpdates):
+        """ Sets how many shadow maps get updated per frame. This can only be
+        lowered below maxShadowUpdatesPerFrame, as the update arrays and the
+        shadow pass are sized for it """
+        maxUpdates = max(1, min(maxUpdates, self.pipeline.settings.maxShadowUpdatesPerFrame))
+        self.maxShadowUpdatesPerFrame = maxUpdates
+
+    def getMaxShadowUpdates(self):
+        """ Returns how many shadow maps get updated per frame """
+        return self.maxShadowUpdatesPerFrame
+
     def _writeRenderedLightsToBuffer(self):
         """ Stores the list of rendered lights in the buffer to access it in
         the shader later """
@@ -461,7 +528,9 @@ class LightManager(DebugObject):
 
     def update(self):
         """ Main update function """
+        self.animator.update()
         self.updateLights()
+        self.iesLoader.update()
         self.updateShadows()
         self.processCallbacks()
 
@@ -537,14 +606,17 @@ class LightManager(DebugObject):
 
             # Check if the ies profile has been assigned yet
             if light.getLightType() == LightType.Spot:
-                if light.getIESProfileIndex() < 0 and light.getIESProfileName() is not None:
-                    name = light.getIESProfileName()
-                    index = self.iesLoader.getIESProfileIndexByName(name)
-                    if index < 0:
-                        self.error("Unkown ies profile:",name)
-                        light.setIESProfileIndex(0)
+                name = light.getIESProfileName()
+                if light.getIESProfileIndex() < 0 and name is not None and \
+                        name not in self.unknownIESProfiles:
+                    profileIndex = self.iesLoader.getIESProfileIndexByName(name)
+                    if profileIndex < 0:
+                        # The light keeps the index -1, which the shader
+                        # renders without a profile
+                        self.error("Unknown ies profile:", name)
+                        self.unknownIESProfiles.add(name)
                     else:
-                        light.setIESProfileIndex(index)
+                        light.setIESProfileIndex(profileIndex)
 
             # Add light to the correct list now
             pstats_AppendRenderedLight.start()
@@ -0,0 +1,179 @@
+import struct
+
+from panda3d.core import Vec3
+from direct.stdpy.file import open, isfile
+
+from Code.DebugObject import DebugObject
+from Code.LightType import LightType
+from Code.PointLight import PointLight
+from Code.SpotLight import SpotLight
+from Code.DirectionalLight import DirectionalLight
+
+
+class LightSetFile(DebugObject):
+
+    """ This class reads and writes a set of lights from / to a compact binary
+    file. This is much faster than rebuilding a level's lights from python code
+    at load time, as the whole file is read and unpacked at once.
+
+    The file layout is:
+
+        Header:         magic, version, number of lights, number of names
+        Name table:     each entry is a length byte followed by the utf-8
+                        encoded ies profile name, so names can have at most
+                        MaxNameLength bytes
+        Light records:  one fixed size record per light, see RecordFormat
+
+    Each record stores the light type, shadow settings, the ies profile (as
+    index into the name table, or -1), position, color, radius and for spot
+    lights the orientation, field of view and near plane. """
+
+    Magic = b"RPLS"
+    Version = 1
+
+    # magic, version, numLights, numNames
+    HeaderFormat = "<4sHIH"
+
+    # type, flags, shadowResolution, iesIndex, position, color, radius,
+    # hpr, fov, nearPlane
+    RecordFormat = "<BBHi3f3ff3fff"
+
+    FlagCastShadows = 1
+
+    # The name length is stored in a single byte
+    MaxNameLength = 255
+
+    def __init__(self):
+        """ Creates a new light set file handler """
+        DebugObject.__init__(self, "LightSetFile")
+
+    def save(self, filename, lights):
+        """ Writes the given list of lights to filename """
+
+        names = []
+        records = []
+        record = struct.Struct(self.RecordFormat)
+
+        for light in lights:
+            lightType = light.getLightType()
+
+            if lightType not in [LightType.Point, LightType.Spot, LightType.Directional]:
+                self.warn("Skipping unsupported light type:", lightType)
+                continue
+
+            iesIndex = -1
+            iesName = light.getIESProfileName()
+            if iesName is not None:
+                if iesName not in names:
+                    names.append(iesName)
+                iesIndex = names.index(iesName)
+
+            flags = self.FlagCastShadows if light.hasShadows() else 0
+            pos, color = light.position, light.color
+            hpr, fov, nearPlane = Vec3(0), 0.0, 0.0
+
+            if lightType == LightType.Spot:
+                hpr = light.ghostCameraNode.getHpr()
+                fov = light.ghostLens.getFov().x
+                nearPlane = light.nearPlane
+
+            records.append(record.pack(lightType, flags, light.shadowResolution,
+                iesIndex, pos.x, pos.y, pos.z, color.x, color.y, color.z,
+                light.radius, hpr.x, hpr.y, hpr.z, fov, nearPlane))
+
+        output = [struct.pack(self.HeaderFormat, self.Magic, self.Version,
+            len(records), len(names))]
+
+        for name in names:
+            encoded = name.encode("utf-8")
+            if len(encoded) > self.MaxNameLength:
+                self.error("IES profile name is longer than", self.MaxNameLength,
+                           "bytes, can not write light set:", name)
+                return False
+            output.append(struct.pack("<B", len(encoded)) + encoded)
+
+        output += records
+
+        with open(filename, "wb") as handle:
+            handle.write(b"".join(output))
+
+        self.debug("Wrote", len(records), "lights to", filename)
+        return True
+
+    def load(self, filename):
+        """ Reads a light set from filename and returns the list of created
+        lights. The lights are not attached yet, pass them to
+        LightManager.addLights to do so. Returns None on failure. """
+
+        if not isfile(filename):
+            self.error("Could not find light set", filename)
+            return None
+
+        with open(filename, "rb") as handle:
+            content = handle.read()
+
+        headerSize = struct.calcsize(self.HeaderFormat)
+        if len(content) < headerSize:
+            self.error("Invalid light set file:", filename)
+            return None
+
+        magic, version, numLights, numNames = struct.unpack_from(
+            self.HeaderFormat, content, 0)
+
+        if magic != self.Magic or version != self.Version:
+            self.error("Unsupported light set file:", filename)
+            return None
+
+        # Read name table
+        offset = headerSize
+        names = []
+        for i in range(numNames):
+            length = struct.unpack_from("<B", content, offset)[0]
+            names.append(content[offset + 1:offset + 1 + length].decode("utf-8"))
+            offset += 1 + length
+
+        recordSize = struct.calcsize(self.RecordFormat)
+        if len(content) - offset != numLights * recordSize:
+            self.error("Light set file is truncated:", filename)
+            return None
+
+        # Unpack the records and create the lights from them
+        record = struct.Struct(self.RecordFormat)
+        lights = []
+        for i in range(numLights):
+            (lightType, flags, shadowResolution, iesIndex, px, py, pz,
+                cr, cg, cb, radius, h, p, r, fov, nearPlane) = \
+                record.unpack_from(content, offset)
+            offset += recordSize
+
+            if lightType == LightType.Point:
+                light = PointLight()
+            elif lightType == LightType.Spot:
+                light = SpotLight()
+                light.ghostLens.setFov(fov)
+                light.ghostLens.setNearFar(nearPlane, radius)
+                light.nearPlane = nearPlane
+                light.ghostCameraNode.setPosHpr(px, py, pz, h, p, r)
+            elif lightType == LightType.Directional:
+                light = DirectionalLight()
+            else:
+                self.warn("Skipping unsupported light type:", lightType)
+                continue
+
+            # Set the properties directly, the light gets a full update as
+            # soon as it is attached anyways
+            light.position = Vec3(px, py, pz)
+            light.color = Vec3(cr, cg, cb)
+            light.radius = radius
+            light.shadowResolution = shadowResolution
+
+            if iesIndex >= 0:
+                light.setIESProfile(names[iesIndex])
+
+            if flags & self.FlagCastShadows:
+                light.setCastsShadows(True)
+
+            lights.append(light)
+
+        self.debug("Loaded", len(lights), "lights from", filename)
+        return lights
@@ -1,4 +1,14 @@
+from __future__ import print_function
+
+import csv
+import json
+
+from collections import deque
+
 from panda3d.core import Texture
+from direct.stdpy.file import open
+
+from Code.Globals import Globals
 from Code.RenderTargetType import RenderTargetType
 
 
@@ -6,78 +16,238 @@ class MemoryMonitor:
 
     """ The memory monitor keeps track of all gpu ressources. All render targets
     and textures should be registered to the monitor. The used memory can be
-    seen by calling analyzeMemory. """
+    seen by calling analyzeMemory.
+
+    Each entry belongs to a category (shadows, gi, post, clouds or other),
+    which is either given when registering it, or derived from its name. A
+    budget in bytes can be set per category, registering an entry which
+    exceeds the budget prints a warning. When update() is called each frame,
+    the usage per category is recorded every sampleInterval seconds, and can
+    be written to a file with exportJSON or exportCSV. """
 
-    # Internal storage for all entries
+    # Internal storage for all entries, name -> (size, texture)
     memoryEntries = {}
 
+    # Category of each entry, name -> category
+    entryCategories = {}
+
+    # All entry names of a texture, used to find shared textures
+    textureEntries = {}
+
+    # Entries which share their texture with another entry, see
+    # TransientTexturePool. Those are stored with a size of 0 in memoryEntries
+    sharedEntries = {}
+
+    # Budget in bytes per category
+    budgets = {}
+    overBudget = set()
+
+    Categories = ["shadows", "gi", "post", "clouds", "other"]
+
+    # Used memory in bytes per category, updated when entries are added or
+    # removed, so the budgets can be checked without iterating all entries
+    categoryUsage = dict((category, 0) for category in Categories)
+
+    # Recorded usage, see update()
+    sampleInterval = 1.0
+    lastSampleTime = None
+    usageHistory = deque(maxlen=3600)
+
+    # Substrings of entry names which determine the category, the first
+    # matching category is used
+    CategoryPatterns = [
+        ("shadows", ["ShadowAtlas", "ShadowMap"]),
+        ("clouds", ["Cloud"]),
+        ("gi", ["Voxel", "GlobalIllumination", "GIGrid"]),
+        ("post", ["Bloom", "DOF", "SMAA", "FXAA", "Antialiasing", "MotionBlur",
+                  "Exposure", "SSLR", "Occlusion", "Downscale", "Final",
+                  "Volumetric", "Scattering"]),
+    ]
+
+    # Bytes per texel of the sized texture formats. Formats with 3 components
+    # are padded to 4 by most drivers. The size of the unsized formats
+    # (e.g. FRgba) depends on the component type, see _getTexelSize
+    FormatSizes = {
+        "FDepthStencil": 4,
+        "FDepthComponent16": 2,
+        "FDepthComponent24": 4,
+        "FDepthComponent32": 4,
+        "FRgb5": 2,
+        "FRgb8": 4,
+        "FRgb12": 8,
+        "FRgb332": 1,
+        "FRgbm": 4,
+        "FRgba4": 2,
+        "FRgba5": 2,
+        "FRgba8": 4,
+        "FRgba12": 8,
+        "FRgba16": 8,
+        "FRgba32": 16,
+        "FR16": 2,
+        "FRg16": 4,
+        "FRgb16": 8,
+        "FSrgb": 4,
+        "FSrgbAlpha": 4,
+        "FSluminance": 1,
+        "FSluminanceAlpha": 2,
+        "FR32i": 4,
+        "FR32": 4,
+        "FRg32": 8,
+        "FRgb32": 16,
+        "FR8i": 1,
+        "FRg8i": 2,
+        "FRgb8i": 4,
+        "FRgba8i": 4,
+        "FR11G11B10": 4,
+        "FRgb9E5": 4,
+        "FRgb10A2": 4,
+        "FR16i": 2,
+        "FRg16i": 4,
+        "FRgb16i": 8,
+        "FRgba16i": 8,
+        "FRg32i": 8,
+        "FRgb32i": 16,
+        "FRgba32i": 16,
+    }
+
+    # Bits per texel of the compressed formats
+    CompressionBits = {
+        "CMDxt1": 4,
+        "CMDxt2": 8,
+        "CMDxt3": 8,
+        "CMDxt4": 8,
+        "CMDxt5": 8,
+        "CMEtc1": 4,
+        "CMEtc2": 8,
+        "CMEac": 8,
+        "CMPvr12bpp": 2,
+        "CMPvr14bpp": 4,
+    }
+
+    # Format and compression tables keyed by the panda constants, created on
+    # first use. Constants missing in the used panda version are skipped
+    _formatTable = None
+    _compressionTable = None
+
     @classmethod
-    def _calculateTexSize(self, tex):
-        """ This internal function computes the approximate size of a texture
-        in byte on the gpu. """
-
-        # Assign the texture format a size
-        textureTypes = {
-            3:  1,     # FRED
-            6:  1,     # ALPHA
-            7:  4,     # RGB (Unkown type, we will just assume 8 bit)
-            9:  4,     # FRGBA8
-            12: 4,     # RGBA (Unkown type, we will just assume 8 bit)
-            18: 1,     # LUMINANCE
-            19: 2,     # LUMINANCE_ALPHA
-            16: 4,     # RGBA8
-            21: 8,     # RGBA16
-            22: 16,    # RGBA32
-            24: 2,     # FDEPTHCOMOPONENT
-            25: 4,     # Depth 24 Bit
-            26: 4,     # Depth 32 Bit
-            27: 2,     # FR16 
-            29: 8,     # FRGB16
-            30: 4,     # FSRGB
-            31: 4,     # FSRGB_ALPHA    
-            34: 4,     # FR32i
-            35: 4,     # FR32,
-            42: 4,     # FR11G11B10
-        }
+    def _getTables(self):
+        """ Internal method to resolve the names in FormatSizes and
+        CompressionBits to the constants of the Texture class """
+        if self._formatTable is None:
+            self._formatTable = dict((getattr(Texture, name), size)
+                for name, size in self.FormatSizes.items() if hasattr(Texture, name))
+            self._compressionTable = dict((getattr(Texture, name), bits)
+                for name, bits in self.CompressionBits.items() if hasattr(Texture, name))
+        return self._formatTable, self._compressionTable
 
-        # Get format and compute size per component
-        form = tex.getFormat()
-        componentSize = 0
+    @classmethod
+    def _getTexelSize(self, tex):
+        """ Internal method to get the size of a texel in bytes, which can be
+        fractional for compressed textures """
+        formatTable, compressionTable = self._getTables()
 
-        if form in textureTypes:
-            componentSize = textureTypes[form]
-        else:
-            print("MemoryMonitor: Unkown type:", form, tex.getName())
+        compression = tex.getRamImageCompression()
+        if compression in compressionTable:
+            return compressionTable[compression] / 8.0
 
-        # Fetch the amount of pixels
-        pixelCount = tex.getXSize() * tex.getYSize() * tex.getZSize()
+        form = tex.getFormat()
+        if form in formatTable:
+            return formatTable[form]
+
+        # Unsized formats, the component type determines the size
+        numComponents = tex.getNumComponents()
+        if numComponents == 3:
+            numComponents = 4
+        return numComponents * tex.getComponentWidth()
 
-        # Check for deprecated formats
-        deprecated = [18, 19, 6]
+    @classmethod
+    def _calculateTexSize(self, tex, multisamples=0):
+        """ This internal function computes the approximate size of a texture
+        in byte on the gpu. Cubemaps and texture arrays store all faces and
+        layers in the z size. When multisamples is set, the size of the
+        multisampled buffer the texture gets resolved from is added """
 
-        if form in deprecated:
-            # print "DEPRECATED FORMAT:", form, "USED BY",tex.getName()
-            pass
+        texelSize = self._getTexelSize(tex)
+        width, height, depth = tex.getXSize(), tex.getYSize(), tex.getZSize()
+        is3D = tex.getTextureType() == Texture.TT3dTexture
 
-        # Multiply the size of the component by the amount of pixels
-        dataSize = int(componentSize * pixelCount)
-        
-        # Mipmaps take approx 33% of the texture size, so just multiply it with that amount
+        # Sum up the size of all mipmap levels
+        pixelCount = width * height * depth
         if tex.usesMipmaps():
-            dataSize = (dataSize * 4) // 3
+            while width > 1 or height > 1 or (is3D and depth > 1):
+                width = max(1, width // 2)
+                height = max(1, height // 2)
+                if is3D:
+                    depth = max(1, depth // 2)
+                pixelCount += width * height * depth
 
-        # if dataSize != tex.estimateTextureMemory():
-            # print "Format",form,"does not match:", dataSize, "vs", tex.estimateTextureMemory()
+        dataSize = int(texelSize * pixelCount)
+
+        if multisamples > 1:
+            dataSize += int(texelSize * tex.getXSize() * tex.getYSize() * tex.getZSize() * multisamples)
 
         return dataSize
 
     @classmethod
-    def addTexture(self, name, tex):
+    def getCategory(self, name):
+        """ Returns the category of an entry, based on its name """
+        for category, patterns in self.CategoryPatterns:
+            for pattern in patterns:
+                if pattern in name:
+                    return category
+        return "other"
+
+    @classmethod
+    def _addEntry(self, name, tex, texSize, category):
+        """ Internal method to store an entry. Textures which are already
+        registered only count once """
+        if name in self.memoryEntries:
+            self._removeEntry(name)
+
+        entryNames = self.textureEntries.setdefault(tex, set())
+        if len(entryNames) > 0:
+            self.sharedEntries[name] = texSize
+            texSize = 0
+        entryNames.add(name)
+
+        category = category or self.getCategory(name)
+        self.memoryEntries[name] = (texSize, tex)
+        self.entryCategories[name] = category
+        self.categoryUsage[category] = self.categoryUsage.get(category, 0) + texSize
+        self._checkBudget(category)
+
+    @classmethod
+    def _removeEntry(self, name):
+        """ Internal method to remove an entry. When the entry held the size
+        of a shared texture, the size is moved to another entry sharing it """
+        texSize, tex = self.memoryEntries.pop(name)
+        category = self.entryCategories.pop(name)
+        self.sharedEntries.pop(name, None)
+        self.categoryUsage[category] -= texSize
+
+        entryNames = self.textureEntries[tex]
+        entryNames.discard(name)
+
+        if len(entryNames) < 1:
+            del self.textureEntries[tex]
+        elif texSize > 0:
+            successor = next(iter(entryNames))
+            successorSize = self.sharedEntries.pop(successor)
+            successorCategory = self.entryCategories[successor]
+            self.memoryEntries[successor] = (successorSize, tex)
+            self.categoryUsage[successorCategory] += successorSize
+            self._checkBudget(successorCategory)
+
+        if not self.isOverBudget(category):
+            self.overBudget.discard(category)
+
+    @classmethod
+    def addTexture(self, name, tex, category=None):
         """ Adds a texture to the list of textures which are currently used """
-        self.memoryEntries["[TEX] " + name] = (self._calculateTexSize(tex), tex)
+        self._addEntry("[TEX] " + name, tex, self._calculateTexSize(tex), category)
 
     @classmethod
-    def addRenderTarget(self, name, target):
+    def addRenderTarget(self, name, target, category=None):
         """ Adds a render target to the list of targets which are currently used """
 
         # Iterate over all attachments
@@ -87,10 +257,8 @@ class MemoryMonitor:
 
             # Extract attachment textures and calculate their size
             tex = target.getTarget(targetType)
-            texSize = self._calculateTexSize(tex)
-
-            # Store the texture
-            self.memoryEntries[name + "." + targetType] = (texSize, tex)
+            texSize = self._calculateTexSize(tex, target.getMultisamples())
+            self._addEntry(name + "." + targetType, tex, texSize, category)
 
     @classmethod
     def unregisterRenderTarget(self, name, target):
@@ -99,7 +267,62 @@ class MemoryMonitor:
             if not target.hasTarget(targetType):
                 continue
             targetName = name + "." + targetType
-            del self.memoryEntries[targetName]
+            if targetName in self.memoryEntries:
+                self._removeEntry(targetName)
+
+    @classmethod
+    def setBudget(self, category, budget):
+        """ Sets the budget of a category in bytes, a budget of 0 means no
+        budget """
+        if budget > 0:
+            self.budgets[category] = budget
+        else:
+            self.budgets.pop(category, None)
+        self.overBudget.discard(category)
+        self._checkBudget(category)
+
+    @classmethod
+    def getBudget(self, category):
+        """ Returns the budget of a category in bytes, or None if it has no
+        budget """
+        return self.budgets.get(category, None)
+
+    @classmethod
+    def isOverBudget(self, category):
+        """ Returns whether a category uses more memory than its budget """
+        budget = self.getBudget(category)
+        return budget is not None and self.categoryUsage.get(category, 0) > budget
+
+    @classmethod
+    def _checkBudget(self, category):
+        """ Internal method to warn once when a category exceeds its budget """
+        if category in self.overBudget or not self.isOverBudget(category):
+            return
+        self.overBudget.add(category)
+        print("MemoryMonitor: Category", category, "uses",
+              round(self.categoryUsage[category] / (1024.0 * 1024.0), 1), "MB, which is over its budget of",
+              round(self.budgets[category] / (1024.0 * 1024.0), 1), "MB")
+
+    @classmethod
+    def getCategoryUsage(self):
+        """ Returns a dictionary of category -> used memory in bytes """
+        return dict(self.categoryUsage)
+
+    @classmethod
+    def update(self):
+        """ Records the memory usage every sampleInterval seconds. This should
+        be called once per frame """
+        now = Globals.clock.getFrameTime()
+        if self.lastSampleTime is not None and now - self.lastSampleTime < self.sampleInterval:
+            return
+        self.lastSampleTime = now
+        self.usageHistory.append((now, self.getEstimatedMemUsage(), self.getCategoryUsage()))
+
+    @classmethod
+    def getUsageHistory(self):
+        """ Returns the recorded usage as list of (time, total bytes,
+        category -> bytes) """
+        return list(self.usageHistory)
 
     @classmethod
     def analyzeMemory(self):
@@ -120,6 +343,53 @@ class MemoryMonitor:
         print("-" * 79)
         print(" " * 49, round(total / (1024.0 * 1024.0), 1), "MB")
 
+        if self.sharedEntries:
+            saved = round(self.getSavedMemory() / (1024.0 * 1024.0), 1)
+            outputLine = "Saved by " + str(len(self.sharedEntries)) + " shared textures"
+            print(outputLine.ljust(50, ' ') + str(saved) + " MB")
+
+        print("-" * 79)
+        for category, val in sorted(self.getCategoryUsage().items()):
+            outputLine = category.ljust(50, ' ') + str(round(val / (1024.0 * 1024.0), 1)) + " MB"
+            if category in self.budgets:
+                outputLine += " / " + str(round(self.budgets[category] / (1024.0 * 1024.0), 1)) + " MB"
+            print(outputLine)
+
+    @classmethod
+    def exportJSON(self, filename):
+        """ Writes all entries, the usage per category, the budgets and the
+        recorded usage to a json file """
+        result = {
+            "total": self.getEstimatedMemUsage(),
+            "saved": self.getSavedMemory(),
+            "categories": self.getCategoryUsage(),
+            "budgets": self.budgets,
+            "entries": [{
+                    "name": name,
+                    "size": val,
+                    "category": self.entryCategories[name],
+                    "shared": name in self.sharedEntries
+                } for name, (val, handle) in sorted(self.memoryEntries.items())],
+            "history": [{
+                    "time": time,
+                    "total": total,
+                    "categories": categories
+                } for time, total, categories in self.usageHistory],
+        }
+
+        with open(filename, "w") as handle:
+            json.dump(result, handle, indent=2)
+
+    @classmethod
+    def exportCSV(self, filename):
+        """ Writes the recorded usage to a csv file, with one row per sample
+        and one column per category, in bytes """
+        with open(filename, "w") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(["time", "total"] + self.Categories)
+            for time, total, categories in self.usageHistory:
+                writer.writerow([round(time, 3), total] + [categories.get(c, 0) for c in self.Categories])
+
     @classmethod
     def getEstimatedMemUsage(self):
         """ Returns the estimated memory usage in Bytes """
@@ -128,10 +398,13 @@ class MemoryMonitor:
             totalSum += val
         return totalSum
 
+    @classmethod
+    def getSavedMemory(self):
+        """ Returns the memory in Bytes which is saved by render targets sharing
+        their textures """
+        return sum(self.sharedEntries.values())
+
     @classmethod
     def isRegistered(self, tex):
         """ Checks if the texture is registered """
-        for key, (val, handle) in self.memoryEntries.items():
-            if handle == tex:
-                return True
-        return False
\ No newline at end of file
+        return tex in self.textureEntries
@@ -0,0 +1,185 @@
+from Code.DebugObject import DebugObject
+from Code.GlobalIllumination import GlobalIllumination
+from Code.MemoryMonitor import MemoryMonitor
+from Code.TransparencyManager import TransparencyManager
+
+
+class MemoryPressurePolicy(DebugObject):
+
+    """ This class lowers the size of optional gpu resources when the video
+    memory budgets are exceeded. The resources are lowered in this order:
+
+        clouds:         Halves the resolution of the cloud voxel grid, down
+                        to MinCloudResolution
+        transparency:   Halves the amount of transparent pixels which can be
+                        stored, down to a quarter of MaxPixelCount
+        gi:             Lowers giQualityLevel, which sets the resolution of
+                        the voxel grid, down to Low
+        shadowAtlas:    Halves shadowAtlasSize, down to MinShadowAtlasSize
+
+    There are two kinds of budgets. The category budgets of the
+    MemoryMonitor (vramBudgetShadows, vramBudgetGI, ...) are checked by
+    plan(), before the resources are created, using the size predicted from
+    the settings. Only the resource of the exceeded category gets lowered.
+
+    The total budget (vramBudget) can only be checked by check(), after the
+    pipeline has been created, since the size of the render targets is not
+    known before. Resources which can not be resized once created (gi and the
+    shadow atlas) can only react to their category budget, so check() only
+    lowers the clouds and the transparency buffer, which are resized before
+    the first frame is rendered. """
+
+    MinCloudResolution = 192
+    MinShadowAtlasSize = 2048
+
+    # Settings which determine the size of a resource on creation
+    SettingKeys = {
+        "clouds": "cloudResolution",
+        "gi": "giQualityLevel",
+        "shadowAtlas": "shadowAtlasSize",
+    }
+
+    def __init__(self, pipeline):
+        """ Creates a new policy for the given pipeline. This has to happen
+        before the resources are created, see plan() """
+        DebugObject.__init__(self, "MemoryPressurePolicy")
+        self.pipeline = pipeline
+        self.settings = pipeline.settings
+        self.budget = int(self.settings.vramBudget * 1024 * 1024)
+        self.lastTotal = None
+
+        # Name -> (category, list of values from best to lowest quality,
+        # function to predict the size of a value, function to apply a value
+        # to the created resource or None)
+        self.knobs = {}
+        self.knobOrder = []
+        self.levels = {}
+
+        self._createKnobs()
+
+    def _addKnob(self, name, category, values, predict, apply):
+        """ Internal method to add a knob, knobs with only one value are
+        skipped """
+        if len(values) < 2:
+            return
+        self.knobs[name] = (category, values, predict, apply)
+        self.knobOrder.append(name)
+        self.levels[name] = 0
+
+    def _halve(self, value, minimum):
+        """ Internal method returning the values from value down to minimum,
+        halving each step """
+        values = [value]
+        while values[-1] // 2 >= max(1, minimum):
+            values.append(values[-1] // 2)
+        return values
+
+    def _createKnobs(self):
+        """ Internal method to create the knobs for the enabled resources """
+        settings = self.settings
+
+        if settings.enableClouds:
+            # Resolutions have to stay a multiple of 8
+            resolutions = [r for r in self._halve(settings.cloudResolution, self.MinCloudResolution)
+                           if r % 8 == 0]
+            self._addKnob("clouds", "clouds", resolutions,
+                lambda resolution: resolution * resolution * 128 * 2,
+                lambda resolution: self.pipeline.cloudManager.setResolution(resolution))
+
+        if settings.useTransparency:
+            maxPixelCount = TransparencyManager.MaxPixelCount
+            self._addKnob("transparency", "other", self._halve(maxPixelCount, maxPixelCount // 4),
+                lambda count: count * 16,
+                lambda count: self.pipeline.transparencyManager.setMaxPixelCount(count))
+
+        if settings.enableGlobalIllumination:
+            levels = GlobalIllumination.QualityLevels
+            if settings.giQualityLevel in levels:
+                qualities = levels[:levels.index(settings.giQualityLevel) + 1][::-1]
+
+                # 3 generation textures, 6 data textures with a ping and pong
+                # copy each, and the solidness texture
+                self._addKnob("gi", "gi", qualities,
+                    lambda quality: GlobalIllumination.GridResolutions[levels.index(quality)] ** 3 * 86,
+                    None)
+
+        if settings.renderShadows:
+            self._addKnob("shadowAtlas", "shadows",
+                self._halve(settings.shadowAtlasSize, self.MinShadowAtlasSize),
+                lambda size: size * size * 4, None)
+
+        self.debug("Using knobs:", ", ".join(self.knobOrder))
+
+    def getLevels(self):
+        """ Returns a dictionary of knob -> current value """
+        return dict((name, self.knobs[name][1][self.levels[name]]) for name in self.knobOrder)
+
+    def plan(self):
+        """ Lowers the settings of the resources whose predicted size exceeds
+        the budget of their category. This has to be called before the
+        resources are created """
+        for name in self.knobOrder:
+            category, values, predict, apply = self.knobs[name]
+            budget = MemoryMonitor.getBudget(category)
+            if budget is None or name not in self.SettingKeys:
+                continue
+
+            level = 0
+            while level < len(values) - 1 and predict(values[level]) > budget:
+                level += 1
+
+            if level == 0:
+                continue
+
+            if predict(values[level]) > budget:
+                self.warn("The lowest size of", name, "still exceeds the", category, "budget")
+
+            self.levels[name] = level
+            self._applySetting(name, values[level])
+            self.debug("Lowered", name, "to", values[level], "to fit into the", category, "budget")
+
+    def _applySetting(self, name, value):
+        """ Internal method to store the value of a knob in the settings, so
+        the resource gets created with it """
+        self.settings.revertSetting(self.SettingKeys[name], value)
+
+    def check(self):
+        """ Lowers the resources which can be resized, until the measured
+        total fits into vramBudget. This should be called once the pipeline
+        has been created, and whenever resources were added """
+        total = MemoryMonitor.getEstimatedMemUsage()
+        if total == self.lastTotal:
+            return
+        self.lastTotal = total
+
+        if self.budget <= 0 or total <= self.budget:
+            return
+
+        for name in self.knobOrder:
+            category, values, predict, apply = self.knobs[name]
+            if apply is None:
+                continue
+
+            while total > self.budget and self.levels[name] < len(values) - 1:
+                value = values[self.levels[name] + 1]
+                if apply(value) is False:
+                    self.warn("Could not lower", name)
+                    break
+
+                self.levels[name] += 1
+                newTotal = MemoryMonitor.getEstimatedMemUsage()
+                self.debug("Lowered", name, "to", value, "and saved",
+                           round((total - newTotal) / (1024.0 * 1024.0), 1), "MB")
+                total = newTotal
+
+        self.lastTotal = total
+
+        if total > self.budget:
+            self.warn("Video memory usage of", round(total / (1024.0 * 1024.0), 1),
+                      "MB still exceeds the budget of", round(self.budget / (1024.0 * 1024.0), 1),
+                      "MB. Set budgets for the gi and shadows category to lower them too.")
+
+    def update(self):
+        """ Checks the budget again if resources were added. This should be
+        called once per frame """
+        self.check()
@@ -125,8 +125,8 @@ class MountManager(DebugObject):
         # Try removing the lockfile
         self._tryRemove(self.lockFile)
 
-        # Try removing the shader auto config
-        self._tryRemove(join(self.writePath, "ShaderAutoConfig.include"))
+        # The shader auto config is kept, so the shader caches stay valid on
+        # the next start
 
         # Check for further tempfiles in the write path
         for f in os.listdir(self.writePath):
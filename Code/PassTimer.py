@@ -0,0 +1,149 @@
+import math
+
+from collections import deque
+
+from panda3d.core import PStatCollector, PStatClient
+
+from Code.DebugObject import DebugObject
+from Code.Globals import Globals
+
+
+class PassTimer(DebugObject):
+
+    """ This class measures the time each render pass takes. The cpu time is
+    the time spent in preRenderUpdate of the pass, which is also shown in
+    pstats as App:RenderPasses:<PassID>. The gpu time is the sum of the draw
+    times of all buffers of a pass. It is only available when pstats is
+    connected and pstats-gpu-timing is enabled, as panda only records gpu
+    timer queries in that case.
+
+    The last numSamples frames of each pass are kept, getTimings() computes
+    the averages and percentiles over them. """
+
+    def __init__(self, numSamples=120):
+        """ Creates a new timer, keeping the given amount of frames """
+        DebugObject.__init__(self, "PassTimer")
+        self.numSamples = numSamples
+        self.collectors = {}
+        self.cpuSamples = {}
+        self.gpuSamples = {}
+        self.bufferToPass = {}
+        self._collectorToPass = {}
+
+    def registerPasses(self, renderPasses):
+        """ Creates the collectors and sample storage for the given passes.
+        Has to be called after the passes were created, as the buffers of the
+        passes are used to assign the gpu timings """
+        self.bufferToPass = {}
+        self._collectorToPass = {}
+
+        for renderPass in renderPasses:
+            passID = renderPass.getID()
+
+            if passID not in self.collectors:
+                self.collectors[passID] = PStatCollector("App:RenderPasses:" + passID)
+                self.cpuSamples[passID] = deque(maxlen=self.numSamples)
+                self.gpuSamples[passID] = deque(maxlen=self.numSamples)
+
+            for target in renderPass.getRenderTargets():
+                self.bufferToPass[target.getName()] = passID
+
+    def startPass(self, passID):
+        """ Starts measuring the cpu time of a pass """
+        self.collectors[passID].start()
+        return Globals.clock.getRealTime()
+
+    def stopPass(self, passID, startTime):
+        """ Stops measuring the cpu time of a pass, startTime should be the
+        value returned by startPass """
+        self.cpuSamples[passID].append(Globals.clock.getRealTime() - startTime)
+        self.collectors[passID].stop()
+
+    def _getPassForCollector(self, client, collectorIndex):
+        """ Internal method to find the pass of a gpu collector. The draw
+        collectors are named Draw:<BufferName>:dr_<N>. The result is cached,
+        so the names only have to be parsed once """
+        if collectorIndex not in self._collectorToPass:
+            parts = client.getCollector(collectorIndex).getFullname().split(":")
+            passID = None
+            if len(parts) >= 2:
+                passID = self.bufferToPass.get(parts[-2], None)
+            self._collectorToPass[collectorIndex] = passID
+
+        return self._collectorToPass[collectorIndex]
+
+    def collectGpuTimes(self):
+        """ Reads the gpu timer queries of the last frame, and stores the time
+        of each pass. Does nothing when pstats is not connected """
+
+        client = PStatClient.getGlobalPstats()
+        if not client.isConnected():
+            return
+
+        gpuData = Globals.base.win.getGsg().getPstatsGpuData()
+        numEvents = gpuData.getNumEvents()
+
+        if numEvents < 1:
+            return
+
+        durations = {}
+        lastStarts = {}
+
+        for eventIdx in range(numEvents):
+            collectorIdx = gpuData.getTimeCollector(eventIdx)
+            passID = self._getPassForCollector(client, collectorIdx)
+
+            if passID is None:
+                continue
+
+            if gpuData.isStart(eventIdx):
+                lastStarts[collectorIdx] = gpuData.getTime(eventIdx)
+            elif collectorIdx in lastStarts:
+                duration = gpuData.getTime(eventIdx) - lastStarts.pop(collectorIdx)
+                durations[passID] = durations.get(passID, 0.0) + duration
+
+        for passID, duration in durations.items():
+            self.gpuSamples[passID].append(duration)
+
+    def _summarize(self, samples):
+        """ Internal method to compute the average and percentiles of a list
+        of samples in seconds. Returns a dictionary with the values in
+        milliseconds, or None if there are no samples """
+        if len(samples) < 1:
+            return None
+
+        ordered = sorted(samples)
+        count = len(ordered)
+
+        # Nearest rank percentile
+        def percentile(p):
+            return ordered[max(0, int(math.ceil(p * count)) - 1)] * 1000.0
+
+        return {
+            "avg": sum(ordered) / count * 1000.0,
+            "min": ordered[0] * 1000.0,
+            "max": ordered[-1] * 1000.0,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "samples": count,
+        }
+
+    def getTimings(self):
+        """ Returns a dictionary with the timings of each pass. Each entry
+        contains a "cpu" and a "gpu" dictionary with the keys avg, min, max,
+        p50, p95, p99 (all in milliseconds) and samples, or None when no
+        samples were recorded yet """
+        timings = {}
+        for passID in self.collectors:
+            timings[passID] = {
+                "cpu": self._summarize(self.cpuSamples[passID]),
+                "gpu": self._summarize(self.gpuSamples[passID]),
+            }
+        return timings
+
+    def reset(self):
+        """ Clears all recorded samples """
+        for passID in self.collectors:
+            self.cpuSamples[passID].clear()
+            self.gpuSamples[passID].clear()
@@ -19,6 +19,8 @@ class PipelineSettingsManager(SettingsManager):
         self._addSetting("preventMultipleInstances", bool, False)
         self._addSetting("resolution3D", float, 1.0)
         self._addSetting("stateCacheClearInterval", float, 0.2)
+        self._addSetting("effectCacheSize", int, 64)
+        self._addSetting("maxCachedEffects", int, 64)
 
         # [Rendering]
         self._addSetting("enableEarlyZ", bool, True)
@@ -41,6 +43,8 @@ class PipelineSettingsManager(SettingsManager):
         self._addSetting("useColorCorrection", bool, True)
         self._addSetting("enableAlphaTestedShadows", bool, True)
         self._addSetting("useDiffuseAntialiasing", bool, True)
+        self._addSetting("iesTableResolution", int, 256)
+        self._addSetting("iesHorizontalResolution", int, 32)
 
         # [Scattering]
         self._addSetting("enableScattering", bool, False)
@@ -93,6 +97,7 @@ class PipelineSettingsManager(SettingsManager):
 
         # [Clouds]
         self._addSetting("enableClouds", bool, False)
+        self._addSetting("cloudResolution", int, 768)
 
         # [Bloom]
         self._addSetting("enableBloom", bool, False)
@@ -100,9 +105,32 @@ class PipelineSettingsManager(SettingsManager):
         # [Depth of Field]
         self._addSetting("enableDOF", bool, True)
 
+        # [Quality Governor]
+        self._addSetting("enableQualityGovernor", bool, False)
+        self._addSetting("governorFrameBudget", float, 16.6)
+        self._addSetting("governorHeadroom", float, 0.8)
+        self._addSetting("governorMinShadowUpdates", int, 1)
+        self._addSetting("governorMaxGIInterval", int, 4)
+        self._addSetting("governorAllowShaderReloads", bool, False)
+        self._addSetting("governorMinPCFSamples", int, 8)
+        self._addSetting("governorMinOcclusionSamples", int, 2)
+
+        # [Memory]
+        self._addSetting("vramBudgetShadows", float, 0.0)
+        self._addSetting("vramBudgetGI", float, 0.0)
+        self._addSetting("vramBudgetPost", float, 0.0)
+        self._addSetting("vramBudgetClouds", float, 0.0)
+        self._addSetting("memorySampleInterval", float, 1.0)
+        self._addSetting("enableMemoryPressurePolicy", bool, False)
+        self._addSetting("vramBudget", float, 0.0)
+
         # [Debugging]
         self._addSetting("displayOnscreenDebugger", bool, False)
         self._addSetting("displayDebugStats", bool, True)
         self._addSetting("displayPerformanceOverlay", bool, True)
         self._addSetting("pipelineOutputLevel", str, "debug")
         self._addSetting("useDebugAttachments", bool, False)
+        self._addSetting("writeEffectShaders", bool, False)
+        self._addSetting("enableShaderHotReload", bool, False)
+        self._addSetting("shaderHotReloadInterval", float, 0.5)
+        self._addSetting("enableSettingsReload", bool, False)
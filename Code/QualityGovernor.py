@@ -0,0 +1,234 @@
+from collections import deque
+
+from Code.DebugObject import DebugObject
+from Code.Globals import Globals
+
+
+class QualityGovernor(DebugObject):
+
+    """ This class watches the frame time and lowers the quality when the
+    frame budget is missed, and raises it again when there is enough
+    headroom. Only knobs which are cheap to change at runtime are used, each
+    within the bounds given in the settings:
+
+        shadowUpdates:      Shadow maps updated per frame, from
+                            maxShadowUpdatesPerFrame down to
+                            governorMinShadowUpdates
+        giInterval:         Every how many frames the gi gets processed, from
+                            1 up to governorMaxGIInterval
+        sslr:               Disables the SSLR pass
+        pcfSamples:         Halves numPCFSamples down to governorMinPCFSamples
+        occlusionSamples:   Halves occlusionSampleCount down to
+                            governorMinOcclusionSamples
+
+    The last two require a shader reload, and are only used when
+    governorAllowShaderReloads is set.
+
+    The frame time is averaged over the last frames. The quality is lowered
+    when the average is over budget for downDelay seconds, and raised when it
+    is below budget * governorHeadroom for upDelay seconds. After each change
+    the samples are cleared, so the next decision is based on frames rendered
+    with the new settings only. When a raised knob has to be lowered again
+    shortly after, upDelay is doubled, which prevents oscillating between two
+    levels.
+
+    The knob to lower is the one whose pass has the highest gpu time, if gpu
+    timings are available, otherwise the knobs are lowered in the order
+    listed above. Raising undoes the last lowering. """
+
+    def __init__(self, pipeline, numSamples=60):
+        """ Creates a new governor for the given pipeline, averaging the frame
+        time over numSamples frames """
+        DebugObject.__init__(self, "QualityGovernor")
+        self.pipeline = pipeline
+        self.settings = pipeline.settings
+        self.frameTimes = deque(maxlen=numSamples)
+
+        self.downDelay = 0.5
+        self.baseUpDelay = 3.0
+        self.upDelay = self.baseUpDelay
+        self.maxUpDelay = 60.0
+
+        self.overBudgetTime = 0.0
+        self.underBudgetTime = 0.0
+        self.time = 0.0
+        self.lastRaise = None
+
+        # Name -> [pass id, list of values from best to lowest quality, apply function]
+        self.knobs = {}
+        self.knobOrder = []
+        self.levels = {}
+        self.lowered = []
+
+        self._createKnobs()
+
+    def _addKnob(self, name, passID, values, apply):
+        """ Internal method to add a knob, knobs with only one value are
+        skipped """
+        if len(values) < 2:
+            return
+        self.knobs[name] = (passID, values, apply)
+        self.knobOrder.append(name)
+        self.levels[name] = 0
+
+    def _halve(self, value, minimum):
+        """ Internal method returning the values from value down to minimum,
+        halving each step """
+        values = [value]
+        while values[-1] // 2 >= max(1, minimum):
+            values.append(values[-1] // 2)
+        return values
+
+    def _createKnobs(self):
+        """ Internal method to create the knobs which can be used with the
+        current pipeline configuration """
+        settings = self.settings
+        renderPassManager = self.pipeline.getRenderPassManager()
+
+        self._addKnob("shadowUpdates", "ShadowScenePass",
+            self._halve(settings.maxShadowUpdatesPerFrame, settings.governorMinShadowUpdates),
+            self.pipeline.lightManager.setMaxShadowUpdates)
+
+        if self.pipeline.globalIllum:
+            self._addKnob("giInterval", "VoxelizePass",
+                list(range(1, settings.governorMaxGIInterval + 1)),
+                self.pipeline.globalIllum.setUpdateInterval)
+
+        if renderPassManager.isPassActive("SSLRPass"):
+            self._addKnob("sslr", "SSLRPass", [True, False],
+                lambda enabled: renderPassManager.setPassEnabled("SSLRPass", enabled))
+
+        if settings.governorAllowShaderReloads:
+            self._addKnob("pcfSamples", "ShadowedLightsPass",
+                self._halve(settings.numPCFSamples, settings.governorMinPCFSamples),
+                lambda samples: self._applySetting("numPCFSamples", samples))
+
+            if renderPassManager.isPassActive("AmbientOcclusionPass"):
+                self._addKnob("occlusionSamples", "AmbientOcclusionPass",
+                    self._halve(settings.occlusionSampleCount, settings.governorMinOcclusionSamples),
+                    lambda samples: self._applySetting("occlusionSampleCount", samples))
+
+        self.debug("Using knobs:", ", ".join(self.knobOrder))
+
+    def _applySetting(self, key, value):
+        """ Internal method to change a setting which is a shader define """
+        self.pipeline.settingsReloader.applySettings({key: value})
+
+    def getLevels(self):
+        """ Returns a dictionary of knob -> current value """
+        return dict((name, self.knobs[name][1][self.levels[name]]) for name in self.knobOrder)
+
+    def getAverageFrameTime(self):
+        """ Returns the average frame time in milliseconds over the last frames,
+        or None when not enough frames were recorded since the last change """
+        if len(self.frameTimes) < self.frameTimes.maxlen:
+            return None
+        return sum(self.frameTimes) / len(self.frameTimes)
+
+    def update(self):
+        """ Records the last frame time, and changes the quality if required.
+        This should be called once per frame """
+        frameTime = Globals.clock.getDt()
+        self.time += frameTime
+        self.frameTimes.append(frameTime * 1000.0)
+
+        average = self.getAverageFrameTime()
+        if average is None:
+            return
+
+        budget = self.settings.governorFrameBudget
+
+        if average > budget:
+            self.overBudgetTime += frameTime
+            self.underBudgetTime = 0.0
+        elif average < budget * self.settings.governorHeadroom:
+            self.underBudgetTime += frameTime
+            self.overBudgetTime = 0.0
+        else:
+            self.overBudgetTime = 0.0
+            self.underBudgetTime = 0.0
+
+        if self.overBudgetTime >= self.downDelay:
+            self._lower(average)
+        elif self.underBudgetTime >= self.upDelay:
+            self._raise(average)
+
+    def _getKnobCost(self, name, timings):
+        """ Internal method to get the gpu time of the pass of a knob """
+        passTimings = timings.get(self.knobs[name][0], None)
+        if passTimings is None or passTimings["gpu"] is None:
+            return None
+        return passTimings["gpu"]["avg"]
+
+    def _lower(self, average):
+        """ Internal method to lower the quality by one step """
+        candidates = [name for name in self.knobOrder
+                      if self.levels[name] < len(self.knobs[name][1]) - 1]
+
+        if len(candidates) < 1:
+            self._resetSamples()
+            return
+
+        # Prefer the knob with the most expensive pass, if gpu timings are
+        # available
+        timings = self.pipeline.getRenderPassManager().getPassTimings()
+        costs = [(self._getKnobCost(name, timings), name) for name in candidates]
+        measured = [entry for entry in costs if entry[0] is not None]
+        name = max(measured)[1] if len(measured) > 0 else candidates[0]
+
+        # Oscillation, the last raise did not fit into the budget
+        if self.lastRaise is not None and self.time - self.lastRaise < self.upDelay * 2.0:
+            self.upDelay = min(self.maxUpDelay, self.upDelay * 2.0)
+            self.debug("Raising the quality is delayed to", self.upDelay, "seconds")
+
+        if not self._setLevel(name, self.levels[name] + 1):
+            return
+
+        self.lowered.append(name)
+        self.debug("Frame time", round(average, 2), "ms is over budget, lowered", name,
+                   "to", self.getLevels()[name])
+
+    def _raise(self, average):
+        """ Internal method to undo the last lowering """
+        if len(self.lowered) < 1:
+            self._resetSamples()
+            return
+
+        name = self.lowered.pop()
+        if not self._setLevel(name, self.levels[name] - 1):
+            return
+
+        self.lastRaise = self.time
+        self.debug("Frame time", round(average, 2), "ms has headroom, raised", name,
+                   "to", self.getLevels()[name])
+
+    def _setLevel(self, name, level):
+        """ Internal method to apply a level of a knob, returns False if the
+        knob could not be changed """
+        passID, values, apply = self.knobs[name]
+        self._resetSamples()
+
+        if apply(values[level]) is False:
+            # The knob can not be changed, e.g. the pass can not be disabled
+            self.warn("Could not change", name + ", not using it anymore")
+            if name in self.knobOrder:
+                self.knobOrder.remove(name)
+            return False
+
+        self.levels[name] = level
+        return True
+
+    def _resetSamples(self):
+        """ Internal method to start measuring again, after a change """
+        self.frameTimes.clear()
+        self.overBudgetTime = 0.0
+        self.underBudgetTime = 0.0
+
+    def reset(self):
+        """ Restores the full quality of all knobs """
+        for name in list(self.knobOrder):
+            if self.levels[name] != 0:
+                self._setLevel(name, 0)
+        self.lowered = []
+        self.upDelay = self.baseUpDelay
+        self.lastRaise = None
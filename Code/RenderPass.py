@@ -1,5 +1,6 @@
 
 from Code.DebugObject import DebugObject
+from Code.RenderTarget import RenderTarget
 
 
 class RenderPass(DebugObject):
@@ -54,6 +55,25 @@ class RenderPass(DebugObject):
         the RenderPass """
         pass
 
+    def getRenderTargets(self):
+        """ Returns all RenderTargets of this pass. By default, all RenderTargets
+        stored as class attributes (or in lists) are returned """
+        renderTargets = []
+        for attribute in self.__dict__.values():
+            targets = attribute if type(attribute) == list else [attribute]
+            for target in targets:
+                if isinstance(target, RenderTarget):
+                    renderTargets.append(target)
+        return renderTargets
+
+    def setActive(self, active):
+        """ This method gets called when the pass gets enabled or disabled at
+        runtime. By default, all RenderTargets of the pass get activated /
+        deactivated. Passes rendering in another way should override this
+        method """
+        for target in self.getRenderTargets():
+            target.setActive(active)
+
     def setShaderInput(self, name, value, *args):
         """ This method will get called for every input specified in
         getRequiredInputs. By default, it is a assumed that the default render
@@ -1,10 +1,14 @@
-import time
+import heapq
+import hashlib
 
 from panda3d.core import Shader
-from direct.stdpy.file import open
+from direct.stdpy.file import open, isfile
 
 from Code.DebugObject import DebugObject
 from Code.Globals import Globals
+from Code.TransientTexturePool import TransientTexturePool
+from Code.PassTimer import PassTimer
+from Code.ShaderIncludeResolver import ShaderIncludeResolver
 
 
 class RenderPassManager(DebugObject):
@@ -20,6 +24,16 @@ class RenderPassManager(DebugObject):
         self.staticVariables = {}
         self.dynamicVariables = {}
         self.defines = {}
+        self.rootPasses = set()
+        self.prunedPasses = {}
+        self.disabledPasses = set()
+        self._createdPasses = []
+        self._variableConsumers = {}
+        self.passTimer = PassTimer()
+        self._autoconfigHash = None
+        self._cacheBustCounter = 0
+        self.shaderWatcher = None
+        self._includeResolver = ShaderIncludeResolver()
 
     def registerPass(self, renderPass):
         """ Register a new RenderPass """
@@ -28,6 +42,29 @@ class RenderPassManager(DebugObject):
             return False
         self.renderPasses[renderPass.getID()] = renderPass
 
+    def markRootPass(self, passID):
+        """ Marks a pass as root, that means it will never get pruned, even if
+        no other pass requires its outputs. Passes without outputs (like the
+        final pass) are always treated as roots, as they only exist for their
+        side effects """
+        self.rootPasses.add(passID)
+
+    def isPassActive(self, passID):
+        """ Returns whether a pass with the given ID got created, that is it
+        was registered and not pruned """
+        return passID in self.renderPasses and passID not in self.prunedPasses
+
+    def getPrunedPasses(self):
+        """ Returns a list of the IDs of all passes which were pruned because
+        nothing consumed their outputs """
+        return list(self.prunedPasses.keys())
+
+    def setShaderWatcher(self, watcher):
+        """ Sets a ShaderFileWatcher. When set, the shader files of each pass
+        are watched, and only the passes using a modified file reload their
+        shaders """
+        self.shaderWatcher = watcher
+
     def registerStaticVariable(self, name, value):
         """ Registers a new static variable. Static variables are bound by value,
         that means you have to know the value when binding it (except when using a PTA) """
@@ -51,39 +88,48 @@ class RenderPassManager(DebugObject):
             del self.defines[name]
 
     def updateStaticVariable(self, name, value):
-        """ Iterates over all passes, updating the shader input for that variable """
-        raise NotImplementedError()
+        """ Changes the value of a static variable, and updates the shader input
+        on all passes consuming that variable. Only the inputs bound to the
+        variable get updated, so this is cheap enough to call at runtime, e.g.
+        to swap a texture """
+        if name not in self.staticVariables:
+            self.error("Cannot update unkown static variable", name)
+            return False
+
+        self.staticVariables[name] = value
+
+        for renderPass, inputID in self._variableConsumers.get(name, []):
+            renderPass.setShaderInput(inputID, value)
+
+        return True
 
     def updateDynamicVariable(self, name, handler=None):
-        """ Iterates over all passes, calling the handler of that variable. If
+        """ Calls the handler of that variable for all passes consuming it. If
         no new handler is specified, the old hander will be taken, otherwise the
         handler will get replaced """
-        raise NotImplementedError()
+        if name not in self.dynamicVariables:
+            self.error("Cannot update unkown dynamic variable", name)
+            return False
 
-    def _havePass(self, name):
-        """ Internal method to check if a render pass exists """
-        return name in self.renderPasses
+        if handler is not None:
+            self.dynamicVariables[name] = handler
 
-    def _canAttach(self, renderPass):
-        """ Internal method to check if all required inputs are set for a pass
-        during the sorting algorithm """
+        handler = self.dynamicVariables[name]
 
-        # Iterate over all inputs of the pass
-        inputs = renderPass.getRequiredInputs()
-        for inputID, inputSource in inputs.items():
-            firstInput = self._getFirstAvailableInput(inputSource, checkVariables = False)
-            if not firstInput:
-                # self.debug("HINT:Missing",inputSource, "for", renderPass.getID())
-                return False
+        for renderPass, inputID in self._variableConsumers.get(name, []):
+            handler(renderPass, inputID)
 
         return True
 
-    def _makeUniformsAvailable(self, renderPass):
-        """ Internal method to register all outputs of a RenderPass to the list
-        of already inserted outputs during sorting algorithm """
-        outputs = renderPass.getOutputs().keys()
-        for outputID in outputs:
-            self._availableUniformNames.append(outputID)
+    def getVariableConsumers(self, name):
+        """ Returns a list of (passID, inputID) tuples of all inputs which are
+        bound to the given variable """
+        return [(renderPass.getID(), inputID) for renderPass, inputID in
+                self._variableConsumers.get(name, [])]
+
+    def _havePass(self, name):
+        """ Internal method to check if a render pass exists """
+        return name in self.renderPasses
 
     def _checkVariableAvailable(self, variableName):
         """ Internal method to check if a variable was specified by the user """
@@ -92,45 +138,272 @@ class RenderPassManager(DebugObject):
             return True
         return False
 
-    def _getFirstAvailableInput(self, inputList, checkVariables=True):
-        """ Internal method to choose the first available uniform from a list of
-        uniforms """
-        if type(inputList) == list:
+    def _collectProducers(self):
+        """ Internal method to build a map from each output name to the ID of
+        the pass producing it. When multiple passes produce the same output,
+        the last registered pass is used. Disabled passes produce nothing """
+        producers = {}
+        for passID, renderPass in self.renderPasses.items():
+            if passID in self.disabledPasses:
+                continue
+            for outputName in renderPass.getOutputs():
+                if outputName in producers:
+                    self.warn("Output", outputName, "is produced by",
+                              producers[outputName], "and", passID)
+                producers[outputName] = passID
+        return producers
+
+    def _resolveInput(self, inputSource, producers):
+        """ Internal method to choose the source of an input. When a list is
+        given, the first entry which is either produced by a registered pass or
+        an available variable is choosen. Returns None if no source is
+        available """
+        candidates = inputSource if type(inputSource) == list else [inputSource]
+
+        for entry in candidates:
+            if entry in producers:
+                return entry
+            if entry.startswith("Variables.") and self._checkVariableAvailable(entry):
+                return entry
+
+        return None
+
+    def _buildGraph(self):
+        """ Internal method to build the pass dependency graph. For each pass,
+        all required inputs get resolved once. Returns the edges as a dictionary
+        from pass ID to the set of IDs of the passes which depend on it, aswell
+        as a list of (passID, inputID, inputSource) of inputs which could not be
+        resolved. Also stores for each pass the IDs of all passes producing
+        any of the alternatives of its inputs, as these could be used when
+        passes get disabled later on """
+
+        producers = self._collectProducers()
+        self._producers = producers
+
+        self._resolvedInputs = {}
+        self._dependencies = {}
+        self._candidateProducers = {}
+        edges = {passID: set() for passID in self.renderPasses}
+        missing = []
+
+        for passID, renderPass in self.renderPasses.items():
+            resolved = {}
+            dependencies = set()
+            candidates = set()
 
-            waitForPass = False
+            for inputID, inputSource in renderPass.getRequiredInputs().items():
+                inputKey = self._resolveInput(inputSource, producers)
 
-            for entry in inputList:
-                passName = entry.split(".")[0]
+                for entry in (inputSource if type(inputSource) == list else [inputSource]):
+                    if entry in producers and producers[entry] != passID:
+                        candidates.add(producers[entry])
 
-                if entry in self._availableUniformNames:
-                    if waitForPass and not checkVariables:
-                        return False
-                    return entry
+                if inputKey is None:
+                    missing.append((passID, inputID, inputSource))
+                    continue
 
-                if self._havePass(passName):
-                    waitForPass = True
-                
-                if passName == "Variables" and self._checkVariableAvailable(entry):
-                    if waitForPass and not checkVariables:
-                        return False 
+                resolved[inputID] = inputKey
+
+                if inputKey in producers:
+                    producerID = producers[inputKey]
+                    if producerID != passID:
+                        dependencies.add(producerID)
+                        edges[producerID].add(passID)
+
+            self._resolvedInputs[passID] = resolved
+            self._dependencies[passID] = dependencies
+            self._candidateProducers[passID] = candidates
+
+        return edges, missing
+
+    def _findRoots(self):
+        """ Internal method to collect the IDs of all root passes. Roots are
+        the passes explicitely marked with markRootPass, and all passes which
+        have no outputs. Disabled passes are never roots """
+        roots = set()
+        for passID, renderPass in self.renderPasses.items():
+            if passID in self.disabledPasses:
+                continue
+            if passID in self.rootPasses or len(renderPass.getOutputs()) == 0:
+                roots.add(passID)
+        return roots
+
+    def _prunePasses(self):
+        """ Internal method to remove all passes which are not reachable from
+        any root pass, by walking the required inputs backwards. Pruned passes
+        never get created, so they neither allocate render targets nor render.
+        Has to be called after _buildGraph """
+
+        reachable = self._findRoots()
+        stack = list(reachable)
+
+        while stack:
+            passID = stack.pop()
+            for dependencyID in self._dependencies[passID]:
+                if dependencyID not in reachable:
+                    reachable.add(dependencyID)
+                    stack.append(dependencyID)
+
+        self.prunedPasses = {}
+        for passID, renderPass in self.renderPasses.items():
+            if passID not in reachable:
+                self.prunedPasses[passID] = renderPass
+
+        if self.prunedPasses:
+            self.debug("Pruned unused passes:", ", ".join(sorted(self.prunedPasses)))
+
+    def _findCycle(self, passIDs):
+        """ Internal method to find a dependency cycle within the given set of
+        pass IDs. Returns the cycle as list of pass IDs, or an empty list """
+        visited = set()
+
+        for startID in sorted(passIDs):
+            if startID in visited:
+                continue
+
+            # Iterative depth first search, keeping the current path
+            path = [startID]
+            pathSet = set(path)
+            iterators = [iter(sorted(self._dependencies[startID] & passIDs))]
+            visited.add(startID)
+
+            while iterators:
+                nextID = next(iterators[-1], None)
+
+                if nextID is None:
+                    iterators.pop()
+                    pathSet.discard(path.pop())
+                    continue
 
-                    return entry                    
+                if nextID in pathSet:
+                    return path[path.index(nextID):] + [nextID]
 
-            # self.warn("No input of",inputList,"is available yet")
-            return False
+                if nextID not in visited:
+                    visited.add(nextID)
+                    path.append(nextID)
+                    pathSet.add(nextID)
+                    iterators.append(iter(sorted(self._dependencies[nextID] & passIDs)))
 
-        if inputList in self._availableUniformNames:
-            return inputList
+        return []
 
-        if inputList.startswith("Variables.") and  self._checkVariableAvailable(inputList):
-            return inputList
+    def _sortPasses(self):
+        """ Internal method to bring the passes into an order in which they can
+        be executed sequentially, using Kahn's algorithm. Passes which have no
+        dependencies on each other keep the order in which they were registered.
+        Passes which are not required by any root pass get pruned first.
+        Returns False if a cycle or missing inputs were found, after reporting
+        them """
 
-        return False
+        edges, missing = self._buildGraph()
+        self._prunePasses()
+
+        # Inputs of pruned passes don't matter, as they never get created
+        missing = [entry for entry in missing if entry[0] not in self.prunedPasses]
+
+        for passID, inputID, inputSource in missing:
+            self.error("Pass", passID, "has no source for input", inputID,
+                       "(" + str(inputSource) + ")")
+
+        registrationIndex = {passID: index for index, passID in enumerate(self.renderPasses)}
+        inDegree = {passID: len(deps) for passID, deps in self._dependencies.items()
+                    if passID not in self.prunedPasses}
+
+        queue = [(registrationIndex[passID], passID) for passID, degree in inDegree.items() if degree == 0]
+        heapq.heapify(queue)
+
+        self._sortedNodes = []
+
+        while queue:
+            index, passID = heapq.heappop(queue)
+            self._sortedNodes.append(self.renderPasses[passID])
+
+            for dependentID in edges[passID]:
+                if dependentID in self.prunedPasses:
+                    continue
+                inDegree[dependentID] -= 1
+                if inDegree[dependentID] == 0:
+                    heapq.heappush(queue, (registrationIndex[dependentID], dependentID))
+
+        unsorted = set(inDegree) - set(p.getID() for p in self._sortedNodes)
+
+        if unsorted:
+            cycle = self._findCycle(unsorted)
+            if cycle:
+                self.error("Found cyclic pass dependency (pass -> required pass):",
+                           " -> ".join(cycle))
+            self.error("Could not sort passes:", ", ".join(sorted(unsorted)))
+
+        return len(missing) == 0 and len(unsorted) == 0
+
+    def _computeLifetimes(self):
+        """ Internal method to compute for each sorted pass the index of the
+        last pass which reads, or could read after disabling passes, any of its
+        outputs. Passes whose outputs are never read (like root passes) live
+        until the end of the frame. Has to be called after _sortPasses """
+        sortedIndex = {}
+        for index, renderPass in enumerate(self._sortedNodes):
+            sortedIndex[renderPass.getID()] = index
+
+        lifetimes = {}
+        for passID, index in sortedIndex.items():
+            lifetimes[passID] = index
+
+        for passID, index in sortedIndex.items():
+            for dependencyID in self._candidateProducers[passID]:
+                if dependencyID in lifetimes:
+                    lifetimes[dependencyID] = max(lifetimes[dependencyID], index)
+
+        for passID, index in sortedIndex.items():
+            if lifetimes[passID] == index and len(self.renderPasses[passID].getOutputs()) > 0:
+                lifetimes[passID] = len(self._sortedNodes)
+
+        return lifetimes
+
+    def exportGraphDot(self, filename=None, includeVariables=False):
+        """ Generates the pass dependency graph in the graphviz DOT format and
+        returns it. If filename is given, the graph is also written to that
+        file. Has to be called after createPasses. Pruned passes are drawn
+        dashed. When includeVariables is True, the variables bound to each pass
+        are included aswell """
+
+        output = "digraph RenderPasses {\n"
+        output += "    rankdir=LR;\n"
+        output += "    node [shape=box];\n\n"
+
+        producers = self._producers
+
+        for index, renderPass in enumerate(self._sortedNodes):
+            output += '    "' + renderPass.getID() + '" [label="' + \
+                str(index) + ": " + renderPass.getID() + '"];\n'
+
+        output += "\n"
+
+        for passID in self.prunedPasses:
+            output += '    "' + passID + '" [style=dashed];\n'
+
+        for passID in self.renderPasses:
+            for inputID, inputKey in sorted(self._resolvedInputs.get(passID, {}).items()):
+                if inputKey in producers:
+                    output += '    "' + producers[inputKey] + '" -> "' + passID + \
+                        '" [label="' + inputKey.split(".")[-1] + '"];\n'
+                elif includeVariables:
+                    output += '    "' + inputKey + '" [shape=ellipse];\n'
+                    output += '    "' + inputKey + '" -> "' + passID + '";\n'
+
+        output += "}\n"
+
+        if filename is not None:
+            with open(filename, "w") as handle:
+                handle.write(output)
+
+        return output
 
     def anyPassRequires(self, uniformName):
         """ Checks if any of the currently attached passes requires an uniform
         with that name """
-        for renderPass in self.renderPasses.values():
+        for passID, renderPass in self.renderPasses.items():
+            if passID in self.prunedPasses:
+                continue
             inputs = renderPass.getRequiredInputs()
             if uniformName in inputs.values():
                 return True
@@ -140,7 +413,9 @@ class RenderPassManager(DebugObject):
     def anyPassProduces(self, uniformName):
         """ Checks if any of the currently attached passes produces an uniform
         with that name """
-        for renderPass in self.renderPasses.values():
+        for passID, renderPass in self.renderPasses.items():
+            if passID in self.prunedPasses:
+                continue
             outputs = renderPass.getOutputs()
             if uniformName in outputs.keys():
                 return True
@@ -154,126 +429,322 @@ class RenderPassManager(DebugObject):
 
         # Fetch all shader objects
         for renderPass in self._sortedNodes:
-            generatedShaders += renderPass.setShaders()
+            generatedShaders += self._setPassShaders(renderPass)
 
         # Check if they compiled properly
         # for shader in generatedShaders:
             # print shader.getErrorFlag(), " " *10 , shader.getFilename(Shader.STFragment)
         self.debug("Regenerated", len(generatedShaders),"Shaders!")
 
+    def _setPassShaders(self, renderPass):
+        """ Internal method to set the shaders of a pass, and watch the files
+        they were loaded from, when a shader watcher is set. Returns the list
+        of created shaders """
+        shaders = renderPass.setShaders()
+
+        if self.shaderWatcher is None:
+            return shaders
+
+        dependencies = set()
+        for shader in shaders:
+            for shaderType in [Shader.STVertex, Shader.STFragment, Shader.STGeometry,
+                               Shader.STTessControl, Shader.STTessEvaluation,
+                               Shader.STCompute]:
+                filename = shader.getFilename(shaderType).getFullpath()
+                if len(filename) > 0:
+                    dependencies |= self._includeResolver.getDependencies(filename)
+
+        self.shaderWatcher.watch(renderPass, dependencies,
+            lambda changedFiles: self._onPassFilesChanged(renderPass))
+
+        return shaders
+
+    def _onPassFilesChanged(self, renderPass):
+        """ Internal method which gets called by the shader watcher when a file
+        used by the shaders of a pass changed. Inactive passes get their
+        shaders set when they are activated again """
+        if renderPass not in self._activePasses:
+            return
+
+        self.debug("Reloading shaders of", renderPass.getID())
+        self._setPassShaders(renderPass)
+
     def preRenderUpdate(self):
-        """ Calls the preRenderUpdate on each assigned pass """
+        """ Calls the preRenderUpdate on each assigned pass, measuring the time
+        each pass takes """
         for renderPass in self._sortedNodes:
+            passID = renderPass.getID()
+            startTime = self.passTimer.startPass(passID)
             renderPass.preRenderUpdate()
+            self.passTimer.stopPass(passID, startTime)
 
-    def writeAutoconfig(self):
+        self.passTimer.collectGpuTimes()
+
+    def getPassTimings(self):
+        """ Returns the cpu and gpu timings of all created passes, averaged over
+        the last frames. See PassTimer.getTimings for the format """
+        return self.passTimer.getTimings()
+
+    def writeAutoconfig(self, bustCache=False):
         """ Writes the shader auto config, based on the defines specified by the
-        different passes """
+        different passes. The file only gets written when the defines changed,
+        so the shader caches of panda and the driver stay valid. When bustCache
+        is True, a counter is added to the file, which forces all shaders to
+        get recompiled. Returns True if the file was written """
 
-        self.debug("Writing shader autoconfig")
+        if bustCache:
+            self._cacheBustCounter += 1
+
+        # Generate the defines, the hash only depends on them
+        defines = ""
+        for key, value in sorted(self.defines.items()):
+            defines += "#define " + key + " " + str(value) + "\n"
+
+        if self._cacheBustCounter > 0:
+            defines += "#define SHADER_CACHE_BUST " + str(self._cacheBustCounter) + "\n"
+
+        configHash = hashlib.sha1(defines.encode("utf-8")).hexdigest()
 
         # Generate autoconfig as string
         output = "#pragma once\n"
         output += "// Autogenerated by RenderingPipeline\n"
-        output += "// Do not edit! Your changes will be lost.\n\n"
-
-        for key, value in sorted(self.defines.items()):
-            output += "#define " + key + " " + str(value) + "\n"
+        output += "// Do not edit! Your changes will be lost.\n"
+        output += "// Hash: " + configHash + "\n\n"
+        output += defines
+
+        # Check if the file is still up to date, either from an earlier call
+        # or from the last start
+        configFile = "PipelineTemp/ShaderAutoConfig.include"
+
+        if self._autoconfigHash is None and isfile(configFile):
+            try:
+                with open(configFile, "r") as handle:
+                    if handle.read() == output:
+                        self._autoconfigHash = configHash
+            except Exception:
+                pass
+
+        if configHash == self._autoconfigHash:
+            self.debug("Shader autoconfig is up to date")
+            return False
 
-        output += "#define RANDOM_TIMESTAMP " + str(time.time()) + "\n"
+        self.debug("Writing shader autoconfig")
 
         # Try to write the file
         try:
-            with open("PipelineTemp/ShaderAutoConfig.include", "w") as handle:
+            with open(configFile, "w") as handle:
                 handle.write(output)
         except Exception:
             self.fatal("Error writing shader autoconfig. Maybe no write-access?")
+            return False
+
+        self._autoconfigHash = configHash
+        return True
+
+    def _bindInput(self, renderPass, inputID, inputKey):
+        """ Internal method to set an input of a pass from the given source,
+        which is either the output of a created pass or a variable """
+
+        self._boundInputs.setdefault(renderPass.getID(), {})[inputID] = inputKey
+
+        if inputKey in self._availableUniforms:
+            uniformValue = self._availableUniforms[inputKey]
+
+            if callable(uniformValue):
+                uniformValue = uniformValue()
+
+            if type(uniformValue) == tuple or type(uniformValue) == list:
+                renderPass.setShaderInput(inputID, *uniformValue)
+            else:
+                renderPass.setShaderInput(inputID, uniformValue)
+
             return
 
-    def createPasses(self):
-        """ This method takes the list of RenderPasses and brings them into an
-        order in which they can be rendered sequentially. After that, it creates
-        all passes and sets the uniforms. """
+        # Check for variables if no uniform exists with that name
+        if inputKey.startswith("Variables."):
+            variableName = inputKey.split(".")[1]
 
-        self._matchBuffer = self.renderPasses
-        self._sortedNodes = []
-        self._availableUniformNames = []
-        self.registerStaticVariable("null", 0)
+            # Remember the binding, so the input can be updated later
+            self._variableConsumers.setdefault(variableName, []).append(
+                (renderPass, inputID))
 
-        # When there is no valid configuration, make sure no infinite loop is produced
-        maxIterations = 100
-        currentIterations = 0
+            if variableName in self.staticVariables:
+                renderPass.setShaderInput(inputID, self.staticVariables[variableName])
+                return
 
-        # Sort passes
-        # http://en.wikipedia.org/wiki/Topological_sorting
-        while len(self._matchBuffer) > 0:
-            currentIterations += 1
+            if variableName in self.dynamicVariables:
+                handler = self.dynamicVariables[variableName]
+                handler(renderPass, inputID)
+                return
+
+        self.error("Source",inputKey,"not found")
+
+    def _unbindVariable(self, renderPass, inputID, inputKey):
+        """ Internal method to remove a binding from the variable consumers,
+        after the input got bound to another source """
+        if not inputKey.startswith("Variables."):
+            return
+
+        consumers = self._variableConsumers.get(inputKey.split(".")[1], [])
+        for index, (consumer, consumerInput) in enumerate(consumers):
+            if consumer is renderPass and consumerInput == inputID:
+                del consumers[index]
+                return
+
+    def setPassEnabled(self, passID, enabled=True):
+        """ Enables or disables a registered pass at runtime. When a pass gets
+        disabled, all inputs reading its outputs fall back to the next
+        available alternative listed in getRequiredInputs, and passes which
+        are not required anymore get deactivated aswell. Only the inputs whose
+        source changed get rebound.
+
+        Passes which were not created with createPasses (e.g. because they
+        were pruned or disabled) can not be enabled at runtime. Returns False
+        if the change was not possible, the previous state is kept then. When
+        called before createPasses, the pass is simply skipped when creating
+        the passes """
+
+        if passID not in self.renderPasses:
+            self.error("Cannot toggle unkown pass", passID)
+            return False
+
+        if enabled == (passID not in self.disabledPasses):
+            return True
+
+        if enabled:
+            self.disabledPasses.discard(passID)
+        else:
+            self.disabledPasses.add(passID)
+
+        # Not created yet, nothing to relink
+        if not self._createdPasses:
+            return True
+
+        if self._relinkPasses():
+            return True
+
+        # Restore the previous state
+        if enabled:
+            self.disabledPasses.add(passID)
+        else:
+            self.disabledPasses.discard(passID)
+
+        self._sortPasses()
+        return False
+
+    def isPassEnabled(self, passID):
+        """ Returns whether the pass was not disabled with setPassEnabled """
+        return passID not in self.disabledPasses
 
-            if currentIterations > maxIterations:
-                self.error("Iteration count of",maxIterations,"exceeded")
+    def _relinkPasses(self):
+        """ Internal method to recompute the pass order after passes got
+        enabled or disabled, and to rebind all inputs whose source changed.
+        Returns False if the new setup can not be used with the created
+        passes """
+
+        if not self._sortPasses():
+            return False
+
+        # The buffers render in the order they were created, so the new order
+        # has to be compatible to that
+        createdIndex = {}
+        for index, renderPass in enumerate(self._createdPasses):
+            createdIndex[renderPass.getID()] = index
+
+        for renderPass in self._sortedNodes:
+            passID = renderPass.getID()
+
+            if passID not in createdIndex:
+                self.error("Pass", passID, "is required now, but was not created")
                 return False
 
-            for renderPass in self._matchBuffer:
-                if self._canAttach(self._matchBuffer[renderPass]):
-                    rPass = self._matchBuffer[renderPass]
-                    if self._canAttach(rPass):
-                        self._sortedNodes.append(rPass)
-                        del self._matchBuffer[renderPass]
-                        self._makeUniformsAvailable(rPass)
-                        break
+            for dependencyID in self._dependencies[passID]:
+                if createdIndex[dependencyID] > createdIndex[passID]:
+                    self.error("Pass", passID, "would have to read", dependencyID,
+                               "which is rendered after it")
+                    return False
 
-        # Create passes
-        self._availableUniforms = {}
+        newActive = set(self._sortedNodes)
 
-        # Create passes by iterating over the sorted lists
+        # Activate or deactivate the targets
+        for renderPass in self._createdPasses:
+            active = renderPass in newActive
+            if active != (renderPass in self._activePasses):
+                renderPass.setActive(active)
+
+                # The shaders might have been reloaded in the meantime
+                if active:
+                    self._setPassShaders(renderPass)
+
+        # Rebind the inputs which changed their source
+        numRebound = 0
         for renderPass in self._sortedNodes:
+            passID = renderPass.getID()
+            previous = self._boundInputs.get(passID, {})
 
-            renderPass.create()
+            for inputID, inputKey in self._resolvedInputs[passID].items():
+                if previous.get(inputID) == inputKey:
+                    continue
 
-            # Add the defines the render pass provides
-            for key, val in renderPass.getDefines().items():
-                self.registerDefine(key, val)
+                if inputID in previous:
+                    self._unbindVariable(renderPass, inputID, previous[inputID])
 
-            # Set required inputs for the pass
-            for inputID, inputSource in renderPass.getRequiredInputs().items():
-                inputKey = inputSource
+                self._bindInput(renderPass, inputID, inputKey)
+                numRebound += 1
 
-                # If multiple entries are provided, choose the first available
-                if type(inputSource) == list:
-                    inputKey = self._getFirstAvailableInput(inputSource)
+        self._activePasses = newActive
+        self.debug("Relinked passes,", len(newActive), "active,", numRebound, "inputs rebound")
+        return True
+
+    def createPasses(self):
+        """ This method takes the list of RenderPasses and brings them into an
+        order in which they can be rendered sequentially, skipping all passes
+        whose outputs are never used. After that, it creates all passes and
+        sets the uniforms. """
 
-                if inputKey in self._availableUniforms:
-                    uniformValue = self._availableUniforms[inputKey]
+        self.registerStaticVariable("null", 0)
 
-                    if callable(uniformValue):
-                        uniformValue = uniformValue()
+        # Sort passes
+        # http://en.wikipedia.org/wiki/Topological_sorting
+        if not self._sortPasses():
+            return False
 
-                    if type(uniformValue) == tuple or type(uniformValue) == list:
-                        renderPass.setShaderInput(inputID, *uniformValue)
-                    else:
-                        renderPass.setShaderInput(inputID, uniformValue)
+        # Create passes
+        self._availableUniforms = {}
+        self._variableConsumers = {}
+        self._boundInputs = {}
 
-                    continue
+        # Transient textures can be shared between passes whose outputs
+        # are not used at the same time
+        lifetimes = self._computeLifetimes()
+        TransientTexturePool.reset()
 
-                # Check for variables if no uniform exists with that name
-                if inputKey.startswith("Variables."):
-                    variableName = inputKey.split(".")[1]
+        # Create passes by iterating over the sorted lists
+        for index, renderPass in enumerate(self._sortedNodes):
 
-                    if variableName in self.staticVariables:
-                        renderPass.setShaderInput(inputID, self.staticVariables[variableName])
-                        continue
+            TransientTexturePool.beginPass(index, lifetimes[renderPass.getID()])
+            renderPass.create()
+            TransientTexturePool.endPass()
 
-                    if variableName in self.dynamicVariables:
-                        handler = self.dynamicVariables[variableName]
-                        handler(renderPass, inputID)
-                        continue
+            # Add the defines the render pass provides
+            for key, val in renderPass.getDefines().items():
+                self.registerDefine(key, val)
 
-                self.error("Source",inputKey,"not found")
+            # Set required inputs for the pass, the sources were already
+            # choosen while sorting
+            for inputID, inputKey in self._resolvedInputs[renderPass.getID()].items():
+                self._bindInput(renderPass, inputID, inputKey)
 
             # Register the outputs the pass provides
             for outputName, outputValue in renderPass.getOutputs().items():
                 self._availableUniforms[outputName] = outputValue
 
+        self._createdPasses = list(self._sortedNodes)
+        self._activePasses = set(self._createdPasses)
+        self.passTimer.registerPasses(self._createdPasses)
+
+        self.debug("Shared", TransientTexturePool.getNumAliased(), "transient textures")
+
         # List variables & passes
         # self.debug(self._sortedNodes)
 
@@ -28,24 +28,28 @@ class BloomPass(RenderPass):
 
     def create(self):
         self.target = RenderTarget("BloomExtract")
+        self.target.setTransient()
         self.target.setQuarterResolution()
         self.target.addColorTexture()
         self.target.setColorBits(16)
         self.target.prepareOffscreenBuffer()
  
         self.targetV = RenderTarget("BloomBlurV")
+        self.targetV.setTransient()
         self.targetV.setQuarterResolution()
         self.targetV.addColorTexture()
         self.targetV.setColorBits(16)
         self.targetV.prepareOffscreenBuffer()
  
         self.targetH = RenderTarget("BloomBlurH")
+        self.targetH.setTransient()
         self.targetH.setQuarterResolution()
         self.targetH.addColorTexture()
         self.targetH.setColorBits(16)
         self.targetH.prepareOffscreenBuffer()
 
         self.targetMerge = RenderTarget("MergeBloom")
+        self.targetMerge.setTransient()
         self.targetMerge.addColorTexture()
         self.targetMerge.setColorBits(16)
         self.targetMerge.prepareOffscreenBuffer()
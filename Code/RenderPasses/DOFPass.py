@@ -29,6 +29,7 @@ class DOFPass(RenderPass):
 
     def create(self):
         self.targetCoC = RenderTarget("DOF-CoC")
+        self.targetCoC.setTransient()
         self.targetCoC.setColorBits(16)
         self.targetCoC.setAuxBits(16)
         self.targetCoC.addColorTexture()
@@ -61,18 +62,21 @@ class DOFPass(RenderPass):
             quad.setInstanceCount(w * h) # Poor GPU
 
         self.targetBlurV = RenderTarget("DOF-BlurV")
+        self.targetBlurV.setTransient()
         self.targetBlurV.setColorBits(16)
         self.targetBlurV.addColorTexture()
         self.targetBlurV.prepareOffscreenBuffer()
         self.targetBlurV.setShaderInput("sourceBlurTex", self.targetCoC.getAuxTexture(0))
         
         self.targetBlurH = RenderTarget("DOF-BlurH")
+        self.targetBlurH.setTransient()
         self.targetBlurH.setColorBits(16)
         self.targetBlurH.addColorTexture()
         self.targetBlurH.prepareOffscreenBuffer()
         self.targetBlurH.setShaderInput("sourceBlurTex", self.targetBlurV.getColorTexture())
         
         self.targetCombine = RenderTarget("DOF-Combine")
+        self.targetCombine.setTransient()
         self.targetCombine.addColorTexture()
         self.targetCombine.setColorBits(16)
         self.targetCombine.prepareOffscreenBuffer()
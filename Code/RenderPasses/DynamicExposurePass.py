@@ -78,10 +78,7 @@ class DynamicExposurePass(RenderPass):
         self.finalDownsamplePass.setColorWrite(False)
         self.finalDownsamplePass.prepareOffscreenBuffer()
         self.finalDownsamplePass.setShaderInput("luminanceTex", lastTex)
-        self.finalDownsamplePass.setShaderInput("targetExposure", 
-            self.pipeline.settings.targetExposure)
-        self.finalDownsamplePass.setShaderInput("adaptionSpeed", 
-            self.pipeline.settings.brightnessAdaptionSpeed)
+        self.updateSettings()
 
         # Clear the storage in the beginning
         self.lastExposureStorage.setClearColor(Vec4(0))
@@ -91,6 +88,14 @@ class DynamicExposurePass(RenderPass):
         self.finalDownsamplePass.setShaderInput("lastExposureTex", self.lastExposureStorage)
         self.pipeline.renderPassManager.registerDefine("USE_DYNAMIC_EXPOSURE", 1)
 
+    def updateSettings(self):
+        """ Applies the exposure settings of the pipeline, this can be called
+        at runtime when the settings changed """
+        self.finalDownsamplePass.setShaderInput("targetExposure", 
+            self.pipeline.settings.targetExposure)
+        self.finalDownsamplePass.setShaderInput("adaptionSpeed", 
+            self.pipeline.settings.brightnessAdaptionSpeed)
+
     def setShaders(self):
         shaderFirstPass = Shader.load(Shader.SLGLSL, 
             "Shader/DefaultPostProcess.vertex",
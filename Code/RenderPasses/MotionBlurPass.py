@@ -25,18 +25,21 @@ class MotionBlurPass(RenderPass):
 
     def create(self):
         self.targetDilate0 = RenderTarget("MotionBlurDilateVelocity0")
+        self.targetDilate0.setTransient()
         self.targetDilate0.addColorTexture()
         self.targetDilate0.setColorBits(16)
         self.targetDilate0.prepareOffscreenBuffer()
         # self.targetDilate0.setShaderInput("velocitySource", )
 
         self.targetDilate1 = RenderTarget("MotionBlurDilateVelocity1")
+        self.targetDilate1.setTransient()
         self.targetDilate1.addColorTexture()
         self.targetDilate1.setColorBits(16)
         self.targetDilate1.prepareOffscreenBuffer()
         self.targetDilate1.setShaderInput("velocityTex", self.targetDilate0.getColorTexture())
 
         self.target = RenderTarget("MotionBlur")
+        self.target.setTransient()
         self.target.addColorTexture()
         self.target.prepareOffscreenBuffer()
         self.target.setShaderInput("dilatedVelocityTex", self.targetDilate1.getColorTexture())
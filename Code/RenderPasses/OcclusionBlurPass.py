@@ -27,11 +27,13 @@ class OcclusionBlurPass(RenderPass):
 
     def create(self):
         self.targetV = RenderTarget("OcclusionBlurV")
+        self.targetV.setTransient()
         self.targetV.setHalfResolution()
         self.targetV.addColorTexture()
         self.targetV.prepareOffscreenBuffer()
  
         self.targetH = RenderTarget("OcclusionBlurH")
+        self.targetH.setTransient()
         self.targetH.setHalfResolution()
         self.targetH.addColorTexture()
         self.targetH.prepareOffscreenBuffer()
@@ -42,6 +42,7 @@ class SSLRPass(RenderPass):
 
     def create(self):
         self.target = RenderTarget("SSLR")
+        self.target.setTransient()
 
         if self.halfRes:
             self.target.setHalfResolution()
@@ -50,11 +51,13 @@ class SSLRPass(RenderPass):
         self.target.prepareOffscreenBuffer()
  
         self.targetV = RenderTarget("SSLRBlurV")
+        self.targetV.setTransient()
         self.targetV.addColorTexture()
         self.targetV.setColorBits(16)
         self.targetV.prepareOffscreenBuffer()
  
         self.targetH = RenderTarget("SSLRBlurH")
+        self.targetH.setTransient()
         self.targetH.addColorTexture()
         self.targetH.setColorBits(16)
         self.targetH.prepareOffscreenBuffer()
@@ -9,6 +9,7 @@ from Code.MemoryMonitor import MemoryMonitor
 from Code.DebugObject import DebugObject
 from Code.Globals import Globals
 from Code.MemoryMonitor import MemoryMonitor
+from Code.TransientTexturePool import TransientTexturePool
 from Code.GUI.BufferViewerGUI import BufferViewerGUI
 
 
@@ -79,6 +80,7 @@ class RenderTarget(DebugObject):
         self._internalBuffer = None
         self._camera = None
         self._node = None
+        self._transient = False
         self._rename(name)
         self.mute()
 
@@ -96,10 +98,21 @@ class RenderTarget(DebugObject):
         layers. Otherwise a 3D Texture is choosen """
         self._useTextureArrays = state
 
+    def setTransient(self, transient=True):
+        """ Marks the color and aux textures of this target as transient, that
+        means they may share their memory with the textures of other passes
+        when their lifetimes don't overlap. Only use this when the textures
+        are not read in a later frame. See TransientTexturePool """
+        self._transient = transient
+
     def setMultisamples(self, samples):
         """ Sets the amount of multisamples to use """
         self._multisamples = samples
 
+    def getMultisamples(self):
+        """ Returns the amount of multisamples used """
+        return self._multisamples
+
     def setEngine(self, engine):
         """ Sets the graphic engine to use """
         self._engine = engine
@@ -115,6 +128,10 @@ class RenderTarget(DebugObject):
         """ Sets the buffer name to identify it in pstats """
         self._name = name
 
+    def getName(self):
+        """ Returns the buffer name """
+        return self._name
+
     def setEnableTransparency(self, enabled=True):
         """ Sets Whether objects can be transparent in this buffer """
         self._enableTransparency = enabled
@@ -623,6 +640,10 @@ class RenderTarget(DebugObject):
                 else:
                     handle.setup3dTexture(self._layers)
 
+            # Try to share the texture with a pass which doesn't need it anymore
+            elif self._transient:
+                self._targets[target] = TransientTexturePool.acquire(handle)
+
         # set layers for depth texture
         if self._layers > 1 and self.hasTarget(RenderTargetType.Depth):
             if self._useTextureArrays:
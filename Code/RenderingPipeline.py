@@ -25,6 +25,10 @@ from Code.GUI.PipelineGuiManager import PipelineGuiManager
 from Code.SSLRManager import SSLRManager
 from Code.CloudManager import CloudManager
 from Code.MemoryMonitor import MemoryMonitor
+from Code.ShaderFileWatcher import ShaderFileWatcher
+from Code.SettingsReloader import SettingsReloader
+from Code.QualityGovernor import QualityGovernor
+from Code.MemoryPressurePolicy import MemoryPressurePolicy
 
 from Code.GUI.BetterOnscreenImage import BetterOnscreenImage
 
@@ -47,6 +51,8 @@ from direct.gui.DirectFrame import DirectFrame
 
 import time
 
+from collections import OrderedDict
+
 
 class RenderingPipeline(DebugObject):
 
@@ -62,6 +68,11 @@ class RenderingPipeline(DebugObject):
         self.settings = None
         self.ready = False
         self.mountManager = MountManager()
+        self.shaderWatcher = None
+        self.settingsFile = None
+        self.settingsReloader = None
+        self.qualityGovernor = None
+        self.memoryPolicy = None
 
     def getMountManager(self):
         """ Returns the mount manager. You can use this to set the
@@ -72,10 +83,17 @@ class RenderingPipeline(DebugObject):
         """ Loads the pipeline settings from an ini file """
         self.settings = PipelineSettingsManager()
         self.settings.loadFromFile(filename)
+        self.settingsFile = filename
 
         # This has to be here, before anything is printed
         DebugObject.setOutputLevel(self.settings.pipelineOutputLevel)
 
+    def reloadSettings(self):
+        """ Reloads the settings file, and applies all settings which can be
+        changed at runtime. Returns a dictionary of impact -> list of changed
+        settings, see SettingsReloader """
+        return self.settingsReloader.reload()
+
     def getSettings(self):
         """ Returns the current pipeline settings """
         return self.settings
@@ -125,18 +143,85 @@ class RenderingPipeline(DebugObject):
         return material
 
     def setEffect(self, obj, effect, properties = None, sort=0):
-        """ Applies the effect to an object with the given properties """
+        """ Applies the effect to an object with the given properties. obj can
+        also be a list of objects, use setEffects to assign different effects
+        to many objects at once """
         if isinstance(obj, list) or isinstance(obj, tuple):
-            for part in obj:
-                self.setEffect(part, effect, properties, sort)
-            return
-
-        effect = self.effectLoader.loadEffect(effect, properties)
+            return self.setEffects([(part, effect, properties, sort) for part in obj])
+
+        return self.setEffects([(obj, effect, properties, sort)])
+
+    def setEffects(self, assignments):
+        """ Applies effects to many objects at once. assignments should be a
+        list of (obj, effect, properties, sort) tuples, where properties and
+        sort can be omitted. The objects are grouped by effect permutation, so
+        each effect is loaded, checked and has its tag states registered only
+        once, and then applied to all objects of the group. Returns False if
+        any effect could not be assigned """
+
+        groups = OrderedDict()
+        for assignment in assignments:
+            obj, effect = assignment[0], assignment[1]
+            properties = assignment[2] if len(assignment) > 2 else None
+            sort = assignment[3] if len(assignment) > 3 else 0
+            key = (effect, tuple(sorted(properties.items())) if properties else (), sort)
+            if key not in groups:
+                groups[key] = (properties, [])
+            groups[key][1].append(obj)
+
+        success = True
+        for (effectFile, _, sort), (properties, objects) in groups.items():
+            effect = self.effectLoader.loadEffect(effectFile, properties)
+            tags = self._prepareEffect(effect, sort)
+
+            if tags is None:
+                success = False
+                continue
+
+            for obj in objects:
+                self._applyEffect(obj, effect, sort, tags)
+
+        return success
+
+    def _prepareEffect(self, effect, sort):
+        """ Internal method to check if an effect can be used, and to register
+        its tag states. Returns a dictionary of tag name -> state name, which
+        has to be set on each object using the effect, or None if the effect
+        cannot be used """
 
         if effect.getSetting("transparent"):
             if not self.settings.useTransparency:
                 self.error("Cannot assign transparent material when transparency is disabled")
-                return False
+                return None
+
+        tags = {}
+
+        # Create EarlyZ state. The tag states are registered through the effect,
+        # so they get updated when the effect is reloaded
+        if effect.getSetting("mainPass") and effect.hasShader("EarlyZ"):
+            stateName = "NodeEffect" + str(effect.getEffectID())
+            effect.assignTagState("EarlyZ", stateName,
+                self.deferredScenePass.registerEarlyZTagState, sort + 22)
+            tags["EarlyZShader"] = stateName
+
+        # Create shadow caster state
+        if effect.getSetting("castShadows") and effect.hasShader("Shadows"):
+            stateName = "NodeEffect" + str(effect.getEffectID())
+            effect.assignTagState("Shadows", stateName,
+                self.lightManager.shadowPass.registerTagState, sort + 20)
+            tags["ShadowPassShader"] = stateName
+
+        # Create GI state
+        if effect.getSetting("castGI") and self.settings.enableGlobalIllumination and effect.hasShader("Voxelize"):
+            stateName = "NodeGIEffect" + str(effect.getEffectID())
+            effect.assignTagState("Voxelize", stateName,
+                self.globalIllum.voxelizePass.registerTagState, sort + 21)
+            tags["VoxelizePassShader"] = stateName
+
+        return tags
+
+    def _applyEffect(self, obj, effect, sort, tags):
+        """ Internal method to apply a prepared effect to an object """
 
         if effect.getSetting("dynamic"):
             self.registerDynamicObject(obj)
@@ -152,29 +237,8 @@ class RenderingPipeline(DebugObject):
 
         effect.assignNode(obj, "Default", sort)
 
-        # Create EarlyZ state
-        if effect.getSetting("mainPass") and effect.hasShader("EarlyZ"):
-            initialState = NodePath("EffectInitialEarlyZState"+str(effect.getEffectID()))
-            initialState.setShader(effect.getShader("EarlyZ"), sort + 22)
-            stateName = "NodeEffect" + str(effect.getEffectID())
-            self.deferredScenePass.registerEarlyZTagState(stateName, initialState)
-            obj.setTag("EarlyZShader", stateName)
-
-        # Create shadow caster state
-        if effect.getSetting("castShadows") and effect.hasShader("Shadows"):
-            initialState = NodePath("EffectInitialShadowState"+str(effect.getEffectID()))
-            initialState.setShader(effect.getShader("Shadows"), sort + 20)
-            stateName = "NodeEffect" + str(effect.getEffectID())
-            self.lightManager.shadowPass.registerTagState(stateName, initialState)
-            obj.setTag("ShadowPassShader", stateName)
-
-        # Create GI state
-        if effect.getSetting("castGI") and self.settings.enableGlobalIllumination and effect.hasShader("Voxelize"):
-            initialState = NodePath("EffectInitialGIState"+str(effect.getEffectID()))
-            initialState.setShader(effect.getShader("Voxelize"), sort + 21)
-            stateName = "NodeGIEffect" + str(effect.getEffectID())
-            self.globalIllum.voxelizePass.registerTagState(stateName, initialState)
-            obj.setTag("VoxelizePassShader", stateName)
+        for tagName, stateName in tags.items():
+            obj.setTag(tagName, stateName)
 
     def fillTextureStages(self, nodePath):
         """ Prepares all materials of a given nodepath to have at least the 4 
@@ -244,14 +308,15 @@ class RenderingPipeline(DebugObject):
         skybox.setName("Skybox")
         return skybox
 
-    def reloadShaders(self):
+    def reloadShaders(self, bustCache=False):
         """ Reloads all shaders and regenerates all intitial states. This function
-        also updates the shader autoconfig """
+        also updates the shader autoconfig. When bustCache is True, all shaders
+        get recompiled, even if their sources did not change """
         self.debug("Reloading shaders")
         if self.guiManager:
             self.guiManager.onRegenerateShaders()
 
-        self.renderPassManager.writeAutoconfig()
+        self.renderPassManager.writeAutoconfig(bustCache)
         self.renderPassManager.setShaders()
         if self.settings.enableGlobalIllumination:
             self.globalIllum.reloadShader()
@@ -324,6 +389,16 @@ class RenderingPipeline(DebugObject):
         if self.settings.useTransparency:
             self.transparencyManager.update()
         self.antialiasingManager.update()
+        if self.shaderWatcher:
+            self.shaderWatcher.check()
+        if self.settingsReloader:
+            self.settingsReloader.update()
+        if self.qualityGovernor:
+            self.qualityGovernor.update()
+        if self.settings.memorySampleInterval > 0.0:
+            MemoryMonitor.update()
+        if self.memoryPolicy:
+            self.memoryPolicy.update()
         self.renderPassManager.preRenderUpdate()
         self.sslrManager.update()
         if self.settings.enableClouds:
@@ -384,21 +459,54 @@ class RenderingPipeline(DebugObject):
 
     def _createViewSpacePass(self):
         """ Creates a pass which computes the view space normals and position.
-        This pass is only created if any render pass requires the provided
-        inputs """
-        if self.renderPassManager.anyPassRequires("ViewSpacePass.normals") or \
-            self.renderPassManager.anyPassRequires("ViewSpacePass.position"):
-            self.viewSpacePass = ViewSpacePass()
-            self.renderPassManager.registerPass(self.viewSpacePass)
+        The pass manager prunes this pass if no render pass requires the
+        provided inputs """
+        self.viewSpacePass = ViewSpacePass()
+        self.renderPassManager.registerPass(self.viewSpacePass)
 
     def _createSkyboxMaskPass(self):
         """ Creates a pass which computes the skybox mask.
-        This pass is only created if any render pass requires the provided
-        inputs """
+        The pass manager prunes this pass if no render pass requires the
+        provided inputs """
+        self.skyboxMaskPass = SkyboxMaskPass()
+        self.renderPassManager.registerPass(self.skyboxMaskPass)
+
+    def _loadEnvironmentCubemap(self, filename):
+        """ Loads a cubemap to use as default environment cubemap """
+        cubemapEnv = self.showbase.loader.loadCubeMap(filename, readMipmaps=True)
+        cubemapEnv.setMinfilter(SamplerState.FTLinearMipmapLinear)
+        cubemapEnv.setMagfilter(SamplerState.FTLinearMipmapLinear)
+        cubemapEnv.setFormat(Texture.FRgba)
+        return cubemapEnv
+
+    def _loadColorLUT(self, filename):
+        """ Loads a color lookup table from the Data/ColorLUT directory """
+        colorLUT = loader.loadTexture("Data/ColorLUT/" + filename)
+        colorLUT.setWrapU(SamplerState.WMClamp)
+        colorLUT.setWrapV(SamplerState.WMClamp)
+        colorLUT.setFormat(Texture.F_rgb16)
+        colorLUT.setMinfilter(SamplerState.FTLinear)
+        colorLUT.setMagfilter(SamplerState.FTLinear)
+        return colorLUT
+
+    def setDefaultEnvironmentCubemap(self, filename):
+        """ Replaces the default environment cubemap at runtime. Only the shader
+        inputs using the cubemap get updated, the pipeline does not have to be
+        recreated. The filename should contain a '#' like the
+        defaultReflectionCubemap setting """
+        cubemapEnv = self._loadEnvironmentCubemap(filename)
+        self.renderPassManager.updateStaticVariable("defaultEnvironmentCubemap",
+            cubemapEnv)
+        self.renderPassManager.updateStaticVariable("defaultEnvironmentCubemapMipmaps",
+            cubemapEnv.getExpectedNumMipmapLevels())
+        self.settings.setSetting("defaultReflectionCubemap", filename)
 
-        if self.renderPassManager.anyPassRequires("SkyboxMaskPass.resultTex"):
-            self.skyboxMaskPass = SkyboxMaskPass()
-            self.renderPassManager.registerPass(self.skyboxMaskPass)
+    def setColorLookupTable(self, filename):
+        """ Replaces the color lookup table at runtime. The filename is relative
+        to the Data/ColorLUT directory, like the colorLookupTable setting """
+        colorLUT = self._loadColorLUT(filename)
+        self.renderPassManager.updateStaticVariable("colorLUT", colorLUT)
+        self.settings.setSetting("colorLookupTable", filename)
 
     def _createDefaultTextureInputs(self):
         """ This method loads various textures used in the different render passes
@@ -426,23 +534,14 @@ class RenderingPipeline(DebugObject):
             cubemapLookup)
 
         # Load the default environment cubemap
-        cubemapEnv = self.showbase.loader.loadCubeMap(
-            self.settings.defaultReflectionCubemap, readMipmaps=True)
-        cubemapEnv.setMinfilter(SamplerState.FTLinearMipmapLinear)
-        cubemapEnv.setMagfilter(SamplerState.FTLinearMipmapLinear)
-        cubemapEnv.setFormat(Texture.FRgba)
+        cubemapEnv = self._loadEnvironmentCubemap(self.settings.defaultReflectionCubemap)
         self.renderPassManager.registerStaticVariable("defaultEnvironmentCubemap", 
             cubemapEnv)
         self.renderPassManager.registerStaticVariable("defaultEnvironmentCubemapMipmaps", 
             cubemapEnv.getExpectedNumMipmapLevels())
 
         # Load the color LUT
-        colorLUT = loader.loadTexture("Data/ColorLUT/" + self.settings.colorLookupTable)
-        colorLUT.setWrapU(SamplerState.WMClamp)
-        colorLUT.setWrapV(SamplerState.WMClamp)
-        colorLUT.setFormat(Texture.F_rgb16)
-        colorLUT.setMinfilter(SamplerState.FTLinear)
-        colorLUT.setMagfilter(SamplerState.FTLinear)
+        colorLUT = self._loadColorLUT(self.settings.colorLookupTable)
         self.renderPassManager.registerStaticVariable("colorLUT", colorLUT)
 
         # Load the normal quantization tex
@@ -572,6 +671,20 @@ class RenderingPipeline(DebugObject):
             # target.setShader(shader, 50)
             pass
 
+    def _setupMemoryMonitor(self):
+        """ Applies the vram budgets from the settings to the memory monitor """
+        budgets = {
+            "shadows": self.settings.vramBudgetShadows,
+            "gi": self.settings.vramBudgetGI,
+            "post": self.settings.vramBudgetPost,
+            "clouds": self.settings.vramBudgetClouds,
+        }
+
+        for category, budget in budgets.items():
+            MemoryMonitor.setBudget(category, int(budget * 1024 * 1024))
+
+        MemoryMonitor.sampleInterval = self.settings.memorySampleInterval
+
     def create(self):
         """ Creates the pipeline """
 
@@ -582,7 +695,9 @@ class RenderingPipeline(DebugObject):
         # Handy shortcuts
         self.showbase.accept("1", PStatClient.connect)
         self.showbase.accept("r", self.reloadShaders)
+        self.showbase.accept("shift-r", self.reloadShaders, [True])
         self.showbase.accept("t", self.reloadEffects)
+        self.showbase.accept("f5", self.reloadSettings)
         self.showbase.accept("f7", self._createBugReport)
         self.showbase.accept("f8", self.toggleGui)
 
@@ -633,9 +748,23 @@ class RenderingPipeline(DebugObject):
         self.showbase.camNode.setCameraMask(self.getMainPassBitmask())
         self.showbase.render.setAttrib(TransparencyAttrib.make(TransparencyAttrib.MNone), 100)
 
+        # Set the memory budgets before any render target gets created
+        self._setupMemoryMonitor()
+
+        # Lower the optional resources which would exceed their budget
+        if self.settings.enableMemoryPressurePolicy:
+            self.memoryPolicy = MemoryPressurePolicy(self)
+            self.memoryPolicy.plan()
+
         # Create render pass matcher
         self.renderPassManager = RenderPassManager()
 
+        # Watch the shader files, to reload only the affected shaders when a
+        # file is modified
+        if self.settings.enableShaderHotReload:
+            self.shaderWatcher = ShaderFileWatcher(self.settings.shaderHotReloadInterval)
+            self.renderPassManager.setShaderWatcher(self.shaderWatcher)
+
         # Create last frame buffers
         self._createLastFrameBuffers()
 
@@ -719,12 +848,26 @@ class RenderingPipeline(DebugObject):
         self.renderPassManager.writeAutoconfig()
         self.renderPassManager.setShaders()
 
+        # Now that all resources exist, check the total budget
+        if self.memoryPolicy:
+            self.memoryPolicy.check()
+
         # Create the update tasks
         self._createTasks()
 
         # Create the effect loader
         self.effectLoader = EffectLoader(self)
 
+        # Create the settings reloader, which applies changes of the settings
+        # file at runtime
+        self.settingsReloader = SettingsReloader(self, self.settingsFile)
+        if self.settings.enableSettingsReload:
+            self.settingsReloader.watch()
+
+        # Create the governor which adapts the quality to the frame budget
+        if self.settings.enableQualityGovernor:
+            self.qualityGovernor = QualityGovernor(self)
+
         # Apply the default effect to the scene
         self.setEffect(Globals.render, "Effects/Default/Default.effect", {
             "transparent": False,
@@ -95,6 +95,26 @@ class SettingsManager(DebugObject):
         self.settings[key].setValue(val)
         setattr(self, key, self.settings[key].getValue())
 
+    def revertSetting(self, key, value):
+        """ Sets a setting to an already casted value, this is used to undo
+        changes which could not be applied """
+        assert key in self.settings
+        self.settings[key].value = value
+        setattr(self, key, value)
+
+    def reloadFromFile(self, filename):
+        """ Loads the settings from a given file again, and returns a
+        dictionary of all settings which changed, with a tuple of the old and
+        the new value as value """
+        oldValues = dict((name, setting.getValue()) for name, setting in self.settings.items())
+        self.loadFromFile(filename)
+
+        changes = {}
+        for name, setting in self.settings.items():
+            if setting.getValue() != oldValues[name]:
+                changes[name] = (oldValues[name], setting.getValue())
+        return changes
+
     def loadFromFile(self, filename):
         """ Attempts to load settings from a given file. When the file
         does not exist, nothing happens, and an error is printed """
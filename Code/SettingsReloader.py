@@ -0,0 +1,222 @@
+from Code.DebugObject import DebugObject
+from Code.ShaderFileWatcher import ShaderFileWatcher
+
+
+class SettingsReloader(DebugObject):
+
+    """ This class reloads the pipeline settings at runtime. The settings file
+    is read again, and each changed setting is classified by the work required
+    to apply it:
+
+        runtime:    The setting is read every frame, or only has to be passed
+                    to a single object
+        shader:     The setting is a define, the shader autoconfig gets
+                    rewritten and the shaders get reloaded
+        variable:   A shader input is replaced, e.g. a texture
+        pass:       A single pass is reconfigured, enabled or disabled
+        rebuild:    The pipeline would have to be recreated. These changes
+                    are reverted, and a restart is required to apply them
+
+    Only the minimal work for the changed settings is done, e.g. changing a
+    sample count only reloads the shaders once, no matter how many defines
+    changed. """
+
+    # Settings which are defines, and whether the define is a flag (defined
+    # when the setting is true) or a value
+    DefineSettings = {
+        "globalAmbientFactor": ("GLOBAL_AMBIENT_FACTOR", False),
+        "useColorCorrection": ("USE_COLOR_CORRECTION", True),
+        "useDiffuseAntialiasing": ("USE_DIFFUSE_ANTIALIASING", True),
+        "cubemapAntialiasingFactor": ("CUBEMAP_ANTIALIASING_FACTOR", False),
+        "enableAlphaTestedShadows": ("USE_ALPHA_TESTED_SHADOWS", True),
+        "sslrNumSteps": ("SSLR_STEPS", False),
+        "sslrScreenRadius": ("SSLR_SCREEN_RADIUS", False),
+        "occlusionRadius": ("OCCLUSION_RADIUS", False),
+        "occlusionStrength": ("OCCLUSION_STRENGTH", False),
+        "occlusionSampleCount": ("OCCLUSION_SAMPLES", False),
+        "useLowQualityBlur": ("USE_LOW_QUALITY_BLUR", True),
+        "useOcclusionNoise": ("USE_OCCLUSION_NOISE", True),
+        "numPCFSamples": ("SHADOW_NUM_PCF_SAMPLES", False),
+        "usePCSS": ("USE_PCSS", True),
+        "numPCSSSearchSamples": ("SHADOW_NUM_PCSS_SEARCH_SAMPLES", False),
+        "numPCSSFilterSamples": ("SHADOW_NUM_PCSS_FILTER_SAMPLES", False),
+        "pcssSampleRadius": ("PCSS_SAMPLE_RADIUS", False),
+        "useHardwarePCF": ("USE_HARDWARE_PCF", True),
+        "shadowCascadeBorderPercentage": ("SHADOW_PSSM_BORDER_PERCENTAGE", False),
+        "maxTransparencyRange": ("TRANSPARENCY_RANGE", False),
+        "motionBlurSamples": ("MOTION_BLUR_SAMPLES", False),
+        "motionBlurFactor": ("MOTION_BLUR_FACTOR", False),
+        "motionBlurDilatePixels": ("MOTION_BLUR_DILATE_PIXELS", False),
+    }
+
+    # Settings which are enable flags of optional passes. They can be toggled
+    # at runtime if the pass was created at startup
+    PassToggleSettings = {
+        "enableBloom": "BloomPass",
+        "enableDOF": "DOFPass",
+        "enableMotionBlur": "MotionBlurPass",
+        "enableSSLR": "SSLRPass",
+    }
+
+    def __init__(self, pipeline, filename):
+        """ Creates a new reloader for the settings of the pipeline, which were
+        loaded from filename """
+        DebugObject.__init__(self, "SettingsReloader")
+        self.pipeline = pipeline
+        self.filename = filename
+        self.watcher = None
+
+        self.runtimeHandlers = {
+            "stateCacheClearInterval": None,
+            "jitterAmount": self._setJitterAmount,
+            "alwaysUpdateAllShadows": None,
+            "writeEffectShaders": None,
+            "pipelineOutputLevel": DebugObject.setOutputLevel,
+            "shaderHotReloadInterval": self._setHotReloadInterval,
+            "maxCachedEffects": self._setMaxCachedEffects,
+            "effectCacheSize": self._setEffectCacheSize,
+        }
+
+        self.variableHandlers = {
+            "defaultReflectionCubemap": pipeline.setDefaultEnvironmentCubemap,
+            "colorLookupTable": pipeline.setColorLookupTable,
+        }
+
+        self.passHandlers = {
+            "targetExposure": self._updateExposureSettings,
+            "brightnessAdaptionSpeed": self._updateExposureSettings,
+        }
+
+    def watch(self, interval=1.0):
+        """ Starts watching the settings file, call update() every frame to
+        reload it when it changed """
+        self.watcher = ShaderFileWatcher(interval)
+        self.watcher.watch(self, [self.filename], lambda changedFiles: self.reload())
+
+    def update(self):
+        """ Checks if the settings file changed, when watching it """
+        if self.watcher is not None:
+            self.watcher.check()
+
+    def classify(self, key):
+        """ Returns the impact of changing a setting, see the class docstring """
+        if key in self.runtimeHandlers:
+            return "runtime"
+        if key in self.DefineSettings:
+            return "shader"
+        if key in self.variableHandlers:
+            return "variable"
+        if key in self.passHandlers or key in self.PassToggleSettings:
+            return "pass"
+        return "rebuild"
+
+    def reload(self):
+        """ Reloads the settings file and applies all changes. Returns a
+        dictionary of impact -> list of changed settings. The settings listed
+        as rebuild were reverted to their previous value """
+        return self._applyChanges(self.pipeline.settings.reloadFromFile(self.filename))
+
+    def applySettings(self, values):
+        """ Changes the given settings at runtime, values is a dictionary of
+        setting -> already casted value. Returns the same dictionary as
+        reload() """
+        settings = self.pipeline.settings
+        changes = {}
+
+        for key, value in values.items():
+            oldValue = getattr(settings, key)
+            if value != oldValue:
+                settings.revertSetting(key, value)
+                changes[key] = (oldValue, value)
+
+        return self._applyChanges(changes)
+
+    def _applyChanges(self, changes):
+        """ Internal method to apply the changed settings, changes is a
+        dictionary of setting -> (old value, new value) """
+        settings = self.pipeline.settings
+        result = {"runtime": [], "shader": [], "variable": [], "pass": [], "rebuild": []}
+
+        if len(changes) < 1:
+            self.debug("No settings changed")
+            return result
+
+        handled = set()
+
+        for key, (oldValue, newValue) in sorted(changes.items()):
+            impact = self.classify(key)
+
+            if impact == "pass" and key in self.PassToggleSettings:
+                passID = self.PassToggleSettings[key]
+                if not self.pipeline.renderPassManager.setPassEnabled(passID, newValue):
+                    impact = "rebuild"
+
+            result[impact].append(key)
+
+            if impact == "rebuild":
+                settings.revertSetting(key, oldValue)
+                continue
+
+            if impact == "runtime" and self.runtimeHandlers[key] is not None:
+                self.runtimeHandlers[key](newValue)
+
+            elif impact == "shader":
+                self._updateDefine(key, newValue)
+
+            elif impact in ["variable", "pass"] and key not in self.PassToggleSettings:
+                handler = (self.variableHandlers if impact == "variable" else self.passHandlers)[key]
+
+                # Some settings share a handler, only call it once
+                if handler not in handled:
+                    handled.add(handler)
+                    handler(newValue)
+
+        if len(result["shader"]) > 0:
+            self.pipeline.reloadShaders()
+            self.pipeline.reloadEffects()
+
+        for impact, keys in result.items():
+            if len(keys) > 0 and impact != "rebuild":
+                self.debug("Applied", impact, "changes:", ", ".join(keys))
+
+        if len(result["rebuild"]) > 0:
+            self.warn("These settings require a restart and were not changed:",
+                      ", ".join(result["rebuild"]))
+
+        return result
+
+    def _updateDefine(self, key, value):
+        """ Internal method to update the define of a setting """
+        defineName, isFlag = self.DefineSettings[key]
+        renderPassManager = self.pipeline.renderPassManager
+
+        if not isFlag:
+            renderPassManager.registerDefine(defineName, value)
+        elif value:
+            renderPassManager.registerDefine(defineName, 1)
+        else:
+            renderPassManager.unregisterDefine(defineName)
+
+    def _setJitterAmount(self, jitterAmount):
+        """ Internal handler for the jitterAmount setting """
+        antialiasingManager = self.pipeline.antialiasingManager
+        if antialiasingManager.jitter:
+            antialiasingManager.computeJitterOffsets(jitterAmount)
+
+    def _setHotReloadInterval(self, interval):
+        """ Internal handler for the shaderHotReloadInterval setting """
+        if self.pipeline.shaderWatcher is not None:
+            self.pipeline.shaderWatcher.interval = interval
+
+    def _setMaxCachedEffects(self, maxCachedEffects):
+        """ Internal handler for the maxCachedEffects setting """
+        self.pipeline.effectLoader.maxCachedEffects = maxCachedEffects
+
+    def _setEffectCacheSize(self, size):
+        """ Internal handler for the effectCacheSize setting """
+        self.pipeline.effectLoader.sourceCache.maxSize = size * 1024 * 1024
+
+    def _updateExposureSettings(self, value):
+        """ Internal handler for the dynamic exposure settings """
+        if self.pipeline.renderPassManager.isPassActive("DynamicExposurePass"):
+            self.pipeline.dynamicExposurePass.updateSettings()
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+
+from panda3d.core import VirtualFileSystem, Filename
+from direct.stdpy.file import open
+
+
+class ShaderFileCache:
+
+    """ This class caches the content of shader templates and includes, so
+    they only have to be read once, no matter how many effects use them. The
+    cache is shared by all effects and the include resolver.
+
+    Each entry stores the modification time of the file, and is read again as
+    soon as the file changed, so editing a template and reloading the effects
+    works as expected. When more than maxEntries files are cached, the least
+    recently used ones get removed. """
+
+    # Filename -> (timestamp, lines), ordered by the last usage
+    entries = OrderedDict()
+    maxEntries = 256
+    enabled = True
+
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def getLines(self, filename):
+        """ Returns the lines of the given file, with trailing whitespace
+        removed. Raises an IOError if the file could not be read """
+
+        timestamp = self._getTimestamp(filename)
+
+        if self.enabled and filename in self.entries:
+            entryTimestamp, lines = self.entries[filename]
+            if entryTimestamp == timestamp:
+                # Move the entry to the end, to mark it as recently used
+                self.entries[filename] = self.entries.pop(filename)
+                self.hits += 1
+                return lines
+
+        self.misses += 1
+
+        with open(filename, "r") as handle:
+            lines = [line.rstrip() for line in handle.read().splitlines()]
+
+        if self.enabled:
+            # Outdated entries are removed first, so the entry gets added at
+            # the end
+            self.entries.pop(filename, None)
+            self.entries[filename] = (timestamp, lines)
+
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+        return lines
+
+    @classmethod
+    def _getTimestamp(self, filename):
+        """ Internal method to get the modification time of a file, or -1 if
+        the file does not exist """
+        vfile = VirtualFileSystem.getGlobalPtr().getFile(Filename(filename), True)
+        if vfile is None:
+            return -1
+        return vfile.getTimestamp()
+
+    @classmethod
+    def setMaxEntries(self, maxEntries):
+        """ Sets the maximum amount of cached files """
+        self.maxEntries = maxEntries
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    @classmethod
+    def setEnabled(self, enabled):
+        """ Enables or disables the cache. When disabled, every file is read
+        again each time it is requested. This also clears the cache """
+        self.enabled = enabled
+        self.clear()
+
+    @classmethod
+    def clear(self):
+        """ Removes all cached files and resets the statistics """
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def getStats(self):
+        """ Returns a dictionary containing the amount of cached files, and the
+        hits and misses since the last clear """
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
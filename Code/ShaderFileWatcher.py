@@ -0,0 +1,112 @@
+import time
+
+from panda3d.core import VirtualFileSystem, Filename
+
+from Code.DebugObject import DebugObject
+
+
+class ShaderFileWatcher(DebugObject):
+
+    """ This class watches the files shaders are built from, and calls a
+    callback for each owner (e.g. an effect or a render pass) which depends
+    on a modified file. This way only the shaders affected by a change get
+    rebuilt, instead of reloading every shader of the pipeline.
+
+    The files are polled by comparing their modification times, at most once
+    every interval seconds. Each owner registers the complete list of files it
+    depends on with watch(), and should call watch() again after rebuilding,
+    as the includes might have changed. """
+
+    def __init__(self, interval=0.5):
+        """ Creates a new watcher, which checks the files at most every
+        interval seconds """
+        DebugObject.__init__(self, "ShaderFileWatcher")
+        self.interval = interval
+        self.timestamps = {}
+        self.dependents = {}
+        self.ownerFiles = {}
+        self.callbacks = {}
+        self._lastCheck = 0.0
+        self._vfs = VirtualFileSystem.getGlobalPtr()
+
+    def _getTimestamp(self, filename):
+        """ Internal method to get the modification time of a file, or -1 if
+        the file does not exist """
+        vfile = self._vfs.getFile(Filename(filename), True)
+        if vfile is None:
+            return -1
+        return vfile.getTimestamp()
+
+    def watch(self, owner, files, callback):
+        """ Sets the files the owner depends on. When one of them changes,
+        callback gets called with the set of changed files. Replaces all files
+        previously registered for the owner """
+        self.unwatch(owner)
+
+        files = set(files)
+        self.ownerFiles[owner] = files
+        self.callbacks[owner] = callback
+
+        for filename in files:
+            if filename not in self.dependents:
+                self.dependents[filename] = set()
+                self.timestamps[filename] = self._getTimestamp(filename)
+            self.dependents[filename].add(owner)
+
+    def unwatch(self, owner):
+        """ Stops watching the files of the owner """
+        if owner not in self.ownerFiles:
+            return
+
+        for filename in self.ownerFiles.pop(owner):
+            dependents = self.dependents[filename]
+            dependents.discard(owner)
+            if len(dependents) < 1:
+                del self.dependents[filename]
+                del self.timestamps[filename]
+
+        del self.callbacks[owner]
+
+    def getDependents(self, filename):
+        """ Returns the owners which depend on the given file """
+        return set(self.dependents.get(filename, set()))
+
+    def getNumWatchedFiles(self):
+        """ Returns how many files are being watched """
+        return len(self.timestamps)
+
+    def check(self, force=False):
+        """ Checks all files for modifications and calls the callbacks of the
+        affected owners. Does nothing if the last check was less than interval
+        seconds ago, unless force is set. Returns the amount of owners which
+        were notified """
+
+        now = time.time()
+        if not force and now - self._lastCheck < self.interval:
+            return 0
+        self._lastCheck = now
+
+        changed = set()
+        for filename, timestamp in self.timestamps.items():
+            newTimestamp = self._getTimestamp(filename)
+            if newTimestamp != timestamp:
+                self.timestamps[filename] = newTimestamp
+                changed.add(filename)
+
+        if len(changed) < 1:
+            return 0
+
+        affected = {}
+        for filename in changed:
+            for owner in self.dependents[filename]:
+                affected.setdefault(owner, set()).add(filename)
+
+        self.debug("Modified:", ", ".join(sorted(changed)), "- rebuilding",
+                   len(affected), "shader owners")
+
+        for owner, files in affected.items():
+            # The owner might have been removed by a previous callback
+            if owner in self.callbacks:
+                self.callbacks[owner](files)
+
+        return len(affected)
@@ -0,0 +1,124 @@
+from os.path import dirname, join
+
+from panda3d.core import VirtualFileSystem, Filename, getModelPath
+
+from Code.DebugObject import DebugObject
+from Code.ShaderFileCache import ShaderFileCache
+
+
+class ShaderIncludeResolver(DebugObject):
+
+    """ This class resolves the #pragma include directives of shader code which
+    only exists in memory, so the code can be passed to Shader.make directly
+    instead of being written to a temporary file first.
+
+    Includes are searched the same way panda does it: first relative to the
+    directory of the including file, then on the model path. Files containing
+    #pragma once are only included once per shader program. The content of
+    included files is taken from the ShaderFileCache, so each include is only
+    read once, until it gets modified.
+
+    The resolved code contains #line directives, so the line numbers in
+    compiler errors match the original files. The source string number of
+    each file can be looked up with the file table returned by resolve(). """
+
+    # Maximum nesting depth of includes, to catch include cycles of files
+    # without #pragma once
+    MaxDepth = 32
+
+    def __init__(self):
+        """ Creates a new resolver """
+        DebugObject.__init__(self, "ShaderIncludeResolver")
+        self._vfs = VirtualFileSystem.getGlobalPtr()
+
+    def _findFile(self, includePath, currentDir):
+        """ Internal method to find an included file. Returns the resolved
+        filename, or None if the file could not be found """
+        localPath = Filename(join(currentDir, includePath))
+        if self._vfs.exists(localPath):
+            return localPath.getFullpath()
+
+        globalPath = Filename(includePath)
+        if self._vfs.resolveFilename(globalPath, getModelPath().getValue()):
+            return globalPath.getFullpath()
+
+        return None
+
+    def getDependencies(self, filename):
+        """ Returns the set of all files a shader file depends on, which are
+        the file itself and all files it includes, directly or indirectly """
+        resolvedName = self._findFile(filename, "")
+
+        if resolvedName is None:
+            self.warn("Could not find shader file", filename)
+            return set()
+
+        code = "\n".join(ShaderFileCache.getLines(resolvedName))
+        resolved = self.resolve(code, resolvedName)
+
+        if resolved is None:
+            return set([resolvedName])
+
+        return set(resolved[1])
+
+    def resolve(self, code, sourceName):
+        """ Resolves all includes of the given code. sourceName is the file the
+        code originates from, includes are searched relative to it. Returns a
+        tuple of the resolved code and a list of the files, where the index
+        of each file is the source string number used in the #line
+        directives. Returns None when an include could not be resolved """
+        fileTable = [sourceName]
+        result = []
+
+        if not self._resolveLines(code.splitlines(), sourceName, 0, fileTable,
+                                  set(), result, 0):
+            return None
+
+        return "\n".join(result), fileTable
+
+    def _resolveLines(self, lines, sourceName, sourceIndex, fileTable,
+                      included, result, depth):
+        """ Internal method to resolve the includes of a list of lines, and
+        append the resolved lines to result """
+
+        if depth > self.MaxDepth:
+            self.error("Include depth exceeded in", sourceName,
+                       "- is there an include cycle?")
+            return False
+
+        currentDir = dirname(sourceName)
+
+        for lineIndex, line in enumerate(lines):
+            stripped = line.strip()
+
+            if stripped == "#pragma once":
+                continue
+
+            if not stripped.startswith("#pragma include"):
+                result.append(line)
+                continue
+
+            includePath = stripped[len("#pragma include"):].strip().strip('"<>')
+            filename = self._findFile(includePath, currentDir)
+
+            if filename is None:
+                self.error("Could not resolve include", includePath, "in", sourceName)
+                return False
+
+            includeLines = ShaderFileCache.getLines(filename)
+
+            if filename in included and "#pragma once" in includeLines:
+                continue
+
+            included.add(filename)
+            fileTable.append(filename)
+            result.append("#line 1 " + str(len(fileTable) - 1))
+
+            if not self._resolveLines(includeLines, filename, len(fileTable) - 1,
+                                      fileTable, included, result, depth + 1):
+                return False
+
+            # Continue with the line after the include
+            result.append("#line " + str(lineIndex + 2) + " " + str(sourceIndex))
+
+        return True
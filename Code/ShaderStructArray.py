@@ -97,6 +97,24 @@ class ShaderStructArray(DebugObject):
 
         self._rebindInputs(index, obj)
 
+    def rebindAttributeForAll(self, attrName, indices, values):
+        """ Rebinds a single attribute for many indices at once, indices and
+        values are lists of the same length. This is faster than
+        onPropertyChanged() when many objects only changed a few attributes,
+        e.g. when animating many lights """
+        pstats_SetShaderInputs.start()
+        wrappers = self.ptaWrappers[attrName]
+        if self.attributes[attrName] == "array<int>(6)":
+            for index, value in zip(indices, values):
+                objValue = getattr(value, attrName)
+                wrapper = wrappers[index]
+                for i in range(6):
+                    wrapper[i] = objValue[i]
+        else:
+            for index, value in zip(indices, values):
+                wrappers[index][0] = getattr(value, attrName)
+        pstats_SetShaderInputs.stop()
+
     def _rebindInputs(self, index, value):
         """ Rebinds the shader inputs for an index """
         pstats_SetShaderInputs.start()
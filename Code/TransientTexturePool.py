@@ -0,0 +1,81 @@
+class TransientTexturePool:
+
+    """ The transient texture pool lets render targets share their textures
+    when their lifetimes don't overlap. The lifetime of a texture is the range
+    of passes (in the sorted pass order) from the pass creating it up to the
+    last pass reading one of the outputs of that pass.
+
+    Buffers are rendered in the order they were created, and passes are
+    created in the sorted order. So when a texture is not read anymore after
+    pass n, another pass created after pass n can safely render into the same
+    texture, as long as size and format are the same.
+
+    Only render targets which called setTransient() take part. This should
+    only be used for textures which are not read in a later frame, and which
+    are not accessed outside of the render pass manager. Textures shown in the
+    buffer viewer might show the content of another pass, as they share the
+    memory. The saved memory is reported by the MemoryMonitor. """
+
+    # Texture key -> list of [texture, last pass index]
+    textures = {}
+
+    # Lifetime of the textures created right now, or None
+    currentLifetime = None
+
+    # Amount of textures which were replaced by a shared texture
+    numAliased = 0
+
+    @classmethod
+    def reset(self):
+        """ Clears the pool, this should be done before the passes get created """
+        self.textures = {}
+        self.currentLifetime = None
+        self.numAliased = 0
+
+    @classmethod
+    def beginPass(self, firstUse, lastUse):
+        """ Sets the lifetime for all transient textures created until endPass
+        gets called. The render pass manager calls this before creating each
+        pass """
+        self.currentLifetime = (firstUse, lastUse)
+
+    @classmethod
+    def endPass(self):
+        """ Stops assigning lifetimes to created textures """
+        self.currentLifetime = None
+
+    @classmethod
+    def _getKey(self, tex):
+        """ Internal method to compute a key of all properties of a texture
+        which have to match to be able to share it """
+        return (tex.getTextureType(), tex.getXSize(), tex.getYSize(),
+                tex.getZSize(), tex.getFormat(), tex.getComponentType())
+
+    @classmethod
+    def acquire(self, tex):
+        """ Returns a texture which can be used instead of tex. This is either
+        a texture of an earlier pass which is not used anymore, or tex itself.
+        tex should already have its final size and format. When no pass is
+        being created, tex is returned unchanged """
+
+        if self.currentLifetime is None:
+            return tex
+
+        firstUse, lastUse = self.currentLifetime
+        entries = self.textures.setdefault(self._getKey(tex), [])
+
+        # Passes get created in sorted order, so taking the first free texture
+        # never blocks a later pass
+        for entry in entries:
+            if entry[1] < firstUse:
+                entry[1] = lastUse
+                self.numAliased += 1
+                return entry[0]
+
+        entries.append([tex, lastUse])
+        return tex
+
+    @classmethod
+    def getNumAliased(self):
+        """ Returns how many textures were replaced by a shared texture """
+        return self.numAliased
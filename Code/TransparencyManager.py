@@ -16,6 +16,11 @@ class TransparencyManager(DebugObject):
     Internal OIT is used, with per pixel linked lists. The sorting happens in the
     final transparency pass. """
 
+    # This stores the maximum amount of transparent pixels which can be on the
+    # screen at one time. If the amount of pixels exceeds this value, strong
+    # artifacts will occur!
+    MaxPixelCount = 1920 * 1080 // 2
+
     def __init__(self, pipeline):
         """ Creates the manager, but does not init the buffers """
         DebugObject.__init__(self, "TransparencyManager")
@@ -23,10 +28,7 @@ class TransparencyManager(DebugObject):
 
         self.pipeline = pipeline
 
-        # This stores the maximum amount of transparent pixels which can be on the
-        # screen at one time. If the amount of pixels exceeds this value, strong
-        # artifacts will occur!
-        self.maxPixelCount = 1920 * 1080 / 2
+        self.maxPixelCount = self.MaxPixelCount
         self.initTransparencyPass()
 
     def initTransparencyPass(self):
@@ -47,8 +49,7 @@ class TransparencyManager(DebugObject):
         # into the buffer in the order they are rendered, using the pixelCountBuffer
         # to determine their index 
         self.materialDataBuffer = Texture("MaterialDataBuffer")
-        self.materialDataBuffer.setupBufferTexture(self.maxPixelCount, Texture.TFloat, 
-            Texture.FRgba32, GeomEnums.UH_static)
+        self._setupMaterialDataBuffer()
 
         # Creates the list head buffer, which stores the first transparent pixel for
         # each window pixel. The index stored in this buffer is the index into the 
@@ -92,10 +93,27 @@ class TransparencyManager(DebugObject):
         self.listHeadBuffer.setClearColor(Vec4(0, 0, 0, 0))
 
         MemoryMonitor.addTexture("MaterialCountBuffer", self.pixelCountBuffer)
-        MemoryMonitor.addTexture("MaterialDataBuffer", self.materialDataBuffer)
         MemoryMonitor.addTexture("ListHeadBuffer", self.listHeadBuffer)
         MemoryMonitor.addTexture("SpinLockBuffer", self.spinLockBuffer)
 
+    def _setupMaterialDataBuffer(self):
+        """ Internal method to (re)create the material data buffer with the
+        current pixel count """
+        self.materialDataBuffer.setupBufferTexture(self.maxPixelCount, Texture.TFloat, 
+            Texture.FRgba32, GeomEnums.UH_static)
+        MemoryMonitor.addTexture("MaterialDataBuffer", self.materialDataBuffer)
+
+    def getMaxPixelCount(self):
+        """ Returns the maximum amount of transparent pixels """
+        return self.maxPixelCount
+
+    def setMaxPixelCount(self, count):
+        """ Changes the maximum amount of transparent pixels which can be on
+        the screen at one time. Lower values save memory, but when the amount
+        is exceeded, strong artifacts occur """
+        self.maxPixelCount = count
+        self._setupMaterialDataBuffer()
+
     def update(self):
         """ The update method clears the buffers before rendering the next frame """
         self.pixelCountBuffer.clearImage()
@@ -0,0 +1,71 @@
+"""
+
+Effect loading benchmark
+
+Measures how long it takes to load the effects shipped with the pipeline,
+once with the ShaderFileCache disabled (every template and include is read
+again for each stage and program) and once with it enabled. The effect
+source cache is not used, so all effects get parsed each time. Run this from
+the Toolkit/Benchmarks directory.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+sys.path.insert(0, "../../")
+
+from panda3d.core import loadPrcFileData
+
+loadPrcFileData("", "window-type offscreen")
+loadPrcFileData("", "audio-library-name null")
+
+import direct.directbase.DirectStart
+
+from Code.Globals import Globals
+from Code.MountManager import MountManager
+from Code.Effect import Effect
+from Code.ShaderIncludeResolver import ShaderIncludeResolver
+from Code.ShaderFileCache import ShaderFileCache
+
+Globals.load(base)
+
+mountManager = MountManager()
+mountManager.setBasePath("../../")
+mountManager.setWritePath("../../Temp")
+mountManager.mount()
+
+numRounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+effects = ["Effects/Default/Default.effect", "Effects/Default/Default.effect",
+           "Effects/Skybox/Skybox.effect", "Effects/Water/ProjectedWater.effect"]
+settings = [{}, {"transparent": True}, {"castShadows": False}, {}]
+
+
+def loadEffects():
+    """ Loads all effects numRounds times """
+    resolver = ShaderIncludeResolver()
+    for i in range(numRounds):
+        for filename, effectSettings in zip(effects, settings):
+            effect = Effect()
+            effect.setSettings(effectSettings)
+            effect.load(filename, None, resolver)
+
+
+def measure(name, func):
+    start = time.time()
+    func()
+    duration = time.time() - start
+    print(name.ljust(30), "{:8.2f} ms".format(duration * 1000.0))
+
+
+print("Loading", len(effects), "effects", numRounds, "times")
+
+ShaderFileCache.setEnabled(False)
+measure("Without file cache", loadEffects)
+print("File cache stats:", ShaderFileCache.getStats())
+
+ShaderFileCache.setEnabled(True)
+measure("With file cache", loadEffects)
+print("File cache stats:", ShaderFileCache.getStats())
@@ -0,0 +1,121 @@
+"""
+
+Light set loading benchmark
+
+Compares building a level's lights from python code (constructing each light
+and configuring it with the setters) with loading the same lights from a
+binary light set file written by LightSetFile.
+
+Afterwards the lights get attached to a pipeline, once with addLight for each
+light, once with addLights, and once with importLightSet which loads and
+attaches the file. Only as many lights as the light manager has slots for get
+attached. Run this from the Toolkit/Benchmarks directory.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+from random import random, seed
+
+sys.path.insert(0, "../../")
+
+from panda3d.core import loadPrcFileData, Vec3
+
+loadPrcFileData("", "window-type offscreen")
+loadPrcFileData("", "audio-library-name null")
+
+import direct.directbase.DirectStart
+
+from Code.DebugObject import DebugObject
+from Code.RenderingPipeline import RenderingPipeline
+from Code.PointLight import PointLight
+from Code.SpotLight import SpotLight
+from Code.LightSetFile import LightSetFile
+
+pipeline = RenderingPipeline(base)
+pipeline.getMountManager().setBasePath("../../")
+pipeline.getMountManager().setWritePath("../../Temp/")
+pipeline.loadSettings("../../Config/pipeline.ini")
+DebugObject.setOutputLevel("warning")
+pipeline.create()
+lightManager = pipeline.lightManager
+
+numLights = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+filename = "$$-LightSetBenchmark.rpls"
+
+seed(42)
+params = [(Vec3(random() * 100, random() * 100, random() * 10),
+           Vec3(random(), random(), random()), 5.0 + random() * 20.0)
+          for i in range(numLights)]
+
+
+def buildFromCode(count=numLights):
+    """ Builds the lights the way level code does it """
+    lights = []
+    for index, (pos, color, radius) in enumerate(params[:count]):
+        if index % 4 == 0:
+            light = SpotLight()
+            light.setNearFar(0.5, radius)
+            light.setFov(60)
+            light.setPos(pos)
+            light.lookAt(pos + Vec3(0, 0, -1))
+            light.setIESProfile("Defined")
+        else:
+            light = PointLight()
+            light.setPos(pos)
+            light.setRadius(radius)
+        light.setColor(color)
+        lights.append(light)
+    return lights
+
+
+def measure(name, func):
+    start = time.time()
+    result = func()
+    duration = time.time() - start
+    print(name.ljust(30), "{:8.2f} ms".format(duration * 1000.0))
+    return result
+
+
+print("Benchmarking", numLights, "lights")
+lights = measure("Build from code", buildFromCode)
+measure("Write light set", lambda: LightSetFile().save(filename, lights))
+loaded = measure("Load light set", lambda: LightSetFile().load(filename))
+
+assert len(loaded) == len(lights)
+
+
+def attachEach(lights):
+    """ Attaches the lights one by one """
+    return sum(1 for light in lights if lightManager.addLight(light))
+
+
+def detachAll(lights):
+    """ Removes the attached lights again, so the next round starts with
+    empty slots """
+    for light in lights:
+        if light.attached:
+            lightManager.removeLight(light)
+
+
+# Lights can not be attached again once removed, so each round gets new ones
+numAttached = min(numLights, len(lightManager.lightSlots))
+print("Attaching", numAttached, "lights")
+
+lights = buildFromCode(numAttached)
+assert measure("Attach with addLight", lambda: attachEach(lights)) == numAttached
+detachAll(lights)
+
+lights = buildFromCode(numAttached)
+assert measure("Attach with addLights", lambda: lightManager.addLights(lights)) == numAttached
+detachAll(lights)
+
+LightSetFile().save(filename, buildFromCode(numAttached))
+lights = measure("Load and attach light set", lambda: lightManager.importLightSet(filename))
+assert sum(1 for light in lights if light.attached) == numAttached
+detachAll(lights)
+
+import os
+os.remove(filename)
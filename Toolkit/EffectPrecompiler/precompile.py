@@ -0,0 +1,175 @@
+"""
+
+Effect Precompiler
+
+Generates the shader sources of effect permutations ahead of time, and stores
+them in the effect source cache, so the pipeline does not have to generate
+them at runtime. The sources are generated in parallel, using one process per
+core.
+
+The permutations are taken from:
+
+    - The permutations recorded by the pipeline (EffectPermutations.json in
+      the write path). Every effect loaded while running the application
+      gets recorded there.
+    - Asset lists passed on the command line. An asset list is a json file
+      containing a list of {"effect": "Effects/...", "settings": {...}}
+      entries, the same format as the recorded permutations.
+    - All effects in the Effects/ directory with their default settings,
+      when --all is passed.
+
+Run this from the Toolkit/EffectPrecompiler directory, with the same write
+path as the application, e.g.:
+
+    python precompile.py --write-path ../../Temp/ --all assets.json
+
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import argparse
+
+from os import listdir
+from os.path import join, isdir
+from multiprocessing import Pool, cpu_count
+
+sys.path.insert(0, "../../")
+
+from panda3d.core import loadPrcFileData
+
+loadPrcFileData("", "notify-level-pnmimage error")
+
+from Code.MountManager import MountManager
+from Code.Effect import Effect
+from Code.EffectLoader import EffectLoader
+from Code.EffectSourceCache import EffectSourceCache
+from Code.DebugObject import DebugObject
+
+
+def mount(basePath, writePath):
+    """ Mounts the pipeline directories, this is done in every process """
+    mountManager = MountManager()
+    mountManager.setBasePath(basePath)
+    mountManager.setWritePath(writePath)
+    mountManager.mount()
+    return mountManager
+
+
+def initWorker(basePath, writePath):
+    """ Initializes a worker process """
+    DebugObject.setOutputLevel("warning")
+    mount(basePath, writePath)
+
+
+def generate(job):
+    """ Generates the sources of a single permutation. This runs in a worker
+    process, the result is stored in the cache by the main process, so only
+    one process writes to it """
+    filename, settings = job
+    effect = Effect()
+    effect.setSettings(settings)
+    content = effect.generateSources(filename)
+    return (filename, effect.getSerializedSettings(), content, effect.name,
+            effect.shaderParts, sorted(effect.templates))
+
+
+def findEffects(directory):
+    """ Returns all effect files in the given directory and its subdirectories """
+    effects = []
+    for name in sorted(listdir(directory)):
+        path = join(directory, name)
+        if isdir(path):
+            effects += findEffects(path)
+        elif name.endswith(".effect"):
+            effects.append(path)
+    return effects
+
+
+def collectPermutations(args):
+    """ Collects all permutations from the given sources, returns a list of
+    (effect, settings) tuples without duplicates """
+    permutations = []
+
+    if not args.no_recorded:
+        recorded = EffectLoader.PermutationFile.replace("PipelineTemp/", "")
+        try:
+            with open(join(args.write_path, recorded), "r") as handle:
+                permutations += json.load(handle)
+        except IOError:
+            print("No recorded permutations found")
+
+    for assetList in args.assets:
+        with open(assetList, "r") as handle:
+            permutations += json.load(handle)
+
+    if args.all:
+        for path in findEffects(join(args.base_path, "Effects")):
+            relativePath = path[len(args.base_path):].replace("\\", "/").lstrip("/")
+            permutations.append({"effect": relativePath, "settings": {}})
+
+    jobs = []
+    seen = set()
+    for permutation in permutations:
+        settings = permutation.get("settings", {})
+        key = permutation["effect"] + "#" + Effect().getSerializedSettings(settings)
+        if key not in seen:
+            seen.add(key)
+            jobs.append((permutation["effect"], settings))
+
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompiles effect permutations")
+    parser.add_argument("assets", nargs="*", help="Asset lists (json) to read permutations from")
+    parser.add_argument("--all", action="store_true", help="Add all effects with the default settings")
+    parser.add_argument("--no-recorded", action="store_true", help="Ignore the recorded permutations")
+    parser.add_argument("--base-path", default="../../", help="Pipeline root directory")
+    parser.add_argument("--write-path", default="../../Temp/", help="Write path of the application")
+    parser.add_argument("--cache-size", type=int, default=64, help="Maximum cache size in MB")
+    parser.add_argument("--jobs", type=int, default=cpu_count(), help="Amount of worker processes")
+    args = parser.parse_args()
+
+    mount(args.base_path, args.write_path)
+    cache = EffectSourceCache(args.cache_size * 1024 * 1024)
+
+    jobs = collectPermutations(args)
+    print("Found", len(jobs), "permutations")
+
+    # Skip the permutations which are already cached
+    missing = []
+    for filename, settings in jobs:
+        effect = Effect()
+        effect.setSettings(settings)
+        try:
+            with open(join(args.base_path, filename), "r") as handle:
+                content = handle.read()
+        except IOError:
+            print("Skipping", filename, "- file not found")
+            continue
+        key = cache.computeKey(content, effect.getSerializedSettings())
+        if cache.lookup(key) is None:
+            missing.append((filename, settings))
+
+    print("Generating", len(missing), "uncached permutations with", args.jobs, "processes")
+
+    startTime = time.time()
+    pool = Pool(args.jobs, initWorker, (args.base_path, args.write_path))
+
+    for filename, serialized, content, name, shaderParts, templates in \
+            pool.imap_unordered(generate, missing):
+        cache.store(cache.computeKey(content, serialized), name, shaderParts, templates)
+        print("Generated", filename, serialized)
+
+    pool.close()
+    pool.join()
+    cache.save()
+
+    print("Done in {:.2f} s, cache stats:".format(time.time() - startTime), cache.getStats())
+
+
+if __name__ == "__main__":
+    main()
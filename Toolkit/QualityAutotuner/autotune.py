@@ -0,0 +1,372 @@
+"""
+
+Quality Autotuner
+
+Finds the pipeline settings which give the best quality while staying within
+a frame budget on the current machine and scene. Each configuration is
+measured by running benchmark.py in a new process, which renders the scene
+along a scripted camera path and records the frame times.
+
+The search works in three steps:
+
+    1. Knobs which only affect performance (e.g. the light culling patch
+       size) are set to their fastest value.
+    2. The cost of every quality knob is measured by setting it to its
+       cheapest value. The knobs are ranked by the time saved, knobs which
+       do not save anything on this machine and scene are left untouched.
+    3. While over budget, the knobs are lowered one step at a time, most
+       expensive knob first (coordinate descent), or by always taking the
+       step which saves the most time (greedy, needs more runs). Afterwards
+       the cheapest knobs are raised again as long as the budget allows it.
+
+The result is a copy of the base settings file with the tuned values. Run this
+from the Toolkit/QualityAutotuner directory, e.g.:
+
+    python autotune.py --budget 16.6 --scene Models/HouseSet/Model.egg
+
+"""
+
+from __future__ import print_function
+
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from os import remove, close
+from os.path import isfile
+
+
+# Knobs which do not change the image, only the performance
+SpeedKnobs = [
+    ("computePatchSizeX", [16, 32, 64, 128]),
+    ("computePatchSizeY", [16, 32, 64, 128]),
+]
+
+# Knobs affecting the quality, with their values from the most expensive to
+# the cheapest one. The value of the base settings file is inserted into
+# numeric lists when it is not contained
+QualityKnobs = [
+    ("resolution3D", [1.0, 0.9, 0.8, 0.7, 0.6, 0.5]),
+    ("giQualityLevel", ["Ultra", "High", "Medium", "Low"]),
+    ("smaaQuality", ["Ultra", "High", "Medium", "Low"]),
+    ("usePCSS", [True, False]),
+    ("numPCFSamples", [64, 32, 16, 8, 4]),
+    ("numPCSSSearchSamples", [64, 32, 16, 8]),
+    ("numPCSSFilterSamples", [64, 32, 16, 8]),
+    ("maxShadowUpdatesPerFrame", [16, 8, 4, 2, 1]),
+    ("occlusionSampleCount", [16, 8, 4, 2]),
+    ("sslrUseHalfRes", [False, True]),
+    ("sslrNumSteps", [64, 32, 16, 8]),
+    ("motionBlurSamples", [32, 16, 8, 4]),
+]
+
+
+def formatValue(value):
+    """ Converts a value to the format used in the settings file """
+    if isinstance(value, bool):
+        return "True" if value else "False"
+    if isinstance(value, str):
+        return '"' + value + '"'
+    return str(value)
+
+
+def parseValue(value):
+    """ Converts a value of the settings file to a python value """
+    value = value.strip()
+    if value.lower() in ["true", "false"]:
+        return value.lower() == "true"
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value.strip('"')
+
+
+class SettingsFile:
+
+    """ Stores the lines of a settings file, so a copy with some values
+    replaced can be written without losing the comments """
+
+    LinePattern = re.compile(r"^(\s*)([A-Za-z0-9_]+)(\s*=\s*)(.*?)\s*$")
+
+    def __init__(self, filename):
+        with open(filename, "r") as handle:
+            self.lines = handle.read().splitlines()
+
+        self.values = {}
+        for line in self.lines:
+            match = self.LinePattern.match(line)
+            if match and not line.strip().startswith("#"):
+                self.values[match.group(2)] = parseValue(match.group(4))
+
+    def write(self, filename, overrides, header=None):
+        """ Writes the file with the given values replaced """
+        output = []
+        if header is not None:
+            output += ["# " + line for line in header]
+            output.append("")
+
+        for line in self.lines:
+            match = self.LinePattern.match(line)
+            if match and match.group(2) in overrides and not line.strip().startswith("#"):
+                line = match.group(1) + match.group(2) + match.group(3) + \
+                    formatValue(overrides[match.group(2)])
+            output.append(line)
+
+        with open(filename, "w") as handle:
+            handle.write("\n".join(output) + "\n")
+
+
+class Autotuner:
+
+    """ Searches the settings space, see the module docstring """
+
+    def __init__(self, args):
+        self.args = args
+        self.settings = SettingsFile(args.settings)
+        self.results = {}
+        self.numRuns = 0
+
+        self.knobs = {}
+        for name, candidates in SpeedKnobs + QualityKnobs:
+            if name not in self.settings.values:
+                print("Skipping", name, "- not in the settings file")
+                continue
+            candidates = self.insertBaseValue(candidates, self.settings.values[name])
+            if candidates is not None:
+                self.knobs[name] = candidates
+
+        self.config = dict((name, self.settings.values[name]) for name in self.knobs)
+
+    def insertBaseValue(self, candidates, value):
+        """ Returns the candidates of a knob, including the base value """
+        if value in candidates:
+            return list(candidates)
+
+        if not isinstance(value, bool) and isinstance(value, (int, float)):
+            descending = candidates[0] > candidates[-1]
+            return sorted(set(candidates + [value]), reverse=descending)
+
+        print("Skipping knob with unknown value:", value)
+        return None
+
+    def measure(self, config):
+        """ Runs the benchmark with the given configuration and returns the
+        measured frame time. Results are cached, so each configuration only
+        runs once """
+        key = tuple(sorted(config.items()))
+        if key in self.results:
+            return self.results[key]
+
+        handle, settingsFile = tempfile.mkstemp(suffix=".ini")
+        close(handle)
+        handle, outputFile = tempfile.mkstemp(suffix=".json")
+        close(handle)
+
+        self.settings.write(settingsFile, config)
+
+        command = [sys.executable, "benchmark.py", settingsFile, outputFile,
+                   "--scene", self.args.scene,
+                   "--frames", str(self.args.frames),
+                   "--warmup", str(self.args.warmup),
+                   "--width", str(self.args.width),
+                   "--height", str(self.args.height)]
+        if self.args.path is not None:
+            command += ["--path", self.args.path]
+
+        self.numRuns += 1
+        try:
+            subprocess.check_call(command)
+            with open(outputFile, "r") as handle:
+                frameTime = json.load(handle)[self.args.metric]
+        except (subprocess.CalledProcessError, IOError, ValueError, KeyError) as msg:
+            print("Benchmark failed:", msg)
+            frameTime = float("inf")
+        finally:
+            remove(settingsFile)
+            if isfile(outputFile):
+                remove(outputFile)
+
+        self.results[key] = frameTime
+        print("  {:8.2f} ms  {}".format(frameTime, self.describe(config)))
+        return frameTime
+
+    def describe(self, config):
+        """ Returns the values which differ from the base settings """
+        changed = ["{}={}".format(name, formatValue(value))
+                   for name, value in sorted(config.items())
+                   if value != self.settings.values[name]]
+        return ", ".join(changed) if changed else "(base settings)"
+
+    def isFaster(self, frameTime, reference):
+        """ Returns whether frameTime is faster than the reference by more than
+        the measurement noise """
+        return frameTime < reference * (1.0 - self.args.noise)
+
+    def step(self, config, name, direction):
+        """ Returns a copy of the configuration with the knob moved one value
+        towards the cheaper (direction = 1) or more expensive (direction = -1)
+        end, or None if it is already at the end """
+        candidates = self.knobs[name]
+        index = candidates.index(config[name]) + direction
+        if index < 0 or index >= len(candidates):
+            return None
+        config = dict(config)
+        config[name] = candidates[index]
+        return config
+
+    def tuneSpeedKnobs(self, frameTime):
+        """ Sets the knobs which only affect performance to their fastest
+        value, one after another """
+        for name, _ in SpeedKnobs:
+            if name not in self.knobs:
+                continue
+            for value in self.knobs[name]:
+                config = dict(self.config)
+                config[name] = value
+                candidateTime = self.measure(config)
+                if self.isFaster(candidateTime, frameTime):
+                    self.config, frameTime = config, candidateTime
+        return frameTime
+
+    def rankQualityKnobs(self, frameTime):
+        """ Measures how much time each quality knob saves when set to its
+        cheapest value, and returns the knobs sorted by the saved time """
+        ranking = []
+        for name, _ in QualityKnobs:
+            if name not in self.knobs or self.config[name] == self.knobs[name][-1]:
+                continue
+            config = dict(self.config)
+            config[name] = self.knobs[name][-1]
+            candidateTime = self.measure(config)
+            if self.isFaster(candidateTime, frameTime):
+                ranking.append((frameTime - candidateTime, name))
+            else:
+                print("  ", name, "has no measurable cost, leaving it untouched")
+
+        ranking.sort(reverse=True)
+        return [name for saved, name in ranking]
+
+    def lowerCoordinate(self, ranking, frameTime):
+        """ Lowers the knobs one step at a time, most expensive knob first,
+        until the budget is met """
+        changed = True
+        while frameTime > self.args.budget and changed:
+            changed = False
+            for name in ranking:
+                while frameTime > self.args.budget:
+                    config = self.step(self.config, name, 1)
+                    if config is None:
+                        break
+                    candidateTime = self.measure(config)
+                    if not self.isFaster(candidateTime, frameTime):
+                        break
+                    self.config, frameTime = config, candidateTime
+                    changed = True
+        return frameTime
+
+    def lowerGreedy(self, ranking, frameTime):
+        """ Lowers the knob which saves the most time, until the budget is
+        met """
+        while frameTime > self.args.budget:
+            best = None
+            for name in ranking:
+                config = self.step(self.config, name, 1)
+                if config is None:
+                    continue
+                candidateTime = self.measure(config)
+                if best is None or candidateTime < best[0]:
+                    best = (candidateTime, config)
+
+            if best is None or not self.isFaster(best[0], frameTime):
+                break
+            frameTime, self.config = best
+        return frameTime
+
+    def raiseCheapest(self, ranking, frameTime):
+        """ Raises the cheapest knobs again, as long as the budget allows it.
+        Knobs are never raised above the value of the base settings """
+        for name in reversed(ranking):
+            while self.config[name] != self.settings.values[name]:
+                config = self.step(self.config, name, -1)
+                if config is None:
+                    break
+                candidateTime = self.measure(config)
+                if candidateTime > self.args.budget:
+                    break
+                self.config, frameTime = config, candidateTime
+        return frameTime
+
+    def run(self):
+        """ Runs the search and writes the tuned settings file """
+        startTime = time.time()
+
+        print("Measuring base settings")
+        frameTime = self.measure(self.config)
+
+        print("Tuning speed knobs")
+        frameTime = self.tuneSpeedKnobs(frameTime)
+
+        if frameTime > self.args.budget:
+            print("Ranking quality knobs by cost")
+            ranking = self.rankQualityKnobs(frameTime)
+            print("Ranking:", ", ".join(ranking))
+
+            print("Lowering quality to meet the budget of", self.args.budget, "ms")
+            if self.args.strategy == "greedy":
+                frameTime = self.lowerGreedy(ranking, frameTime)
+            else:
+                frameTime = self.lowerCoordinate(ranking, frameTime)
+
+            print("Raising cheap knobs within the budget")
+            frameTime = self.raiseCheapest(ranking, frameTime)
+
+        if frameTime > self.args.budget:
+            print("Could not reach the budget, the lowest settings take",
+                  "{:.2f} ms".format(frameTime))
+
+        header = [
+            "Tuned by the quality autotuner for {} at {}x{}".format(
+                self.args.scene, self.args.width, self.args.height),
+            "Budget: {:.2f} ms, measured {}: {:.2f} ms".format(
+                self.args.budget, self.args.metric, frameTime),
+            "Changed: " + self.describe(self.config),
+        ]
+        self.settings.write(self.args.output, self.config, header)
+
+        print("Done after", self.numRuns, "runs in {:.0f} s".format(time.time() - startTime))
+        print("Result: {:.2f} ms".format(frameTime), self.describe(self.config))
+        print("Written to", self.args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tunes the pipeline settings to a frame budget")
+    parser.add_argument("--budget", type=float, default=16.6, help="Target frame time in ms")
+    parser.add_argument("--metric", default="p95", choices=["avg", "p50", "p95", "p99"],
+                        help="Frame time statistic compared against the budget")
+    parser.add_argument("--strategy", default="coordinate", choices=["coordinate", "greedy"],
+                        help="Search strategy to lower the quality")
+    parser.add_argument("--settings", default="../../Config/pipeline.ini", help="Base settings file")
+    parser.add_argument("--output", default="pipeline-tuned.ini", help="Tuned settings file to write")
+    parser.add_argument("--scene", default="Models/HouseSet/Model.egg", help="Scene to render")
+    parser.add_argument("--path", default=None, help="Camera path (json), see benchmark.py")
+    parser.add_argument("--frames", type=int, default=300, help="Frames to measure per run")
+    parser.add_argument("--warmup", type=int, default=60, help="Frames to skip per run")
+    parser.add_argument("--width", type=int, default=1600, help="Window width")
+    parser.add_argument("--height", type=int, default=900, help="Window height")
+    parser.add_argument("--noise", type=float, default=0.03,
+                        help="Relative difference below which timings count as equal")
+    args = parser.parse_args()
+
+    Autotuner(args).run()
+
+
+if __name__ == "__main__":
+    main()
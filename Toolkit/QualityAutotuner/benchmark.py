@@ -0,0 +1,169 @@
+"""
+
+Quality Autotuner - Benchmark runner
+
+Runs the pipeline with a given settings file, moves the camera along a
+scripted path and records the time of every frame. The result is written as
+json to the given output file. This is started by autotune.py once for each
+configuration, since most settings can only be applied when creating the
+pipeline.
+
+The camera path is a json file containing a list of keyframes:
+
+    [
+        {"pos": [0, -20, 5], "hpr": [0, -10, 0]},
+        {"pos": [20, 0, 5], "hpr": [90, -10, 0]}
+    ]
+
+The keyframes are interpolated over the measured frames based on the frame
+index, not the elapsed time, so every configuration renders the exact same
+views. Without a path, the camera orbits around the scene.
+
+"""
+
+import sys
+import json
+import math
+import argparse
+
+sys.path.insert(0, "../../")
+
+from panda3d.core import loadPrcFile, loadPrcFileData, Vec3
+
+parser = argparse.ArgumentParser(description="Measures the frame times of a pipeline configuration")
+parser.add_argument("settings", help="Pipeline settings file to use")
+parser.add_argument("output", help="File to write the results to")
+parser.add_argument("--scene", default="Models/HouseSet/Model.egg", help="Scene to render")
+parser.add_argument("--path", default=None, help="Camera path (json)")
+parser.add_argument("--frames", type=int, default=300, help="Amount of frames to measure")
+parser.add_argument("--warmup", type=int, default=60, help="Amount of frames to skip first")
+parser.add_argument("--width", type=int, default=1600, help="Window width")
+parser.add_argument("--height", type=int, default=900, help="Window height")
+args = parser.parse_args()
+
+loadPrcFile("../../Config/configuration.prc")
+
+# Vsync would clamp all frame times to the refresh rate
+loadPrcFileData("", "sync-video false")
+loadPrcFileData("", "show-frame-rate-meter false")
+loadPrcFileData("", "audio-library-name null")
+loadPrcFileData("", "win-size " + str(args.width) + " " + str(args.height))
+
+from direct.showbase.ShowBase import ShowBase
+
+from Code.RenderingPipeline import RenderingPipeline
+from Code.DirectionalLight import DirectionalLight
+from Code.DebugObject import DebugObject
+
+
+class Benchmark(ShowBase):
+
+    """ Renders the scene along the camera path and records the frame times """
+
+    def __init__(self):
+        DebugObject.setOutputLevel("warning")
+        ShowBase.__init__(self)
+
+        self.renderPipeline = RenderingPipeline(self)
+        self.renderPipeline.getMountManager().setBasePath("../../")
+        self.renderPipeline.getMountManager().setWritePath("../../Temp/")
+        self.renderPipeline.loadSettings(args.settings)
+        self.renderPipeline.create()
+
+        self.scene = loader.loadModel(args.scene)
+        self.scene.reparentTo(render)
+        self.renderPipeline.setEffect(self.scene, "Effects/Default/Default.effect", {})
+
+        self.skybox = self.renderPipeline.getDefaultSkybox()
+        self.skybox.reparentTo(render)
+
+        sun = DirectionalLight()
+        sun.setPos(Vec3(60, 30, 100) * 100000.0)
+        sun.setShadowMapResolution(2048)
+        sun.setColor(Vec3(1.0, 1.0, 1.0) * 5.0)
+        sun.setCastsShadows(True)
+        sun.setPssmDistance(140)
+        self.renderPipeline.addLight(sun)
+        self.renderPipeline.setScatteringSource(sun)
+
+        self.keyframes = self.loadPath()
+        self.frameIndex = 0
+        self.frameTimes = []
+        self.lastFrameStart = None
+
+        self.renderPipeline.onSceneInitialized()
+        self.addTask(self.update, "benchmarkUpdate", sort=-100)
+
+    def loadPath(self):
+        """ Loads the camera path, or generates an orbit around the scene """
+        if args.path is not None:
+            with open(args.path, "r") as handle:
+                keyframes = json.load(handle)
+            return [(Vec3(*k["pos"]), Vec3(*k["hpr"])) for k in keyframes]
+
+        bounds = self.scene.getBounds()
+        center = bounds.getCenter()
+        radius = max(1.0, bounds.getRadius())
+
+        keyframes = []
+        for i in range(9):
+            angle = i / 8.0 * 2.0 * math.pi
+            pos = center + Vec3(math.sin(angle), -math.cos(angle), 0.3) * radius
+            keyframes.append((pos, Vec3(math.degrees(angle), -15, 0)))
+        return keyframes
+
+    def placeCamera(self, progress):
+        """ Places the camera on the path, progress goes from 0 to 1 """
+        position = progress * (len(self.keyframes) - 1)
+        index = min(int(position), len(self.keyframes) - 2)
+        factor = position - index
+
+        posA, hprA = self.keyframes[index]
+        posB, hprB = self.keyframes[index + 1]
+        self.camera.setPos(posA + (posB - posA) * factor)
+        self.camera.setHpr(hprA + (hprB - hprA) * factor)
+
+    def update(self, task):
+        """ Moves the camera and records the time of the last frame """
+        now = globalClock.getRealTime()
+        if self.lastFrameStart is not None and self.frameIndex > args.warmup:
+            self.frameTimes.append((now - self.lastFrameStart) * 1000.0)
+        self.lastFrameStart = now
+
+        if len(self.frameTimes) >= args.frames:
+            self.writeResults()
+            sys.exit(0)
+
+        measured = max(0, self.frameIndex - args.warmup)
+        if len(self.keyframes) > 1:
+            self.placeCamera(min(1.0, measured / float(max(1, args.frames))))
+        else:
+            self.camera.setPos(self.keyframes[0][0])
+            self.camera.setHpr(self.keyframes[0][1])
+
+        self.frameIndex += 1
+        return task.cont
+
+    def writeResults(self):
+        """ Writes the frame times and the pass timings to the output file """
+        frameTimes = sorted(self.frameTimes)
+
+        def percentile(p):
+            return frameTimes[min(len(frameTimes) - 1, int(p / 100.0 * len(frameTimes)))]
+
+        result = {
+            "frameTimes": self.frameTimes,
+            "avg": sum(frameTimes) / len(frameTimes),
+            "min": frameTimes[0],
+            "max": frameTimes[-1],
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "passTimings": self.renderPipeline.getRenderPassManager().getPassTimings(),
+        }
+
+        with open(args.output, "w") as handle:
+            json.dump(result, handle, indent=2)
+
+
+Benchmark().run()
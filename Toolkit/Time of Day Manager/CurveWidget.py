@@ -31,6 +31,9 @@ class CurveWidget(QtGui.QWidget):
 
         for i in xrange(441):
             sampled = self.prop.getInterpolatedValue(i / 441.0)
-            linear = self.prop.propType.asUniform(sampled)
-            painter.drawPoint(
-                i, 151 - (linear * self.adjustedHeight) - self.marginBottom)
+
+            # Vector properties draw one curve per component
+            for component in self.prop.propType.getComponents(sampled):
+                linear = self.prop.propType.asUniform(component)
+                painter.drawPoint(
+                    i, 151 - (linear * self.adjustedHeight) - self.marginBottom)
@@ -1,20 +1,37 @@
+import struct
+
+from array import array
+from collections import OrderedDict
 
 from DayProperty import DayProperty
 
 from DebugObject import DebugObject
 from direct.stdpy.file import open, isfile
+from panda3d.core import PTAFloat
 
 
 class TimeOfDay(DebugObject):
-
     """ This class manages the time of day settings. It has a list of all
-    available properties and can interpolate between them """
+    available properties and can interpolate between them.
+
+    The values are packed into one float array shader input per category
+    (e.g. all sun properties), in the order of getPropertyKeys(). Vector and
+    color properties take 3 floats. The curves of each property are baked
+    into a lookup table, so updating only has to compute the table position
+    once, and interpolate two samples per float.
+
+    The properties can be stored as text, or as binary file which also
+    contains the baked tables, so loading it does not evaluate any curve. """
+
+    BinaryMagic = b"TODB"
+    BinaryVersion = 1
 
     def __init__(self):
         """ Creates a new time of day instance. Remember to call load() before
         using this instance """
         DebugObject.__init__(self, "TimeOfDay")
         self._createProperties()
+        self._createPackedStorage()
 
     def _createProperties(self):
         """ Internal method to populate the property list """
@@ -31,41 +48,88 @@ class TimeOfDay(DebugObject):
             self.propertiesOrdered.append(eid)
 
         addEntry('sun.angle', DayProperty("Angle", "float", 0.0, 360.0, 0.0, """
-            Sun direction in degrees""") )
+            Sun direction in degrees"""))
 
         addEntry('sun.height', DayProperty("Height", "float", 0.0, 1.0, 0.5, """
-            Sun height relative to the planet""") )
+            Sun height relative to the planet"""))
+
+        addEntry('sun.color', DayProperty("Color", "color", 0.0, 1.0, (1.0, 1.0, 1.0), """
+            Color of the sun light"""))
 
         addEntry('lighting.exposure', DayProperty("Exposure", "float", 0.0, 2.0, 1.0, """
-            HDR Factor""") )
+            HDR Factor"""))
 
         addEntry('fog.start', DayProperty("Start", "float", 0.0, 1000.0, 500.0, """
-            Where the fog starts, in world-space units""") )
+            Where the fog starts, in world-space units"""))
 
         addEntry('fog.end', DayProperty("End", "float", 0.0, 20000.0, 9000.0, """
-             Where the fog ends, in world-space units""") )
+             Where the fog ends, in world-space units"""))
+
+        addEntry('fog.color', DayProperty("Color", "color", 0.0, 1.0, (0.6, 0.7, 0.8), """
+             Color of the fog"""))
+
+    def _createPackedStorage(self):
+        """ Internal method to create the packed shader input of each category.
+        Stores the offset of each property in its input, and a list of
+        (table, numComponents, component) for each float of the inputs """
+        self.buffers = OrderedDict()
+        self.layout = {}
+        self.bufferEntries = OrderedDict()
+
+        for propId in self.propertiesOrdered:
+            prop = self.properties[propId]
+            category = propId.split(".")[0]
+            entries = self.bufferEntries.setdefault(category, [])
+            self.layout[propId] = (category, len(entries))
+
+            for component in range(prop.numComponents):
+                entries.append((prop.getTable(), prop.numComponents, component))
+
+        for category, entries in self.bufferEntries.items():
+            self.buffers[category] = PTAFloat.emptyArray(len(entries))
 
     def getProperties(self):
         """ Returns all properties """
         return self.properties
 
-    def bindTo(self, node, uniformName):
-        """ Binds the shader inputs to a node. This only has to be done once """
+    def getInputName(self, uniformName, category):
+        """ Returns the name of the shader input of a category """
+        return uniformName + "_" + category
 
-        for propid, prop in self.properties.items():
-            name = propid.replace(".", "_")
-            node.setShaderInput(name, prop.getPTA())
+    def bindTo(self, node, uniformName):
+        """ Binds the packed shader inputs to a node. This only has to be done
+        once. Each category is bound as <uniformName>_<category>, declare them
+        as float arrays with the sizes defined in the generated include, and
+        use unpackTimeOfDay() to get the TimeOfDay struct """
+        for category, buff in self.buffers.items():
+            node.setShaderInput(self.getInputName(uniformName, category), buff)
 
     def update(self, timestamp):
         """ Updates all shader inputs. timestamp should be between 0 and 1 and
         represents the time of the day, so 0 means 0:00 and 1.0 means 24:00 """
 
         if timestamp < 0.0 or timestamp > 1.0:
-            self.warn("Invalid timestamp:",timestamp)
-
-        for prop in self.properties.values():
-            val = prop.getInterpolatedValue(timestamp)
-            prop.getPTA()[0] = val
+            self.warn("Invalid timestamp:", timestamp)
+
+        tableSize = DayProperty.TableSize
+        position = (timestamp % 1.0) * tableSize
+        index = int(position)
+        nextIndex = (index + 1) % tableSize
+        factor = position - index
+
+        for category, entries in self.bufferEntries.items():
+            buff = self.buffers[category]
+            for slot, (table, stride, component) in enumerate(entries):
+                start = table[index * stride + component]
+                buff[slot] = start + (table[nextIndex * stride + component] - start) * factor
+
+    def getValue(self, propId):
+        """ Returns the value of a property at the last update """
+        category, offset = self.layout[propId]
+        prop = self.properties[propId]
+        buff = self.buffers[category]
+        return prop.propType.fromComponents(
+            [buff[offset + i] for i in range(prop.numComponents)])
 
     def getPropertyKeys(self):
         """ Returns all property keys, ordered """
@@ -76,7 +140,8 @@ class TimeOfDay(DebugObject):
         return self.properties[prop]
 
     def load(self, filename):
-        """ Loads the property values from <filename> """
+        """ Loads the property values from <filename>, which can either be a
+        text file written by save(), or a binary file written by saveBinary() """
 
         self.debug("Loading from", filename)
 
@@ -84,10 +149,13 @@ class TimeOfDay(DebugObject):
             self.error("Could not load", filename)
             return False
 
-        with open(filename, "r") as handle:
-            content = handle.readlines()
+        with open(filename, "rb") as handle:
+            content = handle.read()
 
-        for line in content:
+        if content.startswith(self.BinaryMagic):
+            return self._loadBinary(content)
+
+        for line in content.decode("utf-8").splitlines():
             line = line.strip()
             if len(line) < 1 or line.startswith("#"):
                 continue
@@ -109,42 +177,138 @@ class TimeOfDay(DebugObject):
             if not (propData.startswith("[") and propData.endswith("]")):
                 self.warn("Invalid data:", propData)
 
-            propData = propData[1:-1].split(";")
-            propData = [prop.propType.convertString(i) for i in propData]
+            try:
+                propData = [prop.propType.convertString(i) for i in propData[1:-1].split(";")]
+            except ValueError as msg:
+                self.warn("Invalid data for", propId, ":", msg)
+                continue
 
-            if len(propData) != 8:
-                self.warn("Data count does not match for", propId)
+            if len(propData) < 2:
+                self.warn("At least 2 values are required for", propId)
                 continue
 
             prop.values = propData
             prop.recompute()
 
+        return True
+
+    def _loadBinary(self, content):
+        """ Internal method to load the binary format, see saveBinary """
+        offset = 0
+
+        def read(fmt):
+            values = struct.unpack_from(fmt, content, offset)
+            return values, offset + struct.calcsize(fmt)
+
+        (magic, version, tableSize, numProperties), offset = read("<4sIII")
+
+        if version != self.BinaryVersion:
+            self.error("Unsupported binary version:", version)
+            return False
+
+        for i in range(numProperties):
+            (idLength,), offset = read("<H")
+            propId = content[offset:offset + idLength].decode("utf-8")
+            offset += idLength
+
+            (numComponents, numValues), offset = read("<BH")
+            values, offset = read("<" + str(numValues * numComponents) + "f")
+            table, offset = read("<" + str(tableSize * numComponents) + "f")
+
+            if propId not in self.properties:
+                self.warn("Invalid ID:", propId)
+                continue
+
+            prop = self.properties[propId]
+
+            if numComponents != prop.numComponents:
+                self.warn("Component count does not match for", propId)
+                continue
+
+            prop.values = [prop.propType.fromComponents(values[j:j + numComponents])
+                           for j in range(0, len(values), numComponents)]
+
+            # Only use the baked table if it has the same resolution
+            if tableSize == DayProperty.TableSize:
+                prop.recomputeCurves()
+                prop.getTable()[:] = array("f", table)
+            else:
+                prop.recompute()
+
+        return True
+
     def save(self, dest):
         """ Writes the default property file to a given location """
         output = "# Autogenerated by Time of Day Manager\n"
         output += "# Do not edit! Your changes will be lost.\n"
 
-        for propid, prop in self.properties.items():
+        for propid in self.propertiesOrdered:
+            prop = self.properties[propid]
             output += propid + \
-                " [" + ";".join([str(i) for i in prop.values]) + "]\n"
+                      " [" + ";".join([prop.propType.convertToString(i) for i in prop.values]) + "]\n"
 
         with open(dest, "w") as handle:
             handle.write(output)
 
+    def saveBinary(self, dest):
+        """ Writes the properties including their baked tables to a binary
+        file, which can be loaded with load() without evaluating any curve """
+        output = struct.pack("<4sIII", self.BinaryMagic, self.BinaryVersion,
+                             DayProperty.TableSize, len(self.propertiesOrdered))
+
+        for propid in self.propertiesOrdered:
+            prop = self.properties[propid]
+            encodedId = propid.encode("utf-8")
+            values = []
+            for value in prop.values:
+                values += prop.propType.getComponents(value)
+
+            output += struct.pack("<H", len(encodedId)) + encodedId
+            output += struct.pack("<BH", prop.numComponents, len(prop.values))
+            output += struct.pack("<" + str(len(values)) + "f", *values)
+            output += struct.pack("<" + str(len(prop.getTable())) + "f", *prop.getTable())
+
+        with open(dest, "wb") as handle:
+            handle.write(output)
+
     def saveGlslInclude(self, dest):
         """ Writes the GLSL structure representation to a given location """
-        output = "// Autogenerated by Time of Day Manager\n"
+        output = "#pragma once\n"
+        output += "// Autogenerated by Time of Day Manager\n"
         output += "// Do not edit! Your changes will be lost.\n\n\n"
 
-        output += "struct TimeOfDay {\n\n"
+        for category, entries in self.bufferEntries.items():
+            output += "#define TIME_OF_DAY_" + category.upper() + "_SIZE " + str(len(entries)) + "\n"
 
-        for propid, prop in self.properties.items():
+        output += "\nstruct TimeOfDay {\n\n"
+
+        for propid in self.propertiesOrdered:
+            prop = self.properties[propid]
             name = propid.replace(".", "_")
             output += "    // " + prop.description + "\n"
             output += "    " + \
-                prop.propType.getGlslType() + " " + name + ";\n\n"
-
-        output += "};\n\n\n"
+                      prop.propType.getGlslType() + " " + name + ";\n\n"
+
+        output += "};\n\n"
+
+        # Unpacking function for the packed inputs, see bindTo
+        parameters = ["float " + category + "Data[TIME_OF_DAY_" + category.upper() + "_SIZE]"
+                      for category in self.bufferEntries]
+        output += "TimeOfDay unpackTimeOfDay(" + ", ".join(parameters) + ") {\n"
+        output += "    TimeOfDay tod;\n"
+
+        for propid in self.propertiesOrdered:
+            prop = self.properties[propid]
+            category, offset = self.layout[propid]
+            components = [category + "Data[" + str(offset + i) + "]"
+                          for i in range(prop.numComponents)]
+            value = components[0]
+            if len(components) > 1:
+                value = prop.propType.getGlslType() + "(" + ", ".join(components) + ")"
+            output += "    tod." + propid.replace(".", "_") + " = " + value + ";\n"
+
+        output += "    return tod;\n"
+        output += "}\n\n\n"
 
         with open(dest, "w") as handle:
             handle.write(output)
@@ -218,6 +218,15 @@ class TimeOfDayWindow(QtGui.QMainWindow, TimeOfDayWindowUI, DebugObject):
 
         self.currentProperty = None
 
+        # The sliders can only edit scalar properties with one value per slider
+        if prop.numComponents != 1 or len(prop.values) != len(self.sliders):
+            self.labelDescription.setText(self.labelDescription.text() +
+                "<br>This property can only be edited in the settings file")
+            self.widget.setProperty(prop)
+            self.curveBG.update()
+            self.applicationMovedSlider = False
+            return
+
         self.lblMaxVal.setText(str(prop.propType.maxVal))
         self.lblMinVal.setText(str(prop.propType.minVal))
         self.lblMidVal.setText(